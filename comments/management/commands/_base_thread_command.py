@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from comments.models import Comment
+from core.management.commands._base_benchmark_command import (
+    BenchmarkCommandBase
+)
+from posts.models import Post
+from redditors.models import User
+from subs.models import Sub
+
+class ThreadBenchmarkCommandBase(BenchmarkCommandBase):
+    """
+    Base for the benchmarks on big comment threads, creates them with
+    create_thread.
+    """
+    
+    def create_post(self, title):
+        self.poster = User.objects.get_or_create(
+            username='benchmark_commenter',
+            email='benchmark_commenter@example.com',
+        )[0]
+        subreddit = Sub.objects.get_or_create(title=title)[0]
+        return Post.objects.create(
+            poster=self.poster,
+            subreddit=subreddit,
+            title='benchmark_post'
+        )
+    
+    def create_thread(self, post, n_comments, n_roots, seed=0):
+        """
+        n_comments on post, the first n_roots are root comments and the
+        others are replies to a random earlier comment. Returns the pks
+        of the comments.
+        """
+        # bulk_create only sets the pks on postgres, so assign them
+        first_pk = (Comment.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        rng = random.Random(seed)
+        # Spread over three days but half way between whole hours, so the
+        # relative 'created' times don't change between the runs
+        now = timezone.now()
+        n_roots = max(min(n_roots, n_comments), 1)
+        comments = []
+        for i in range(n_comments):
+            if i < n_roots:
+                parent = None
+            else:
+                # Long reply chains would exceed the recursion limit of
+                # CommentTreeSerializer
+                parent = comments[rng.randrange(i)]
+            comments.append(Comment(
+                pk=first_pk + i,
+                post=post,
+                poster=self.poster,
+                parent=parent,
+                path='' if parent is None else parent.descendants_path,
+                level=0 if parent is None else parent.level + 1,
+                body='benchmark comment {}'.format(i),
+                created=now - timedelta(
+                    days=1,
+                    hours=rng.randrange(72),
+                    minutes=30
+                ),
+                score=rng.randrange(-10, 100),
+            ))
+        Comment.objects.bulk_create(comments, batch_size=500)
+        return [comment.pk for comment in comments]
@@ -0,0 +1,84 @@
+from rest_framework.renderers import JSONRenderer
+
+from comments.management.commands._base_thread_command import (
+    ThreadBenchmarkCommandBase
+)
+from comments.models import Comment
+from comments.serializers import CommentSerializer, CompactCommentSerializer
+
+class Command(ThreadBenchmarkCommandBase):
+    help = (
+        "Benchmark serializing all of the comments of a user, as on their "
+        "profile page, with the post of every comment nested in full by "
+        "CommentSerializer versus summed up by CompactCommentSerializer. "
+        "Nothing is left in the database."
+    )
+    
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--comments',
+            type=int,
+            default=5000,
+            help='Number of comments of the user'
+        )
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=100,
+            help='Number of posts, each in its own subreddit, they are on'
+        )
+    
+    def setup(self, **options):
+        n_posts = max(options['posts'], 1)
+        per_post, extra = divmod(options['comments'], n_posts)
+        for i in range(n_posts):
+            post = self.create_post('benchmark_comment_list_{}'.format(i))
+            self.create_thread(post, per_post + (i < extra), 10, seed=i)
+        self.stdout.write("{} comments on {} posts".format(
+            options['comments'],
+            n_posts
+        ))
+    
+    def run(self, **options):
+        renderer = JSONRenderer()
+        
+        def comments():
+            # A new queryset for every run, an evaluated one caches its rows
+            return Comment.objects.filter(
+                poster=self.poster
+            ).order_by('-created', '-pk')
+        
+        context = {'comment_vote_states': {}, 'post_vote_states': {}}
+        
+        def nested():
+            data = CommentSerializer(
+                comments(),
+                many=True,
+                context=context
+            ).data
+            return renderer.render(data)
+        
+        def nested_joined():
+            data = CommentSerializer(
+                comments().select_related('post__poster', 'post__subreddit'),
+                many=True,
+                context=context
+            ).data
+            return renderer.render(data)
+        
+        def compact():
+            data = CompactCommentSerializer(
+                CompactCommentSerializer.compact_queryset(comments()),
+                many=True,
+                context=context
+            ).data
+            return renderer.render(data)
+        
+        self.measure('CommentSerializer', nested)
+        self.measure('CommentSerializer, post joined', nested_joined)
+        self.measure('CompactCommentSerializer', compact)
+        self.stdout.write("{:.1f} KiB vs {:.1f} KiB of JSON".format(
+            len(nested()) / 1024,
+            len(compact()) / 1024
+        ))
@@ -0,0 +1,75 @@
+import random
+
+from comments.management.commands._base_thread_command import (
+    ThreadBenchmarkCommandBase
+)
+from comments.models import Comment
+
+class Command(ThreadBenchmarkCommandBase):
+    help = (
+        "Benchmark inserting replies into and reading the tree of comment "
+        "threads of different sizes. Nothing is left in the database."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated numbers of comments per thread'
+        )
+        parser.add_argument(
+            '--roots',
+            type=int,
+            default=10,
+            help='Number of root comments of each thread'
+        )
+        parser.add_argument(
+            '--inserts',
+            type=int,
+            default=50,
+            help='Number of replies inserted per timed run'
+        )
+
+    def run(self, **options):
+        rng = random.Random(0)
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            post = self.create_post('benchmark_comment_storage')
+            pks = self.create_thread(post, size, options['roots'])
+            parents = list(Comment.objects.filter(
+                pk__in=rng.sample(pks, min(options['inserts'], len(pks)))
+            ))
+            root = Comment.objects.get(pk=pks[0])
+            self.stdout.write("{} comments, {} of them roots".format(
+                size,
+                options['roots']
+            ))
+
+            def insert_replies():
+                for parent in parents:
+                    Comment.objects.create(
+                        post=post,
+                        poster=self.poster,
+                        parent=parent,
+                        body='benchmark reply'
+                    )
+
+            def read_tree():
+                return list(Comment.objects.filter(
+                    post=post
+                ).values_list('pk', 'parent_id'))
+
+            def read_subtree():
+                return list(root.get_descendants().values_list(
+                    'pk', 'parent_id'
+                ))
+
+            best, _, _ = self.measure(
+                '{} replies'.format(len(parents)),
+                insert_replies
+            )
+            self.stdout.write("  {:.2f} ms per insert".format(
+                best * 1000 / max(len(parents), 1)
+            ))
+            self.measure('read the tree', read_tree)
+            self.measure('read the subtree of a root', read_subtree)
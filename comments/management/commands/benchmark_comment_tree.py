@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from rest_framework.renderers import JSONRenderer
+
+from comments.management.commands._base_thread_command import (
+    ThreadBenchmarkCommandBase
+)
+from comments.models import Comment
+from comments.serializers import (
+    CommentTreeSerializer, comment_tree_fields, render_comment_tree
+)
+
+class Command(ThreadBenchmarkCommandBase):
+    help = (
+        "Benchmark rendering the comment tree of a large thread with the "
+        "recursive CommentTreeSerializer versus render_comment_tree. "
+        "Nothing is left in the database."
+    )
+    
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--comments',
+            type=int,
+            default=10000,
+            help='Number of comments in the thread'
+        )
+        parser.add_argument(
+            '--roots',
+            type=int,
+            default=100,
+            help='Number of root comments among them'
+        )
+    
+    def setup(self, **options):
+        self.post = self.create_post('benchmark_comment_tree')
+        self.create_thread(self.post, options['comments'], options['roots'])
+        self.stdout.write("{} comments, {} of them roots".format(
+            options['comments'],
+            options['roots']
+        ))
+    
+    def run(self, **options):
+        ordering = Comment.orderings['best']
+        renderer = JSONRenderer()
+        
+        def serializer():
+            comments = Comment.objects.filter(
+                post=self.post
+            ).select_related('poster').order_by(*ordering)
+            children = defaultdict(list)
+            for comment in comments:
+                children[comment.parent_id].append(comment)
+            data = CommentTreeSerializer(
+                children[None],
+                many=True,
+                context={'children': children, 'comment_vote_states': {}}
+            ).data
+            return renderer.render(data)
+        
+        def tree_renderer():
+            rows = Comment.objects.filter(
+                post=self.post
+            ).order_by(*ordering).values_list(*comment_tree_fields)
+            return renderer.render(render_comment_tree(rows))
+        
+        assert serializer() == tree_renderer()
+        self.measure('CommentTreeSerializer', serializer)
+        self.measure('render_comment_tree', tree_renderer)
@@ -0,0 +1,50 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:32
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_vote_counters(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    CommentVote = apps.get_model('votes', 'CommentVote')
+
+    def vote_count(vote_type):
+        votes = CommentVote.objects.filter(
+            comment=OuterRef('pk'),
+            vote_type=vote_type
+        ).order_by().values('comment').annotate(count=Count('pk'))
+        return Coalesce(Subquery(votes.values('count')), Value(0))
+
+    Comment.objects.update(
+        upvote_count=vote_count(1),
+        downvote_count=vote_count(-1),
+    )
+    Comment.objects.update(score=F('upvote_count') - F('downvote_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0013_auto_20190214_2350'),
+        ('votes', '0003_auto_20190129_1618'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:10
+"""
+Replace the mptt nested set of the comment trees by materialized paths.
+
+This migration is irreversible on purpose: it drops the lft, rght and
+tree_id columns and there is no reverse for fill_paths, rebuilding the
+nested sets would need mptt's tree manager. Back up the database before
+migrating if you may need to go back past 0015.
+"""
+
+from django.db import migrations, models
+from django.db.models import CharField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+import django.db.models.deletion
+
+
+def fill_paths(apps, schema_editor):
+    """
+    The path of every comment from its parent's, one UPDATE per level of
+    the trees. The level was kept up to date by mptt. There is no
+    reverse, see above.
+    """
+    Comment = apps.get_model('comments', 'Comment')
+    max_level = Comment.objects.aggregate(Max('level'))['level__max'] or 0
+    for level in range(1, max_level + 1):
+        parent_paths = Comment.objects.filter(
+            pk=OuterRef('parent_id')
+        ).annotate(
+            descendants_path=Concat(
+                'path',
+                Cast('pk', CharField()),
+                Value('/'),
+                output_field=CharField()
+            )
+        ).values('descendants_path')[:1]
+        Comment.objects.filter(level=level).update(
+            path=Subquery(parent_paths)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0014_comment_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(fill_paths),
+        migrations.RemoveField(
+            model_name='comment',
+            name='lft',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='rght',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='tree_id',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='level',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='comments.Comment'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0015_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comments_co_post_id_adad8a_idx'),
+        ),
+    ]
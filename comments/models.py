@@ -1,12 +1,26 @@
-from django.db import models
-from mptt.models import MPTTModel, TreeForeignKey
+from django.db import connection, models
+from django.db.models import Q
 from django_bleach.models import BleachField
 from django.utils import timezone
 
+from core.models import CounterFieldsMixin
 from redditors.models import User
 from posts.models import Post
 
-class Comment(MPTTModel):
+def path_startswith(prefix):
+    """
+    Q for the comments whose path starts with prefix, in a form that the
+    (post, path) index can serve. sqlite only uses an index for a range on
+    the (binary collated) column, not for LIKE. The paths are digits and
+    '/', so the ones starting with '12/45/' sort from it up to '12/450',
+    '0' being the character after '/'. Other databases may sort with a
+    locale that ignores the '/', so they get the prefix lookup.
+    """
+    if connection.vendor == 'sqlite':
+        return Q(path__gte=prefix, path__lt=prefix[:-1] + '0')
+    return Q(path__startswith=prefix)
+
+class Comment(CounterFieldsMixin, models.Model):
     # set default so that management command can overwrite
     created = models.DateTimeField(default=timezone.now)
     
@@ -25,18 +39,29 @@ class Comment(MPTTModel):
     
     body = BleachField()
     deleted = models.BooleanField(default=False)
+    
+    # Denormalized vote counters, kept up to date by CommentVote.save so
+    # that comment trees can be ordered without an aggregate query per
+    # comment. See the rebuild_comment_scores management command.
+    score = models.IntegerField(default=0)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+    # Saving a loaded comment doesn't write these back over the votes,
+    # see CounterFieldsMixin
+    counter_fields = ('score', 'upvote_count', 'downvote_count')
+    
+    # Map the api 'orderby' query parameter to the db ordering
+    orderings = {
+        'best': ('-score', 'created', 'pk'),
+        'new': ('-created', '-pk'),
+    }
 
     @property
     def upvotes(self):
         """
-        This doesn't need it's own db field. Can be calculated
-        based on the m2m through table CommentVote. This will
-        follow the reverse relation to CommentVote and sum votes.
-        They are +1 for upvote, -1 for downvote and 0 for no vote.
+        The net score, +1 for every upvote and -1 for every downvote.
         """
-        return self.votes.all().aggregate(models.Sum('vote_type')).get(
-            'vote_type__sum'
-        ) or 0
+        return self.score
     
     # Every user only gets one vote per comment
     voters = models.ManyToManyField(
@@ -45,7 +70,7 @@ class Comment(MPTTModel):
         related_name='voted_comments'
     )
     
-    parent = TreeForeignKey(
+    parent = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
         null=True,
@@ -53,5 +78,50 @@ class Comment(MPTTModel):
         related_name='children'
     )
     
+    # Materialized path of the comment's ancestors, e.g. '12/45/' for a
+    # reply to comment 45 which is a reply to the root comment 12, and ''
+    # for root comments. It is written once with the comment, so unlike a
+    # nested set an insert doesn't touch the other comments of the thread.
+    path = models.TextField(default='', editable=False)
+    # The number of ancestors, 0 for root comments
+    level = models.PositiveIntegerField(default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            # The subtree lookups, see path_startswith
+            models.Index(fields=['post', 'path']),
+        ]
+    
+    # Whether the comment is stored as (reddit) deleted
+    _saved_deleted = False
+    
     def __str__(self):
         return str("pk: {}, {}".format(self.pk, self.body[:20]))
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'deleted' in field_names:
+            instance._saved_deleted = instance.deleted
+        return instance
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.parent_id is not None:
+            self.path = self.parent.descendants_path
+            self.level = self.parent.level + 1
+        super().save(*args, **kwargs)
+        self._saved_deleted = self.deleted
+    
+    @property
+    def descendants_path(self):
+        """
+        The path that all of the comment's replies and their replies
+        start with.
+        """
+        return '{}{}/'.format(self.path, self.pk)
+    
+    def get_descendants(self):
+        return Comment.objects.filter(
+            path_startswith(self.descendants_path),
+            post_id=self.post_id
+        )
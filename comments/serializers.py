@@ -1,13 +1,13 @@
 from rest_framework import serializers, exceptions
 from collections import defaultdict
 from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from .models import Comment
 from redditors.models import User
-from redditors.serializers import UserSerializer
 from posts.models import Post
-from posts.serializers import PostSerializer
+from posts.serializers import PostSerializer, PostSummarySerializer
 from votes.models import CommentVote
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -51,7 +51,12 @@ class CommentSerializer(serializers.ModelSerializer):
         return value
     
     def get_vote_state(self, obj):
-        return 0
+        """
+        Only known when the view provides the authenticated user's votes
+        in the 'comment_vote_states' context map.
+        """
+        vote_states = self.context.get("comment_vote_states", {})
+        return vote_states.get(obj.pk, CommentVote.NO_VOTE)
         
     def get_created(self, obj):
         return naturaltime(obj.created)
@@ -105,16 +110,168 @@ class CommentSerializer(serializers.ModelSerializer):
         setattr(instance, 'poster', None)
         setattr(instance, 'body', 'deleted')
         setattr(instance, 'deleted', True)
-        instance.save()
+        instance.save(update_fields=['poster', 'body', 'deleted'])
         
         return instance
 
+# The columns CompactCommentSerializer reads
+compact_comment_fields = (
+    'created', 'poster', 'body', 'deleted', 'score', 'parent', 'post',
+    'post__title', 'post__subreddit', 'post__subreddit__title',
+)
+
+def wants_compact_comments(request):
+    """
+    Whether a list of comments should be serialized with
+    CompactCommentSerializer, asked for with the query parameter
+    compact=true.
+    """
+    if request is None:
+        return False
+    value = request.query_params.get('compact', '')
+    return value.lower() in ('1', 'true')
+
+class CompactCommentSerializer(CommentSerializer):
+    """
+    For lists of comments. Instead of the full PostSerializer the post of
+    each comment is only its pk, title and subreddit title. Serialize the
+    comments from compact_queryset so these come from a single join.
+    """
+    post = PostSummarySerializer(
+        read_only=True
+    )
+    
+    @staticmethod
+    def compact_queryset(queryset):
+        return queryset.select_related('post__subreddit').only(
+            *compact_comment_fields
+        )
+    
+    def get_created(self, obj):
+        if not hasattr(self, 'naturaltime'):
+            self.naturaltime = naturaltime_memo()
+        return self.naturaltime(obj.created)
+
+# The columns render_comment_tree reads, for values_list
+comment_tree_fields = (
+    'pk', 'post_id', 'body', 'score', 'parent_id', 'created', 'deleted',
+    'poster_id', 'poster__username', 'poster__karma',
+)
+
+def naturaltime_memo():
+    """
+    A naturaltime for rendering many comments at once. naturaltime is slow
+    but the text only depends on how many seconds, minutes or hours ago
+    something was (hours past the first day, the text then shows two units
+    of at least an hour), so it is reused for datetimes that fall into the
+    same bucket.
+    """
+    now = timezone.now()
+    strings = {}
+    
+    def memo(value):
+        seconds = int((now - value).total_seconds())
+        if seconds < 0:
+            return naturaltime(value)
+        if seconds < 60:
+            key = (seconds, 1, value.year)
+        elif seconds < 60 * 60:
+            key = (seconds // 60, 60, value.year)
+        else:
+            key = (seconds // 3600, 3600, value.year)
+        if key not in strings:
+            strings[key] = naturaltime(value)
+        return strings[key]
+    return memo
+
+def truncate_comment_tree(children, root, offset, limit, depth):
+    """
+    Pick the comments to show of a tree given as {parent pk: [child pks]}
+    in order, the roots under None. Starting at child offset of root the
+    tree is walked depth first until limit comments are picked, without
+    going deeper than depth levels below root (no limit for None).
+    
+    Returns the picked pks in order and {parent pk: (offset, count)} of the
+    children that were left out, the "more" stubs.
+    """
+    picked = []
+    more = {}
+    # (parent, index of the next child, depth of the children)
+    stack = [(root, offset, 1)]
+    while stack:
+        parent, index, level = stack.pop()
+        siblings = children.get(parent, ())
+        if index >= len(siblings):
+            continue
+        if len(picked) >= limit or (depth is not None and level > depth):
+            more[parent] = (index, len(siblings) - index)
+            continue
+        pk = siblings[index]
+        picked.append(pk)
+        stack.append((parent, index + 1, level))
+        stack.append((pk, 0, level + 1))
+    return picked, more
+
+def render_comment_tree(rows, vote_states=None, root=None, more=None):
+    """
+    The nested comment tree of a post, in the same shape as
+    CommentTreeSerializer, from rows of comment_tree_fields in the order
+    the siblings should be in. Every comment becomes a plain dict that is
+    appended to its parent's children, so the tree is built in one pass
+    over the rows without recursion or a serializer per comment.
+    
+    The children of root, by default the post, are returned. more maps
+    parent pks to a "more" stub that goes after their children.
+    """
+    if vote_states is None:
+        vote_states = {}
+    natural = naturaltime_memo()
+    nodes = {}
+    ordered = []
+    for (pk, post_pk, body, score, parent_pk, created, deleted,
+            poster_pk, username, karma) in rows:
+        node = {
+            'post': post_pk,
+            'body': body,
+            'upvotes': score,
+            'parent': parent_pk,
+            'created': natural(created),
+            'vote_state': vote_states.get(pk, CommentVote.NO_VOTE),
+            'deleted': deleted,
+            'pk': pk,
+            'poster': None if poster_pk is None else {
+                'pk': poster_pk,
+                'username': username,
+                'karma': karma,
+            },
+            'children': [],
+        }
+        nodes[pk] = node
+        ordered.append(node)
+    roots = []
+    for node in ordered:
+        if node['parent'] == root:
+            roots.append(node)
+        elif node['parent'] in nodes:
+            nodes[node['parent']]['children'].append(node)
+    for parent, stub in (more or {}).items():
+        if parent == root:
+            roots.append(stub)
+        elif parent in nodes:
+            nodes[parent]['children'].append(stub)
+    return roots
+
 class CommentPosterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('pk', 'username', 'karma')
     
 class CommentTreeSerializer(serializers.ModelSerializer):
+    """
+    Recursive serializer of a comment tree, one serializer for the children
+    of every comment. The comment tree view uses render_comment_tree
+    instead, this is the reference it is tested and benchmarked against.
+    """
     children = serializers.SerializerMethodField()
     poster = CommentPosterSerializer()
     created = serializers.SerializerMethodField()
@@ -142,14 +299,17 @@ class CommentTreeSerializer(serializers.ModelSerializer):
     def get_vote_state(self, obj):
         """
         If a user is authenticated, look up whether they have voted on this
-        comment before.
+        comment before. The view provides all of the user's votes on the
+        tree up front in the 'comment_vote_states' context map.
         """
+        vote_states = self.context.get("comment_vote_states")
+        if vote_states is not None:
+            return vote_states.get(obj.pk, CommentVote.NO_VOTE)
         request = self.context.get("request")
-        if request and request.user and request.user.is_authenticated:
-            try:
-                vote = obj.votes.all().get(user_id=request.user.pk)
-                return vote.vote_type
-            except CommentVote.DoesNotExist:
-                pass
+        if request and request.user:
+            return CommentVote.objects.vote_states(
+                request.user,
+                [obj.pk]
+            ).get(obj.pk, CommentVote.NO_VOTE)
         return 0
         
@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import F, Value, signals
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+from core.cache import invalidate
+from posts.models import Post
+from posts.signals import invalidate_listings
+from votes.signals import item_votes_changed
+from .models import Comment
+
+def post_activity_changed(comment, **updates):
+    """
+    Apply the updates to the denormalized comment activity of the post of
+    the comment, its detail and the listings it is in show them.
+    """
+    if comment.post_id is None:
+        return
+    Post.objects.filter(pk=comment.post_id).update(**updates)
+    invalidate('post', comment.post_id)
+    invalidate_listings(comment.post.subreddit_id)
+
+@receiver(signals.post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """
+    New, edited and (reddit) deleted comments change the cached comment
+    tree of their post, see PostCommentView. New and newly (reddit) deleted
+    ones also change the comment_count of the post.
+    """
+    invalidate('post_comments', instance.post_id)
+    if created:
+        post_activity_changed(
+            instance,
+            comment_count=F('comment_count') + 1,
+            last_comment_at=Greatest(
+                'last_comment_at',
+                Value(instance.created, output_field=models.DateTimeField())
+            )
+        )
+    elif instance.deleted and not instance._saved_deleted:
+        post_activity_changed(
+            instance,
+            comment_count=F('comment_count') - 1
+        )
+
+@receiver(signals.post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """
+    Comments are only removed from the db along with their post, or by an
+    admin, so the comment activity of the post is left as it is.
+    """
+    invalidate('post_comments', instance.post_id)
+
+@receiver(item_votes_changed, sender=Comment)
+def comment_votes_changed(sender, items, **kwargs):
+    invalidate('post_comments', *{comment.post_id for comment in items})
@@ -1,15 +1,27 @@
 from django.test import TestCase
-from django.db import transaction
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework import status
 from django.urls import reverse
 from django.core.management import call_command
+from django.core.cache import cache
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from collections import defaultdict
+from datetime import timedelta
 from io import StringIO
 
-from comments.models import Comment
+from comments.models import Comment, path_startswith
+from comments.serializers import (
+    CommentSerializer, CommentTreeSerializer, comment_tree_fields,
+    naturaltime_memo, render_comment_tree,
+)
 from posts.models import Post
 from redditors.models import User
 from subs.models import Sub
+from votes.models import CommentVote
 
 class CommentTest(APITestCase):
     """
@@ -80,6 +92,106 @@ class CommentTest(APITestCase):
         self.assertEqual(len(root_comment.children.all()), 1)
         self.assertIn(comment, root_comment.children.all())
         
+    def test_materialized_path(self):
+        """
+        A comment stores the path of its ancestors, inserting it doesn't
+        write to the other comments, only to the comment count of its post
+        """
+        root = self.create_comment(poster=self.user, post=self.post)
+        child = self.create_comment(
+            poster=self.user,
+            post=self.post,
+            parent=root
+        )
+        with self.assertNumQueries(2):
+            grandchild = self.create_comment(
+                poster=self.user,
+                post=self.post,
+                parent=child
+            )
+        other_root = self.create_comment(poster=self.user, post=self.post)
+        self.assertEqual(root.path, '')
+        self.assertEqual(child.path, '{}/'.format(root.pk))
+        self.assertEqual(
+            grandchild.path,
+            '{}/{}/'.format(root.pk, child.pk)
+        )
+        self.assertEqual(
+            [root.level, child.level, grandchild.level, other_root.level],
+            [0, 1, 2, 0]
+        )
+        self.assertEqual(
+            set(root.get_descendants()),
+            {child, grandchild}
+        )
+        self.assertEqual(list(child.get_descendants()), [grandchild])
+        self.assertFalse(other_root.get_descendants())
+        
+    def test_descendants_of_similar_paths(self):
+        """
+        The subtree of comment 45 doesn't include that of comment 450
+        """
+        for pk in (45, 450):
+            root = Comment.objects.create(pk=pk, post=self.post, body="root")
+            Comment.objects.create(post=self.post, parent=root, body="reply")
+        replies = Comment.objects.filter(parent_id=45)
+        self.assertEqual(
+            list(Comment.objects.get(pk=45).get_descendants()),
+            list(replies)
+        )
+        self.assertEqual(
+            Comment.objects.filter(path_startswith('45/')).count(),
+            1
+        )
+        
+    def test_save_keeps_concurrent_votes(self):
+        """
+        Editing or (reddit) deleting a comment loaded before a vote doesn't
+        write the old vote counters back
+        """
+        comment = self.create_comment(poster=self.user, post=self.post)
+        stale = Comment.objects.get(pk=comment.pk)
+        CommentVote.objects.cast(self.user, comment.pk, CommentVote.UPVOTE)
+        stale.body = "edited_body"
+        stale.save()
+        comment.refresh_from_db()
+        self.assertEqual(comment.body, "edited_body")
+        self.assertEqual(comment.score, 1)
+        self.assertEqual(comment.upvote_count, 1)
+        
+        stale = Comment.objects.get(pk=comment.pk)
+        CommentVote.objects.cast(self.user, comment.pk, CommentVote.DOWNVOTE)
+        CommentSerializer(stale).reddit_delete()
+        comment.refresh_from_db()
+        self.assertTrue(comment.deleted)
+        self.assertEqual(comment.score, -1)
+        self.assertEqual(comment.downvote_count, 1)
+        
+    def test_benchmark_comment_storage_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_comment_storage',
+            sizes='10,20',
+            roots=2,
+            inserts=3,
+            repeat=1,
+            stdout=out
+        )
+        self.assertIn("per insert", out.getvalue())
+        self.assertFalse(Comment.objects.exists())
+        
+    def test_benchmark_comment_list_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_comment_list',
+            comments=20,
+            posts=3,
+            repeat=1,
+            stdout=out
+        )
+        self.assertIn("CompactCommentSerializer", out.getvalue())
+        self.assertFalse(Comment.objects.exists())
+        
 class CommentViewTests(APITestCase):
     """
     Testing the various requests on comments
@@ -233,12 +345,12 @@ class CommentViewTests(APITestCase):
         self.assertContains(gc_response, gc_body, status_code=201)
         self.assertEqual(Comment.objects.count(), 3)
         self.assertEqual(
-            gc_response.data["post"],
-            response.data["post"]
+            gc_response.data["post"]["pk"],
+            response.data["post"]["pk"]
         )
         self.assertEqual(
-            gc_response.data["post"],
-            root_response.data["post"]
+            gc_response.data["post"]["pk"],
+            root_response.data["post"]["pk"]
         )
         self.assertEqual(
             gc_response.data["post"]["pk"],
@@ -258,6 +370,418 @@ class CommentViewTests(APITestCase):
         self.assertFalse(gc_comment.deleted)
         self.assertFalse(root_comment.deleted)
         
+    def test_post_comment_tree_ordering(self):
+        """
+        The comment tree of a post is ordered by the stored comment scores,
+        both the roots and every list of children
+        """
+        voter = User.objects.create(
+            username="test_voter",
+            email="test_voter@gmail.com",
+            password="testpassword"
+        )
+        roots = [
+            self.create_comment(poster=self.user, post=self.post)
+            for _ in range(3)
+        ]
+        children = [
+            self.create_comment(poster=self.user, post=self.post, parent=roots[0])
+            for _ in range(3)
+        ]
+        CommentVote.objects.create(comment=roots[2], user=voter, vote_type=1)
+        CommentVote.objects.create(comment=roots[0], user=voter, vote_type=-1)
+        CommentVote.objects.create(comment=children[1], user=voter, vote_type=1)
+        
+        response = self.client.get(
+            reverse('comment-post-list', kwargs={"post_pk": self.post.pk})
+        )
+        self.assertEqual(
+            [root["pk"] for root in response.data],
+            [roots[2].pk, roots[1].pk, roots[0].pk]
+        )
+        self.assertEqual(response.data[0]["upvotes"], 1)
+        self.assertEqual(
+            [child["pk"] for child in response.data[2]["children"]],
+            [children[1].pk, children[0].pk, children[2].pk]
+        )
+        
+        response = self.client.get(
+            reverse('comment-post-list', kwargs={"post_pk": self.post.pk}),
+            {"orderby": "new"}
+        )
+        self.assertEqual(
+            [root["pk"] for root in response.data],
+            [roots[2].pk, roots[1].pk, roots[0].pk]
+        )
+
+    def test_compact_comment_list(self):
+        """
+        With compact=true the post of each comment is summed up and the
+        list costs the same number of queries however long it is
+        """
+        other_post = Post.objects.create(
+            title="other_post_title",
+            subreddit=Sub.objects.create(title="other_subreddit"),
+            poster=self.user
+        )
+        
+        def get_compact_list():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    self.comment_list_url,
+                    {"compact": "true"}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response.data, len(queries.captured_queries)
+        
+        root = self.create_comment(poster=self.user, post=self.post)
+        self.create_comment(poster=self.user, post=other_post)
+        data, few = get_compact_list()
+        for post in (self.post, other_post, self.post):
+            self.create_comment(poster=self.user, post=post, parent=root)
+        data, many = get_compact_list()
+        self.assertEqual(many, few)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]["post"], {
+            "pk": self.post.pk,
+            "title": "test_post_title",
+            "subreddit_title": "test_subreddit",
+        })
+        self.assertEqual(data[0]["parent"], None)
+        self.assertEqual(data[0]["upvotes"], 0)
+        self.assertEqual(
+            data[1]["post"]["subreddit_title"],
+            "other_subreddit"
+        )
+        
+        # The full form is still the default
+        response = self.client.get(self.comment_list_url)
+        self.assertEqual(response.data[0]["post"]["body"], "test_post_body")
+        
+class PostCommentQueryTests(APITestCase):
+    """
+    The whole comment tree of a post is assembled from a fixed number of
+    queries no matter how big the thread is
+    """
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test_user1",
+            email="test1@gmail.com",
+            password="testpassword"
+        )
+        self.subreddit = Sub.objects.create(
+            title="test_subreddit",
+        )
+        self.post = Post.objects.create(
+            title="test_post_title",
+            body="test_post_body",
+            subreddit=self.subreddit,
+            poster=self.user
+        )
+        self.post_comments_url = reverse(
+            'comment-post-list',
+            kwargs={"post_pk": self.post.pk}
+        )
+        
+    def make_thread(self, n_roots, depth):
+        """
+        n_roots root comments each with a chain of depth replies
+        """
+        for _ in range(n_roots):
+            parent = None
+            for _ in range(depth + 1):
+                parent = Comment.objects.create(
+                    poster=self.user,
+                    post=self.post,
+                    parent=parent,
+                    body="thread comment"
+                )
+                
+    def count_nodes(self, trees):
+        return sum(1 + self.count_nodes(tree["children"]) for tree in trees)
+        
+    def test_query_count_independent_of_thread_size(self):
+        """
+        Small and large threads cost the same number of queries
+        """
+        self.make_thread(n_roots=2, depth=2)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.post_comments_url)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(self.count_nodes(response.data), 6)
+        
+        self.make_thread(n_roots=50, depth=4)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.post_comments_url)
+        self.assertEqual(len(response.data), 52)
+        self.assertEqual(self.count_nodes(response.data), 256)
+        
+    def test_vote_state_query_count(self):
+        """
+        An authenticated user's votes on the whole tree are looked up
+        with a single query
+        """
+        self.client.force_login(self.user)
+        self.make_thread(n_roots=2, depth=2)
+        with CaptureQueriesContext(connection) as small_thread:
+            self.client.get(self.post_comments_url)
+            
+        self.make_thread(n_roots=20, depth=4)
+        voted = Comment.objects.filter(post=self.post).last()
+        CommentVote.objects.create(comment=voted, user=self.user, vote_type=-1)
+        with CaptureQueriesContext(connection) as large_thread:
+            response = self.client.get(self.post_comments_url)
+        self.assertEqual(len(small_thread), len(large_thread))
+        
+        def vote_states(trees):
+            for tree in trees:
+                yield tree["pk"], tree["vote_state"]
+                yield from vote_states(tree["children"])
+        vote_states = dict(vote_states(response.data))
+        self.assertEqual(vote_states.pop(voted.pk), -1)
+        self.assertTrue(all(state == 0 for state in vote_states.values()))
+        
+    def test_nested_structure(self):
+        """
+        Children are nested under their parent with the poster included
+        """
+        self.make_thread(n_roots=1, depth=2)
+        response = self.client.get(self.post_comments_url)
+        root = response.data[0]
+        child = root["children"][0]
+        grandchild = child["children"][0]
+        self.assertIsNone(root["parent"])
+        self.assertEqual(child["parent"], root["pk"])
+        self.assertEqual(grandchild["parent"], child["pk"])
+        self.assertEqual(grandchild["children"], [])
+        self.assertEqual(grandchild["poster"]["username"], self.user.username)
+        
+class CommentTreeRendererTests(APITestCase):
+    """
+    render_comment_tree produces the same tree as CommentTreeSerializer
+    """
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test_user1",
+            email="test1@gmail.com",
+            password="testpassword"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        self.post = Post.objects.create(
+            title="test_post_title",
+            subreddit=self.subreddit,
+            poster=self.user
+        )
+        
+    def render(self):
+        rows = Comment.objects.filter(post=self.post).order_by(
+            *Comment.orderings['best']
+        ).values_list(*comment_tree_fields)
+        return render_comment_tree(rows)
+        
+    def test_same_as_serializer(self):
+        root = Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            body="root"
+        )
+        reply = Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            parent=root,
+            body="reply",
+            created=timezone.now() - timedelta(days=3, hours=5)
+        )
+        Comment.objects.create(
+            poster=None,
+            post=self.post,
+            parent=reply,
+            body="deleted",
+            deleted=True
+        )
+        Comment.objects.create(poster=self.user, post=self.post, body="root")
+        Comment.objects.filter(pk=root.pk).update(score=3)
+        
+        comments = Comment.objects.filter(post=self.post).select_related(
+            'poster'
+        ).order_by(*Comment.orderings['best'])
+        children = defaultdict(list)
+        for comment in comments:
+            children[comment.parent_id].append(comment)
+        serializer = CommentTreeSerializer(
+            children[None],
+            many=True,
+            context={'children': children, 'comment_vote_states': {}}
+        )
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(self.render()),
+            renderer.render(serializer.data)
+        )
+        
+    def test_deep_thread(self):
+        """
+        The tree is built without recursion
+        """
+        parent = None
+        for _ in range(1500):
+            parent = Comment.objects.create(
+                poster=self.user,
+                post=self.post,
+                parent=parent,
+                body="reply"
+            )
+        node, depth = self.render()[0], 1
+        while node["children"]:
+            node, depth = node["children"][0], depth + 1
+        self.assertEqual(depth, 1500)
+        
+    def test_naturaltime_memo(self):
+        natural = naturaltime_memo()
+        now = timezone.now()
+        for delta in (
+            timedelta(seconds=5), timedelta(minutes=3, seconds=5),
+            timedelta(hours=5, minutes=2), timedelta(days=1, minutes=3),
+            timedelta(days=40, hours=3), timedelta(days=800),
+            timedelta(minutes=-10),
+        ):
+            self.assertEqual(natural(now - delta), naturaltime(now - delta))
+            
+    def test_benchmark_comment_tree_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_comment_tree',
+            comments=20,
+            roots=3,
+            repeat=1,
+            stdout=out
+        )
+        self.assertIn("render_comment_tree", out.getvalue())
+        self.assertFalse(Sub.objects.filter(title='benchmark_comment_tree'))
+        
+class TruncatedCommentTreeTests(APITestCase):
+    """
+    The limit and depth parameters cut the tree off with "more" stubs
+    that are expanded with the more endpoint
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_user1",
+            email="test1@gmail.com",
+            password="testpassword"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        self.post = Post.objects.create(
+            title="test_post_title",
+            subreddit=self.subreddit,
+            poster=self.user
+        )
+        self.roots = [self.comment() for _ in range(3)]
+        self.children = [self.comment(self.roots[0]) for _ in range(2)]
+        self.grandchild = self.comment(self.children[0])
+        self.post_comments_url = reverse(
+            'comment-post-list',
+            kwargs={"post_pk": self.post.pk}
+        )
+        self.more_url = reverse('comment-more')
+        
+    def comment(self, parent=None):
+        return Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            parent=parent,
+            body="comment"
+        )
+        
+    def shape(self, trees):
+        """
+        The pks of the tree as nested lists, stubs as (parent, count)
+        """
+        return [
+            (tree["parent"], tree["count"]) if tree.get("more")
+            else [tree["pk"], self.shape(tree["children"])]
+            for tree in trees
+        ]
+        
+    def test_whole_tree_by_default(self):
+        response = self.client.get(self.post_comments_url)
+        self.assertEqual(self.shape(response.data), [
+            [self.roots[0].pk, [
+                [self.children[0].pk, [[self.grandchild.pk, []]]],
+                [self.children[1].pk, []],
+            ]],
+            [self.roots[1].pk, []],
+            [self.roots[2].pk, []],
+        ])
+        
+    def test_limit(self):
+        response = self.client.get(self.post_comments_url, {"limit": 3})
+        self.assertEqual(self.shape(response.data), [
+            [self.roots[0].pk, [
+                [self.children[0].pk, [[self.grandchild.pk, []]]],
+                (self.roots[0].pk, 1),
+            ]],
+            (None, 2),
+        ])
+        
+    def test_depth(self):
+        response = self.client.get(self.post_comments_url, {"depth": 1})
+        self.assertEqual(self.shape(response.data), [
+            [self.roots[0].pk, [(self.roots[0].pk, 2)]],
+            [self.roots[1].pk, []],
+            [self.roots[2].pk, []],
+        ])
+        
+    def test_expand_more(self):
+        response = self.client.get(self.post_comments_url, {"limit": 3})
+        root_stub = response.data[1]
+        child_stub = response.data[0]["children"][1]
+        
+        response = self.client.get(self.more_url, {"token": root_stub["token"]})
+        self.assertEqual(
+            self.shape(response.data),
+            [[self.roots[1].pk, []], [self.roots[2].pk, []]]
+        )
+        response = self.client.get(
+            self.more_url,
+            {"token": root_stub["token"], "limit": 1}
+        )
+        self.assertEqual(
+            self.shape(response.data),
+            [[self.roots[1].pk, []], (None, 1)]
+        )
+        response = self.client.get(
+            self.more_url,
+            {"token": child_stub["token"]}
+        )
+        self.assertEqual(self.shape(response.data), [[self.children[1].pk, []]])
+        
+    def test_expand_invalidated(self):
+        response = self.client.get(self.post_comments_url, {"depth": 1})
+        token = response.data[0]["children"][0]["token"]
+        self.client.get(self.more_url, {"token": token})
+        reply = self.comment(self.roots[0])
+        response = self.client.get(self.more_url, {"token": token})
+        self.assertEqual(response.data[-1]["pk"], reply.pk)
+        
+    def test_vote_state_with_stubs(self):
+        CommentVote.objects.cast(self.user, self.roots[0].pk, 1)
+        self.client.force_login(self.user)
+        response = self.client.get(self.post_comments_url, {"limit": 1})
+        self.assertEqual(response.data[0]["vote_state"], 1)
+        self.assertTrue(response.data[1]["more"])
+        
+    def test_invalid_token(self):
+        response = self.client.get(self.post_comments_url, {"limit": 3})
+        post_pk, parent_pk, _offset = response.data[1]["token"].split(":")
+        negative = "{}:{}:-1".format(post_pk, parent_pk)
+        for params in ({}, {"token": "nonsense"}, {"token": negative}):
+            response = self.client.get(self.more_url, params)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
         
 class SeedCommentsSubredditCommandTests(TestCase):
     def setUp(self):
@@ -290,3 +814,112 @@ class SeedCommentsSubredditCommandTests(TestCase):
         self.assertEqual(Comment.objects.count(), 15)
         for comment in Comment.objects.all():
             self.assertIsNotNone(comment.post)
+
+class PostCommentCacheTests(APITestCase):
+    """
+    The comment tree of a post is cached for every reader and invalidated
+    by comment and vote writes
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_user1",
+            email="test1@gmail.com",
+            password="testpassword"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        self.post = Post.objects.create(
+            title="test_post_title",
+            subreddit=self.subreddit,
+            poster=self.user
+        )
+        self.root = Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            body="root comment"
+        )
+        self.reply = Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            parent=self.root,
+            body="reply"
+        )
+        self.post_comments_url = reverse(
+            'comment-post-list',
+            kwargs={"post_pk": self.post.pk}
+        )
+        
+    def test_anonymous_hit_without_queries(self):
+        first = self.client.get(self.post_comments_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.post_comments_url)
+        self.assertEqual(first.data, second.data)
+        
+    def test_cached_per_ordering(self):
+        """
+        Only the ordering selects the cached tree
+        """
+        self.client.get(self.post_comments_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.post_comments_url, {"orderby": "best"})
+            self.client.get(
+                self.post_comments_url,
+                {"orderby": "unknown", "username": "test_user1"}
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.post_comments_url,
+                {"orderby": "new"}
+            )
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(response.data[0]["pk"], self.root.pk)
+        
+    def test_edit_invalidates(self):
+        self.client.get(self.post_comments_url)
+        self.client.force_login(self.user)
+        response = self.client.patch(
+            reverse('comment-detail', kwargs={"pk": self.reply.pk}),
+            {"body": "edited reply"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.logout()
+        response = self.client.get(self.post_comments_url)
+        self.assertEqual(
+            response.data[0]["children"][0]["body"],
+            "edited reply"
+        )
+        
+    def test_vote_state_merged_into_tree(self):
+        CommentVote.objects.cast(self.user, self.reply.pk, CommentVote.UPVOTE)
+        self.client.get(self.post_comments_url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.post_comments_url)
+        reply = response.data[0]["children"][0]
+        self.assertEqual(reply["vote_state"], 1)
+        self.assertEqual(response.data[0]["vote_state"], 0)
+        
+    def test_writes_invalidate(self):
+        self.client.get(self.post_comments_url)
+        CommentVote.objects.cast(self.user, self.reply.pk, CommentVote.UPVOTE)
+        response = self.client.get(self.post_comments_url)
+        self.assertEqual(response.data[0]["children"][0]["upvotes"], 1)
+        
+        Comment.objects.create(
+            poster=self.user,
+            post=self.post,
+            parent=self.reply,
+            body="new reply"
+        )
+        response = self.client.get(self.post_comments_url)
+        self.assertEqual(
+            response.data[0]["children"][0]["children"][0]["body"],
+            "new reply"
+        )
+        
+        self.client.force_login(self.user)
+        self.client.delete(reverse(
+            'comment-detail',
+            kwargs={"pk": self.root.pk}
+        ))
+        response = self.client.get(self.post_comments_url)
+        self.assertTrue(response.data[0]["deleted"])
@@ -5,6 +5,7 @@ from . import views
 
 urlpatterns = [
     path('', views.CommentListView.as_view(), name='comment-list'),
+    path('more/', views.MoreCommentsView.as_view(), name='comment-more'),
     path('<int:pk>/', views.CommentDetailView.as_view(), name='comment-detail'),
     path('post/<int:post_pk>/', views.PostCommentView.as_view(), name='comment-post-list'),
 ]
@@ -4,15 +4,32 @@ from rest_framework.generics import (
 )
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework import status
+from rest_framework import status, exceptions
+from django.utils.translation import gettext as _
 from collections import defaultdict
-from django.utils import timezone
 
-from .models import Comment
+from .models import Comment, path_startswith
 from .serializers import (
-    CommentSerializer, CommentTreeSerializer,
+    CommentSerializer, CommentTreeSerializer, CompactCommentSerializer,
+    comment_tree_fields, render_comment_tree, truncate_comment_tree,
+    wants_compact_comments,
 )
+from core.mixins import CachedResponseMixin, StreamingListMixin
 from redditors.models import User
+from votes.models import CommentVote, chunked
+
+def positive_int(value, default, maximum=None):
+    """
+    A query parameter as a positive int of at most maximum, or default
+    if it isn't one.
+    """
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    if value < 1:
+        return default
+    return value if maximum is None else min(value, maximum)
 
 class CommentDetailView(RetrieveUpdateDestroyAPIView):
     """
@@ -31,15 +48,37 @@ class CommentDetailView(RetrieveUpdateDestroyAPIView):
         serializer.reddit_delete()
         return Response(serializer.data)
 
-class CommentListView(ListCreateAPIView):
+class CommentListView(StreamingListMixin, ListCreateAPIView):
     """
     Standard list and create view for comments. The user must
-    be authenticated to post/create a comment.
+    be authenticated to post/create a comment. The list can be
+    streamed, see StreamingListMixin. With compact=true the post of
+    each comment is only summed up, see CompactCommentSerializer.
     """
-    queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     
+    def is_compact(self):
+        return (
+            self.request.method == 'GET'
+            and wants_compact_comments(self.request)
+        )
+    
+    def get_serializer_class(self):
+        if self.is_compact():
+            return CompactCommentSerializer
+        return CommentSerializer
+    
+    def get_queryset(self):
+        if self.is_compact():
+            return CompactCommentSerializer.compact_queryset(
+                Comment.objects.all()
+            )
+        return Comment.objects.select_related(
+            'post__poster',
+            'post__subreddit'
+        )
+    
     def perform_create(self, serializer):
         """
         You need to be authenticated to post a comment.
@@ -48,62 +87,198 @@ class CommentListView(ListCreateAPIView):
         serializer.save(poster=self.request.user)
         
 
-class PostCommentView(ListAPIView):
+class PostCommentView(CachedResponseMixin, ListAPIView):
     """
-    For a particular post returns all comments, paginated and in a nested,
-    hierarchichal fashion.
+    For a particular post returns all comments in a nested,
+    hierarchichal fashion. The serialized tree is cached for every reader
+    per (post, orderby, limit, depth) and invalidated by bumping the post's
+    version when one of its comments is created, edited, deleted or voted
+    on, see comments.signals and CachedResponseMixin.
+    
+    With a limit or depth only that many comments, at most max_limit, down
+    to that many levels are returned. The children that are left out are
+    replaced by a stub, {"more": true, "parent": ..., "count": ...,
+    "token": ...}, after the shown siblings. The token expands the stub
+    with MoreCommentsView.
     
-    query parameter: orderby, username
+    query parameter: orderby (or sort), limit, depth
     """
     queryset = Comment.objects.all()
     serializer_class = CommentTreeSerializer
+    vote_model = CommentVote
+    vote_states_context_key = 'comment_vote_states'
+    max_limit = 500
+    
+    def get_post_pk(self):
+        return self.kwargs['post_pk']
     
-    def get_sort_function(self):
+    def get_tree_root(self):
         """
-        Given an api sort description (e.g. 'popular' or 'new') return
-        a key function that can be used in sort based on the acutal
-        model attributes nomenclature.
+        (parent pk, offset) of the first comment in the response, the
+        parent is None for the root comments of the post.
         """
-        sort_functions = {
-            'best': (lambda comment: -comment.upvotes),
-            'new' : (lambda comment: (timezone.now() - comment.created)),
-        }
-        api_sort_key = self.request.query_params.get('orderby', 'best')
-        return sort_functions.get(api_sort_key, sort_functions['best'])
+        return None, 0
+    
+    def get_tree_limits(self):
+        """
+        (limit, depth) of the tree, or None for the whole tree.
+        """
+        params = self.request.query_params
+        if 'limit' not in params and 'depth' not in params:
+            return None
+        return (
+            positive_int(params.get('limit'), self.max_limit, self.max_limit),
+            positive_int(params.get('depth'), None),
+        )
+    
+    def get_cache_dependencies(self):
+        return [('post_comments', self.get_post_pk())]
+    
+    def get_cache_key_params(self):
+        """
+        The tree only depends on these, so any requests that agree on them
+        share the cached tree.
+        """
+        return (
+            self.get_sort_key(),
+            self.get_tree_root(),
+            self.get_tree_limits(),
+        )
+    
+    def get_voted_items(self, data):
+        """
+        Every comment in the tree, walked without recursion since the
+        threads can be deep.
+        """
+        items = []
+        stack = list(data)
+        while stack:
+            comment = stack.pop()
+            if comment.get('more'):
+                continue
+            items.append(comment)
+            stack.extend(comment['children'])
+        return items
+    
+    def get_sort_key(self):
+        params = self.request.query_params
+        api_sort_key = params.get('sort', params.get('orderby', 'best'))
+        return api_sort_key if api_sort_key in Comment.orderings else 'best'
+    
+    def get_ordering(self):
+        """
+        Given an api sort description (e.g. 'best' or 'new') return
+        the db ordering, see Comment.orderings.
+        """
+        return Comment.orderings[self.get_sort_key()]
     
     def get_queryset(self):
         """
-        Narrows queryset to root comments on this post. Also
-        orders depending on get parameter, default to popular.
+        Every comment on this post, roots and children, in a single query.
+        Also orders depending on get parameter, default to best.
+        """
+        return Comment.objects.filter(
+            post__pk=self.get_post_pk()
+        ).order_by(*self.get_ordering())
+    
+    def more_stub(self, parent_pk, offset, count):
+        return {
+            'more': True,
+            'parent': parent_pk,
+            'count': count,
+            'token': '{}:{}:{}'.format(
+                self.get_post_pk(),
+                '' if parent_pk is None else parent_pk,
+                offset
+            ),
+        }
+    
+    def truncated_tree(self, comments, limit, depth, vote_states):
         """
-        post_pk = self.kwargs.get('post_pk', None)
-        queryset = Comment.objects.filter(
-            post__pk=post_pk,
-            parent=None
+        Only the (pk, parent) of the comments below the root, down to one
+        level past depth, are read to pick the comments to show. The full
+        rows are read for those alone.
+        """
+        root, offset = self.get_tree_root()
+        root_level = -1
+        if root is not None:
+            parent = comments.filter(pk=root).only('path', 'level').first()
+            if parent is None:
+                return []
+            comments = comments.filter(
+                path_startswith(parent.descendants_path)
+            )
+            root_level = parent.level
+        if depth is not None:
+            comments = comments.filter(level__lte=root_level + depth + 1)
+        children = defaultdict(list)
+        for pk, parent_pk in comments.values_list('pk', 'parent_id'):
+            children[parent_pk].append(pk)
+        picked, more = truncate_comment_tree(
+            children, root, offset, limit, depth
+        )
+        rows = {}
+        for chunk in chunked(picked, self.max_limit):
+            for row in Comment.objects.filter(pk__in=chunk).values_list(
+                *comment_tree_fields
+            ):
+                rows[row[0]] = row
+        return render_comment_tree(
+            [rows[pk] for pk in picked if pk in rows],
+            vote_states,
+            root=root,
+            more={
+                parent_pk: self.more_stub(parent_pk, *position)
+                for parent_pk, position in more.items()
+            }
         )
-        # Can't use .order_by() in get_queryset because upvotes is not a db field
-        # so wait until now to sort since we have a list
-        # can't use inplace .sort either
-        queryset = sorted(queryset,key=self.get_sort_function())
-        return queryset
     
     def list(self, request, *args, **kwargs):
-        root_comments = self.filter_queryset(self.get_queryset())
-        comment_trees = []
-        for root in root_comments:
-            comment_trees.append(self.make_tree(root))
-        return Response(comment_trees)
-            
-    def make_tree(self, root):
-        children = defaultdict(list)
-        for comment in root.get_descendants():
-            children[comment.parent_id].append(comment)
-            
-        # For every parent, order the children according to the get parameter
-        for child_list in children.values():
-            child_list.sort(key=self.get_sort_function())
-        
-        context = self.get_serializer_context()
-        context['children'] = children
-        serializer = self.get_serializer_class()(root, context=context)
-        return serializer.data
+        comments = self.filter_queryset(self.get_queryset())
+        vote_states = self.get_serializer_context().get('comment_vote_states')
+        limits = self.get_tree_limits()
+        if limits is not None:
+            return Response(self.truncated_tree(comments, *limits, vote_states))
+        return Response(render_comment_tree(
+            comments.values_list(*comment_tree_fields),
+            vote_states
+        ))
+
+class MoreCommentsView(PostCommentView):
+    """
+    Expands the "more" stub of a truncated comment tree, returns the
+    children that were left out, truncated in the same way. Pass the same
+    orderby as for the tree.
+    
+    query parameter: token, orderby (or sort), limit, depth
+    """
+    def get_token(self):
+        """
+        The (post pk, parent pk, offset) of the token, see more_stub.
+        """
+        try:
+            post_pk, parent_pk, offset = (
+                self.request.query_params['token'].split(':')
+            )
+            token = (
+                int(post_pk),
+                int(parent_pk) if parent_pk else None,
+                int(offset),
+            )
+            # A negative offset would slice from the end of the siblings
+            if token[2] < 0:
+                raise ValueError(offset)
+            return token
+        except (KeyError, ValueError):
+            raise exceptions.ValidationError(
+                {'token': _("A token of a 'more' stub is required")}
+            )
+    
+    def get_post_pk(self):
+        return self.get_token()[0]
+    
+    def get_tree_root(self):
+        return self.get_token()[1:]
+    
+    def get_tree_limits(self):
+        return super().get_tree_limits() or (self.max_limit, None)
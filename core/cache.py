@@ -0,0 +1,77 @@
+"""
+Helpers for cache entries that go stale together.
+
+Rather than tracking and deleting every key that depends on, say, a
+subreddit, the dependent keys embed a version number for it and a write
+just bumps that version. The old entries are never read again and age out
+of the cache on their own.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(namespace, pk):
+    return 'version:{}:{}'.format(namespace, pk)
+
+
+def new_version():
+    """
+    A version counter that went missing (evicted or a cold cache) restarts
+    from the clock instead of 1, so it can't land on a version that
+    entries still in the cache were stored under.
+    """
+    return int(time.time() * 1000)
+
+
+def get_many_versions(dependencies):
+    """
+    Return the versions of a list of (namespace, pk) in one cache round
+    trip.
+    """
+    keys = [version_key(namespace, pk) for namespace, pk in dependencies]
+    found = cache.get_many(keys)
+    missing = {
+        key: new_version() for key in keys if key not in found
+    }
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def get_versions(namespace, pks):
+    """
+    Return {pk: version} for every pk in one cache round trip.
+    """
+    pks = list(pks)
+    return dict(zip(
+        pks,
+        get_many_versions([(namespace, pk) for pk in pks])
+    ))
+
+
+def get_version(namespace, pk):
+    return get_versions(namespace, [pk])[pk]
+
+
+def bump_version(namespace, pk):
+    """
+    Invalidate every entry stored under the current version of pk.
+    """
+    try:
+        cache.incr(version_key(namespace, pk))
+    except ValueError:
+        cache.set(version_key(namespace, pk), new_version(), timeout=None)
+
+
+def invalidate(namespace, *pks):
+    """
+    Bump the versions of pks now and again once the current transaction
+    commits, so that a response computed from the db before the commit
+    can't be cached under the new version.
+    """
+    for pk in pks:
+        bump_version(namespace, pk)
+    transaction.on_commit(lambda: [bump_version(namespace, pk) for pk in pks])
@@ -0,0 +1,73 @@
+import abc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+class BenchmarkCommandBase(BaseCommand, metaclass=abc.ABCMeta):
+    """
+    Base for the benchmark commands. setup() creates the benchmark data
+    and run() measures the cases with self.measure(). Everything happens
+    in a transaction that is rolled back, so the benchmarks can be run
+    against a real database without leaving anything behind.
+    """
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of timed runs of each case, the best is reported'
+        )
+    
+    def setup(self, **options):
+        pass
+    
+    @abc.abstractmethod
+    def run(self, **options):
+        """
+        Measure the cases, see measure.
+        """
+    
+    def measure(self, label, fn):
+        """
+        Report the best wall time, the number of queries and the peak
+        memory allocated by python of calling fn.
+        """
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        
+        queries = []
+        
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        
+        with connection.execute_wrapper(count_queries):
+            tracemalloc.start()
+            try:
+                fn()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        
+        self.stdout.write(
+            "{:<40} {:>9.1f} ms {:>6} queries {:>9.1f} KiB peak".format(
+                label,
+                min(timings) * 1000,
+                len(queries),
+                peak / 1024
+            )
+        )
+        return min(timings), len(queries), peak
+    
+    def handle(self, *args, **options):
+        self.repeat = max(options['repeat'], 1)
+        with transaction.atomic():
+            self.setup(**options)
+            self.run(**options)
+            transaction.set_rollback(True)
@@ -0,0 +1,158 @@
+import hashlib
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .cache import get_many_versions
+
+class CachedResponseMixin:
+    """
+    For read views whose response is the same for every reader apart from
+    the vote_state of the items in it. The body is built without any vote
+    state, cached for RESPONSE_CACHE_SECONDS and shared by all readers, so
+    a cache hit for an anonymous reader doesn't touch the db. For an
+    authenticated reader their vote states are looked up with one query
+    and merged into a copy of the body.
+
+    The cache key embeds the versions of the (namespace, pk) pairs returned
+    by get_cache_dependencies, see core.cache. The writes that change a
+    response bump those versions, see e.g. posts.signals.
+    """
+    vote_model = None
+    vote_states_context_key = None
+
+    def get_cache_dependencies(self):
+        return []
+
+    def is_cacheable(self):
+        return True
+
+    def get_voted_items(self, data):
+        """
+        The dicts of the votable items in the response data, each with a
+        'pk' and a 'vote_state'.
+        """
+        return []
+
+    def get_cache_key_params(self):
+        """
+        What the response depends on besides the url kwargs, by default
+        the query parameters and the host, which is part of the links in
+        paginated responses. The host is read from the header as it is,
+        get_host would reject hosts outside ALLOWED_HOSTS even for a cache
+        hit, e.g. for the requests of the benchmark commands.
+        """
+        params = sorted(
+            (key, sorted(values))
+            for key, values in self.request.query_params.lists()
+        )
+        return (params, self.request.META.get('HTTP_HOST', ''))
+
+    def get_response_cache_key(self):
+        parts = (
+            self.__class__.__name__,
+            sorted(self.kwargs.items()),
+            self.get_cache_key_params(),
+            get_many_versions(self.get_cache_dependencies()),
+        )
+        return 'response:{}:{}'.format(
+            self.__class__.__name__,
+            hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+        )
+
+    def get_serializer_context(self):
+        """
+        On reads the serializer leaves every vote_state at NO_VOTE, they
+        are filled in by merge_vote_states.
+        """
+        context = super().get_serializer_context()
+        if self.request.method == 'GET' and self.vote_states_context_key:
+            context[self.vote_states_context_key] = {}
+        return context
+
+    def merge_vote_states(self, data):
+        user = self.request.user
+        if not (user and user.is_authenticated):
+            return
+        items = self.get_voted_items(data)
+        if not items:
+            return
+        vote_states = self.vote_model.objects.vote_states(
+            user,
+            [item['pk'] for item in items]
+        )
+        for item in items:
+            item['vote_state'] = vote_states.get(
+                item['pk'],
+                self.vote_model.NO_VOTE
+            )
+
+    def get(self, request, *args, **kwargs):
+        cacheable = self.is_cacheable()
+        data = None
+        if cacheable:
+            key = self.get_response_cache_key()
+            data = cache.get(key)
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            if cacheable:
+                cache.set(key, data, timeout=settings.RESPONSE_CACHE_SECONDS)
+        self.merge_vote_states(data)
+        return Response(data)
+
+class StreamingListMixin:
+    """
+    For list views over tables that can get large. With the query
+    parameter stream=true the whole (filtered) list is returned without
+    pagination as a JSON array that is encoded and sent while the rows are
+    read, stream_chunk_size at a time with queryset.iterator. Only one
+    chunk is held in memory and the first bytes go out right away.
+    
+    Every chunk is serialized with get_serializer(chunk, many=True), so
+    e.g. VoteStateMixin looks up the vote states once per chunk. The
+    iterator ignores prefetch_related, so the queryset's prefetches are
+    done for every chunk instead.
+    """
+    stream_chunk_size = 500
+    stream_query_param = 'stream'
+    
+    def is_streaming(self):
+        value = self.request.query_params.get(self.stream_query_param, '')
+        return value.lower() in ('1', 'true')
+    
+    def list(self, request, *args, **kwargs):
+        if not self.is_streaming():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self.stream_json(queryset),
+            content_type='application/json'
+        )
+    
+    def stream_json(self, queryset):
+        """
+        The rendered chunks are arrays, their brackets are dropped and
+        the items joined into a single array.
+        """
+        renderer = JSONRenderer()
+        prefetches = queryset._prefetch_related_lookups
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        separator = b'['
+        while True:
+            chunk = list(islice(rows, self.stream_chunk_size))
+            if not chunk:
+                break
+            if prefetches:
+                prefetch_related_objects(chunk, *prefetches)
+            data = self.get_serializer(chunk, many=True).data
+            yield separator + renderer.render(data)[1:-1]
+            separator = b','
+        yield b'[]' if separator == b'[' else b']'
@@ -0,0 +1,20 @@
+class CounterFieldsMixin:
+    """
+    For models with denormalized counters that are only ever written with
+    queryset updates, e.g. F('score') + 1 for a vote. A full save of an
+    instance loaded before such an update would write the old counts back
+    over it, so saving an existing row leaves the counter_fields out
+    unless update_fields names them.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
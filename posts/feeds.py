@@ -0,0 +1,151 @@
+"""
+The 'home' feed of an authenticated user.
+
+Every subreddit keeps a cached, ranked list of its top HOME_FEED_SIZE posts
+for each ordering. A user's home feed is a k-way merge of the lists of
+their subscribed subreddits, which is cached per user as well, so building
+the feed never sorts all the posts of the subscribed subreddits.
+
+The lists of a subreddit are invalidated when a post is created in or
+deleted from it, and otherwise expire after HOME_FEED_CACHE_SECONDS so that
+votes can move posts in and out of the top. A user's cached merge is
+invalidated when they subscribe or unsubscribe, or when the list of any of
+their subreddits is. See posts.signals and redditors.signals.
+"""
+import hashlib
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.cache import get_version, get_versions, bump_version
+from subs.models import Sub
+from .models import Post
+
+
+def sort_value(value, descending):
+    """
+    Map a value of an ordering field onto one that sorts ascending, so
+    that the ranked lists of different subreddits can be merged.
+    """
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return -value if descending else value
+
+
+def subreddit_feed_key(sub_pk, sort_key, window_key, version):
+    return 'subreddit_feed:{}:{}:{}:{}'.format(
+        sub_pk, sort_key, window_key, version
+    )
+
+
+def build_subreddit_feed(sub_pk, sort_key, window_key):
+    """
+    The top HOME_FEED_SIZE posts of a subreddit as a list of
+    (sort tuple, pk), in order.
+    """
+    ordering = Post.orderings[sort_key]
+    fields = [field.lstrip('-') for field in ordering]
+    posts = Post.objects_no_votes.filter(subreddit_id=sub_pk)
+    window = Post.top_windows.get(window_key)
+    if sort_key == 'top' and window is not None:
+        posts = posts.filter(created__gte=timezone.now() - window)
+    rows = posts.order_by(*ordering).values_list(*fields)
+    return [
+        (
+            tuple(
+                sort_value(value, field.startswith('-'))
+                for value, field in zip(row, ordering)
+            ),
+            row[fields.index('pk')]
+        )
+        for row in rows[:settings.HOME_FEED_SIZE]
+    ]
+
+
+def subreddit_feeds(sub_versions, sort_key, window_key):
+    """
+    The ranked lists of several subreddits, given as {sub_pk: version},
+    fetched from the cache in one round trip and built for any that are
+    missing.
+    """
+    keys = {
+        subreddit_feed_key(sub_pk, sort_key, window_key, version): sub_pk
+        for sub_pk, version in sub_versions.items()
+    }
+    feeds = cache.get_many(keys.keys())
+    missing = {}
+    for key, sub_pk in keys.items():
+        if key not in feeds:
+            missing[key] = build_subreddit_feed(sub_pk, sort_key, window_key)
+    if missing:
+        cache.set_many(missing, timeout=settings.HOME_FEED_CACHE_SECONDS)
+        feeds.update(missing)
+    return feeds.values()
+
+
+def subscribed_subreddits(user):
+    key = 'home_subs:{}:{}'.format(user.pk, get_version('home', user.pk))
+    sub_pks = cache.get(key)
+    if sub_pks is None:
+        sub_pks = list(user.subs.values_list('pk', flat=True))
+        cache.set(key, sub_pks, timeout=None)
+    return sub_pks
+
+
+def home_feed(user, sort_key, window_key=None):
+    """
+    Return the pks of the first HOME_FEED_SIZE posts of the home feed
+    of user, in order.
+    """
+    if sort_key != 'top':
+        window_key = None
+    sub_versions = get_versions('subreddit', subscribed_subreddits(user))
+    digest = hashlib.md5(
+        repr(sorted(sub_versions.items())).encode('utf-8')
+    ).hexdigest()
+    key = 'home_feed:{}:{}:{}:{}:{}'.format(
+        user.pk, get_version('home', user.pk), sort_key, window_key, digest
+    )
+    pks = cache.get(key)
+    if pks is None:
+        merged = heapq.merge(
+            *subreddit_feeds(sub_versions, sort_key, window_key)
+        )
+        pks = [pk for _, pk in islice(merged, settings.HOME_FEED_SIZE)]
+        cache.set(key, pks, timeout=settings.HOME_FEED_CACHE_SECONDS)
+    return pks
+
+
+def invalidate_subreddit(sub_pk):
+    bump_version('subreddit', sub_pk)
+
+
+def invalidate_home(user_pk):
+    bump_version('home', user_pk)
+
+
+def subreddit_pk_key(title):
+    # Titles can hold characters that aren't valid in memcached keys
+    return 'subreddit_pk:{}'.format(
+        hashlib.md5(title.encode('utf-8')).hexdigest()
+    )
+
+
+def subreddit_pk(title):
+    """
+    The pk of the subreddit with title, or None, cached until the
+    subreddit is saved or deleted.
+    """
+    key = subreddit_pk_key(title)
+    pk = cache.get(key)
+    if pk is None:
+        pk = Sub.objects.filter(title=title).values_list(
+            'pk', flat=True
+        ).first()
+        if pk is not None:
+            cache.set(key, pk, timeout=None)
+    return pk
@@ -0,0 +1,97 @@
+from django.db.models import Sum
+from rest_framework.test import APIRequestFactory
+
+from core.management.commands._base_benchmark_command import (
+    BenchmarkCommandBase
+)
+from posts.models import Post
+from posts.views import SubPostListView
+from redditors.models import User
+from subs.models import Sub
+from votes.models import PostVote
+
+class Command(BenchmarkCommandBase):
+    help = (
+        "Benchmark listing a page of posts with many votes each, reading "
+        "the score from the counters versus prefetching every vote. "
+        "Nothing is left in the database."
+    )
+    
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=20,
+            help='Number of posts in the listing'
+        )
+        parser.add_argument(
+            '--votes',
+            type=int,
+            default=10000,
+            help='Number of votes on each post'
+        )
+    
+    def setup(self, **options):
+        self.subreddit = Sub.objects.create(title='benchmark_post_list')
+        User.objects.bulk_create([
+            User(
+                username='benchmark_voter_{}'.format(i),
+                email='benchmark_voter_{}@example.com'.format(i),
+            )
+            for i in range(options['votes'])
+        ])
+        # bulk_create only sets the pks on postgres
+        voter_pks = list(User.objects.filter(
+            username__startswith='benchmark_voter_'
+        ).values_list('pk', flat=True))
+        for post_num in range(options['posts']):
+            post = Post.objects.create(
+                poster_id=voter_pks[0],
+                subreddit=self.subreddit,
+                title='benchmark_post_{}'.format(post_num)
+            )
+            PostVote.objects.bulk_create([
+                PostVote(
+                    post=post,
+                    user_id=voter_pk,
+                    vote_type=(
+                        PostVote.UPVOTE if i % 3 else PostVote.DOWNVOTE
+                    )
+                )
+                for i, voter_pk in enumerate(voter_pks)
+            ], batch_size=500)
+        # bulk_create skips the counters that PostVote.save maintains
+        scores = PostVote.objects.filter(
+            post__subreddit=self.subreddit
+        ).values('post').annotate(score=Sum('vote_type'))
+        for row in scores:
+            Post.objects.filter(pk=row['post']).update(score=row['score'])
+        self.stdout.write("{} posts with {} votes each".format(
+            options['posts'],
+            options['votes']
+        ))
+    
+    def run(self, **options):
+        factory = APIRequestFactory()
+        view = SubPostListView.as_view()
+        
+        def list_view():
+            request = factory.get('/', {'limit': options['posts']})
+            view(request, sub_title=self.subreddit.title).render()
+            
+        def counters():
+            posts = Post.objects.filter(subreddit=self.subreddit)
+            return [post.upvotes for post in posts]
+        
+        def prefetched_votes():
+            posts = Post.objects_with_votes.filter(subreddit=self.subreddit)
+            return [
+                sum(vote.vote_type for vote in post.votes.all())
+                for post in posts
+            ]
+        
+        assert sorted(counters()) == sorted(prefetched_votes())
+        self.measure('list view', list_view)
+        self.measure('scores from counters', counters)
+        self.measure('scores from prefetched votes', prefetched_votes)
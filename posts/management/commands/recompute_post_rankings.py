@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+
+from posts.models import Post
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored 'hot' and 'controversial' rankings of posts "
+        "from their vote counters"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            '-d',
+            type=int,
+            default=None,
+            help=('Only recompute posts created in the last DAYS days, '
+                'defaults to every post')
+        )
+        parser.add_argument(
+            '--chunk_size',
+            type=int,
+            default=1000,
+            help='Number of posts updated per transaction'
+        )
+        
+    def handle(self, *args, **options):
+        posts = Post.objects_no_votes.order_by('pk')
+        if options['days'] is not None:
+            posts = posts.filter(
+                created__gte=timezone.now() - timedelta(days=options['days'])
+            )
+        pks = list(posts.values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        for start in range(0, len(pks), chunk_size):
+            with transaction.atomic():
+                Post.refresh_rankings(pks[start:start + chunk_size])
+        self.stdout.write("Recomputed the rankings of {} posts".format(
+            len(pks)
+        ))
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import time
+
+from posts.models import PopularPost
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the materialized feed of the 'popular' pseudo-subreddit. "
+        "Run it once, e.g. from cron, or keep it running with --loop"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep refreshing the feed every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            '-i',
+            type=int,
+            default=None,
+            help=('Seconds between refreshes with --loop, defaults to '
+                'settings.POPULAR_FEED_REFRESH_SECONDS')
+        )
+        
+    def refresh(self):
+        removed, added, updated = PopularPost.objects.refresh()
+        self.stdout.write((
+            "Refreshed the popular feed: {} removed, {} added, {} updated"
+        ).format(removed, added, updated))
+        
+    def handle(self, *args, **options):
+        interval = (
+            options['interval'] or settings.POPULAR_FEED_REFRESH_SECONDS
+        )
+        self.refresh()
+        while options['loop']:
+            time.sleep(interval)
+            self.refresh()
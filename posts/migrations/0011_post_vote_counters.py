@@ -0,0 +1,66 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:31
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_vote_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostVote = apps.get_model('votes', 'PostVote')
+
+    def vote_count(vote_type):
+        votes = PostVote.objects.filter(
+            post=OuterRef('pk'),
+            vote_type=vote_type
+        ).order_by().values('post').annotate(count=Count('pk'))
+        return Coalesce(Subquery(votes.values('count')), Value(0))
+
+    Post.objects.update(
+        upvote_count=vote_count(1),
+        downvote_count=vote_count(-1),
+    )
+    Post.objects.update(score=F('upvote_count') - F('downvote_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_auto_20190214_2350'),
+        ('votes', '0003_auto_20190129_1618'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-score', 'created'], name='posts_post_subredd_3b6f2b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-created'], name='posts_post_subredd_98721c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-score', 'created'], name='posts_post_score_525367_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created'], name='posts_post_created_26d9b3_idx'),
+        ),
+        migrations.RunPython(fill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+from utilities import reddit_orderby
+
+
+def fill_rankings(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.only(
+        'created', 'score', 'upvote_count', 'downvote_count'
+    )
+    for post in posts.iterator():
+        Post.objects.filter(pk=post.pk).update(
+            hot=reddit_orderby.hot(post.score, post.created),
+            controversy=reddit_orderby.controversy(
+                post.upvote_count,
+                post.downvote_count
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='controversy',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-hot'], name='posts_post_subredd_1d4e6c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-controversy', 'created'], name='posts_post_subredd_080fc4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot'], name='posts_post_hot_b82912_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-controversy', 'created'], name='posts_post_controv_92bbec_idx'),
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popular_entry', serialize=False, to='posts.Post')),
+                ('rank', models.PositiveIntegerField(db_index=True)),
+                ('score', models.IntegerField()),
+                ('refreshed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
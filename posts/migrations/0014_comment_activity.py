@@ -0,0 +1,75 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:16
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_activity(apps, schema_editor):
+    """
+    Count the comments that aren't (reddit) deleted and find the latest
+    one of every post, in one UPDATE.
+    """
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('comments', 'Comment')
+    comments = Comment.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post')
+    Post.objects.update(
+        comment_count=Coalesce(
+            Subquery(
+                comments.annotate(
+                    count=Count('pk', filter=Q(deleted=False))
+                ).values('count'),
+                output_field=IntegerField()
+            ),
+            0
+        ),
+        last_comment_at=Coalesce(
+            Subquery(comments.annotate(latest=Max('created')).values('latest')),
+            'created'
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_popularpost'),
+        ('comments', '0015_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_comment_activity, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-last_comment_at'], name='posts_post_subredd_c5b0a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['subreddit', '-comment_count', 'created'], name='posts_post_subredd_c192a4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-last_comment_at'], name='posts_post_last_co_7a015f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-comment_count', 'created'], name='posts_post_comment_ed2757_idx'),
+        ),
+    ]
@@ -1,23 +1,49 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
 from django_bleach.models import BleachField
 from django.core.validators import MaxLengthValidator
 from django.utils.translation import gettext as _
 from django.utils import timezone
+from datetime import timedelta
 
+from core.cache import invalidate
+from core.models import CounterFieldsMixin
 from redditors.models import User
 from subs.models import Sub
+from utilities import reddit_orderby
 
 class PostVotesManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().prefetch_related('votes')
 
-class Post(models.Model):
-    # This is the default because it is not very common to
-    # not need to calculate upvotes and that will result in
-    # a lot of db hits if we don't prefetch the votes
-    objects = PostVotesManager()
+class PostQuerySet(models.QuerySet):
+    # Everything PostSerializer reads, plus the rankings so that the
+    # cursor of any ordering can be read off the last post of a page.
+    feed_fields = (
+        'created', 'updated', 'title', 'body', 'score', 'hot', 'controversy',
+        'comment_count', 'last_comment_at', 'subreddit', 'subreddit__title',
+        'poster', 'poster__username',
+    )
     
+    def feed(self):
+        """
+        The posts ready to be serialized by PostSerializer, the poster and
+        subreddit are joined in so a page of posts is a single query.
+        """
+        return self.select_related('poster', 'subreddit').only(
+            *self.feed_fields
+        )
+
+class Post(CounterFieldsMixin, models.Model):
+    # The score is read from the stored counters so the default manager
+    # doesn't need the vote rows. objects_no_votes is the same plain
+    # manager, it just makes it explicit that no votes are loaded.
+    # Use objects_with_votes only when the individual votes are needed.
+    # Listings serialize objects.feed(), see PostQuerySet.
+    objects = PostQuerySet.as_manager()
     objects_no_votes = models.Manager()
+    objects_with_votes = PostVotesManager()
     
     # set default so that management command can overwrite
     created = models.DateTimeField(default=timezone.now)
@@ -49,15 +75,234 @@ class Post(models.Model):
         related_name='voted_posts',
     )
     
+    # Denormalized vote counters. These are kept up to date by
+    # PostVote.save so that listings can be ordered and limited in the db
+    # rather than summing every vote in python. If they ever drift use the
+    # rebuild_post_scores management command.
+    score = models.IntegerField(default=0)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+    
+    # Precomputed rankings, see utilities/reddit_orderby.py. Set on save
+    # and updated with the counters on every vote.
+    hot = models.FloatField(default=0)
+    controversy = models.FloatField(default=0)
+    ranking_fields = ('hot', 'controversy')
+    
+    # Denormalized comment activity, kept up to date by comments.signals.
+    # comment_count doesn't include reddit-deleted comments. last_comment_at
+    # is the time of the latest comment, or of the post itself until it
+    # gets one, so that it can order the 'active' listing.
+    comment_count = models.PositiveIntegerField(default=0)
+    last_comment_at = models.DateTimeField()
+    
+    # Updated in the db by the votes and comments, saving a loaded post
+    # doesn't write them back, see CounterFieldsMixin
+    counter_fields = (
+        'score', 'upvote_count', 'downvote_count', 'hot', 'controversy',
+        'comment_count', 'last_comment_at',
+    )
+    
     # Reverse FK to Comment related_name="comments"
     
+    # Map the api 'orderby' query parameter to the db ordering. Every
+    # ordering ends in a unique column so that pagination is stable.
+    orderings = {
+        'best': ('-score', 'created', 'pk'),
+        'hot': ('-hot', '-pk'),
+        'new': ('-created', '-pk'),
+        'top': ('-score', 'created', 'pk'),
+        'controversial': ('-controversy', 'created', 'pk'),
+        'active': ('-last_comment_at', '-pk'),
+        'comments': ('-comment_count', 'created', 'pk'),
+    }
+    
+    # The time windows for 'top', the api 't' query parameter
+    top_windows = {
+        'hour': timedelta(hours=1),
+        'day': timedelta(days=1),
+        'week': timedelta(weeks=1),
+        'month': timedelta(days=30),
+        'year': timedelta(days=365),
+        'all': None,
+    }
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['subreddit', '-score', 'created']),
+            models.Index(fields=['subreddit', '-created']),
+            models.Index(fields=['subreddit', '-hot']),
+            models.Index(fields=['subreddit', '-controversy', 'created']),
+            models.Index(fields=['-score', 'created']),
+            models.Index(fields=['-created']),
+            models.Index(fields=['-hot']),
+            models.Index(fields=['-controversy', 'created']),
+            models.Index(fields=['subreddit', '-last_comment_at']),
+            models.Index(fields=['subreddit', '-comment_count', 'created']),
+            models.Index(fields=['-last_comment_at']),
+            models.Index(fields=['-comment_count', 'created']),
+        ]
+    
+    @classmethod
+    def refresh_rankings(cls, pks, *fields):
+        """
+        Recompute the stored rankings of the posts in pks from their
+        current counters, e.g. after a vote. Returns the posts, loaded
+        with the counters and any extra fields.
+        """
+        posts = list(cls._base_manager.filter(pk__in=pks).only(
+            'created', 'score', 'upvote_count', 'downvote_count', *fields
+        ))
+        for post in posts:
+            post.set_rankings()
+            cls._base_manager.filter(pk=post.pk).update(**{
+                field: getattr(post, field) for field in cls.ranking_fields
+            })
+        return posts
+    
+    def set_rankings(self):
+        self.hot = reddit_orderby.hot(self.score, self.created)
+        self.controversy = reddit_orderby.controversy(
+            self.upvote_count,
+            self.downvote_count
+        )
+    
+    def save(self, *args, **kwargs):
+        self.set_rankings()
+        if self.last_comment_at is None:
+            self.last_comment_at = self.created
+        super().save(*args, **kwargs)
+    
     @property
     def upvotes(self):
         """
-        Just add up the prefetched votes vote_types.
+        The net score, upvotes minus downvotes.
         """
-        return sum([vote.vote_type for vote in self.votes.all()])
-    
+        return self.score
     
     def __str__(self):
         return str(self.title)
+
+class PopularPostManager(models.Manager):
+    # The time of the last refresh is kept in the cache rather than read
+    # off the rows, so an empty feed isn't stale forever. Requests that
+    # find the feed stale take refresh_lock_key with cache.add so that
+    # only one of them refreshes it.
+    refreshed_key = 'popular_feed_refreshed'
+    refresh_lock_key = 'popular_feed_refresh_lock'
+    
+    def is_stale(self):
+        """
+        The feed needs a refresh if it was never refreshed, as far as the
+        cache knows, or last refreshed more than
+        settings.POPULAR_FEED_REFRESH_SECONDS ago.
+        """
+        last_refreshed = cache.get(self.refreshed_key)
+        if last_refreshed is None:
+            return True
+        max_age = timedelta(seconds=settings.POPULAR_FEED_REFRESH_SECONDS)
+        return last_refreshed < timezone.now() - max_age
+    
+    def refresh_if_stale(self):
+        """
+        For the requests that read the feed. Refresh it if it is stale
+        and no one else is refreshing it already, otherwise the current
+        feed is served. Returns what refresh does, or None if it didn't
+        refresh.
+        """
+        if not self.is_stale():
+            return None
+        lock_timeout = settings.POPULAR_FEED_REFRESH_SECONDS
+        if not cache.add(self.refresh_lock_key, True, timeout=lock_timeout):
+            return None
+        try:
+            return self.refresh()
+        except IntegrityError:
+            # A concurrent refresh, e.g. the refresh_popular_feed command
+            # or a request in another process, added the same entries
+            return None
+        finally:
+            cache.delete(self.refresh_lock_key)
+    
+    def get_candidates(self):
+        """
+        (pk, score) of the posts that belong in the feed right now,
+        hottest first.
+        """
+        posts = Post.objects_no_votes.filter(
+            score__gt=settings.POPULAR_FEED_MIN_SCORE
+        )
+        if settings.POPULAR_FEED_WINDOW_DAYS is not None:
+            posts = posts.filter(created__gte=(
+                timezone.now()
+                - timedelta(days=settings.POPULAR_FEED_WINDOW_DAYS)
+            ))
+        return posts.order_by(*Post.orderings['hot']).values_list(
+            'pk', 'score'
+        )[:settings.POPULAR_FEED_SIZE]
+    
+    def refresh(self):
+        """
+        Bring the feed up to date incrementally, only the entries that
+        left, joined or changed rank or score are written.
+        Returns the number of (removed, added, updated) entries.
+        """
+        now = timezone.now()
+        candidates = {
+            pk: (rank, score)
+            for rank, (pk, score) in enumerate(self.get_candidates())
+        }
+        with transaction.atomic():
+            existing = {
+                post_id: (rank, score)
+                for post_id, rank, score in self.select_for_update()
+                .values_list('post_id', 'rank', 'score')
+            }
+            removed = existing.keys() - candidates.keys()
+            added = candidates.keys() - existing.keys()
+            updated = [
+                pk for pk in candidates.keys() & existing.keys()
+                if candidates[pk] != existing[pk]
+            ]
+            self.filter(post_id__in=removed).delete()
+            for pk in updated:
+                rank, score = candidates[pk]
+                self.filter(post_id=pk).update(rank=rank, score=score)
+            self.bulk_create([
+                self.model(
+                    post_id=pk,
+                    rank=candidates[pk][0],
+                    score=candidates[pk][1],
+                    refreshed=now
+                )
+                for pk in added
+            ])
+            self.update(refreshed=now)
+            if removed or added or updated:
+                # the cached pages of the pseudo subreddits
+                invalidate('listing', 'all')
+        cache.set(self.refreshed_key, now, timeout=None)
+        return len(removed), len(added), len(updated)
+        
+class PopularPost(models.Model):
+    """
+    A post in the materialized feed of the 'popular' pseudo-subreddit.
+    Rebuilt in the background by the refresh_popular_feed management
+    command so that reading the feed doesn't have to rank every post on
+    the site.
+    """
+    objects = PopularPostManager()
+    
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popular_entry'
+    )
+    # position in the feed, 0 is the hottest post
+    rank = models.PositiveIntegerField(db_index=True)
+    score = models.IntegerField()
+    refreshed = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return "Popular post {}: {}".format(self.rank, self.post_id)
@@ -1,10 +1,190 @@
-from rest_framework.pagination import LimitOffsetPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    LimitOffsetPagination, CursorPagination, Cursor
+)
 from rest_framework.utils.urls import replace_query_param
 
 class PostListPagination(LimitOffsetPagination):
     default_limit = 20
     max_limit = 100
-    
+
     # def get_next_link(self):
     #     url = super().get_next_link()
     #     return replace_query_param(url, self.limit.qu)
+
+class PostCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the ordering of the queryset, e.g.
+    ('-score', 'created', 'pk'). Unlike the DRF CursorPagination, which
+    seeks on the first ordering field and then uses an offset, the cursor
+    stores the value of every ordering field of the last item so each page
+    is a single index seek no matter how deep it is. Pages also stay stable
+    while votes change the scores of posts around them. The ordering must
+    end in a unique field.
+
+    The cursors are opaque to the consumer, just follow the 'next' and
+    'previous' links. A cursor records the ordering it was made for and is
+    only valid for that ordering, its position is checked against the
+    types of the ordering fields.
+    """
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-created', '-pk')
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(queryset.query.order_by) or self.ordering
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(
+            field[1:] if field.startswith('-') else '-' + field
+            for field in ordering
+        )
+
+    def seek_filter(self, position, reverse):
+        """
+        Everything after position in the ordering, or before it for a
+        reversed cursor, i.e. a lexicographic comparison on the
+        ordering fields.
+        """
+        seek = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            seek |= Q(**equal, **{'{}__{}'.format(name, lookup): value})
+            equal[name] = value
+        return seek
+
+    def coerce_position(self, position):
+        """
+        The position of a decoded cursor as values of the ordering fields
+        of the model, raises NotFound if any of them isn't one.
+        """
+        values = []
+        for field_name, value in zip(self.ordering, position):
+            name = field_name.lstrip('-')
+            try:
+                if name == 'pk':
+                    field = self.model._meta.pk
+                else:
+                    field = self.model._meta.get_field(name)
+                if value is None or isinstance(value, (bool, list, dict)):
+                    raise ValueError(value)
+                value = field.to_python(value)
+            except (FieldDoesNotExist, TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if isinstance(value, datetime) and timezone.is_naive(value):
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self.seek_filter(self.cursor.position, reverse)
+            )
+        if reverse:
+            queryset = queryset.order_by(*self.reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        # Grab one extra to find out if there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=self.get_position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=True,
+            position=self.get_position(self.page[0])
+        ))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            )
+            reverse = bool(tokens['r'])
+            ordering = tokens['o']
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # e.g. a 'hot' cursor reused with orderby=new
+        if ordering != list(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(
+            offset=0,
+            reverse=reverse,
+            position=self.coerce_position(position)
+        )
+
+    def encode_cursor(self, cursor):
+        tokens = {
+            'r': int(cursor.reverse),
+            'o': list(self.ordering),
+            'p': cursor.position,
+        }
+        encoded = urlsafe_b64encode(
+            json.dumps(tokens, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            encoded
+        )
@@ -22,13 +22,16 @@ class PostSerializer(serializers.ModelSerializer):
     poster_username = serializers.SerializerMethodField()
     created = serializers.SerializerMethodField()
     updated = serializers.SerializerMethodField()
+    last_comment_at = serializers.SerializerMethodField()
     vote_state = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = ('pk', 'created', 'updated', 'title', 'body',
                   'upvotes', 'subreddit', 'poster', 'subreddit_title',
-                  'poster_username', 'vote_state')
+                  'poster_username', 'vote_state', 'comment_count',
+                  'last_comment_at')
+        read_only_fields = ('comment_count',)
                 
     def validate(self, data):
         """
@@ -65,17 +68,37 @@ class PostSerializer(serializers.ModelSerializer):
     def get_updated(self, obj):
         return naturaltime(obj.updated)
 
+    def get_last_comment_at(self, obj):
+        return naturaltime(obj.last_comment_at)
+
     def get_vote_state(self, obj):
         """
         If a user is authenticated, look up whether they have voted on this post
-        before.
+        before. List views provide all of the user's votes up front in the
+        'post_vote_states' context map, otherwise query for this post.
         """
+        vote_states = self.context.get("post_vote_states")
+        if vote_states is not None:
+            return vote_states.get(obj.pk, PostVote.NO_VOTE)
         request = self.context.get("request")
-        if request and request.user and request.user.is_authenticated:
-            try:
-                vote = obj.votes.all().get(user_id=request.user.pk)
-                return vote.vote_type
-            except PostVote.DoesNotExist:
-                pass
+        if request and request.user:
+            return PostVote.objects.vote_states(
+                request.user,
+                [obj.pk]
+            ).get(obj.pk, PostVote.NO_VOTE)
         return 0
         
+
+class PostSummarySerializer(serializers.ModelSerializer):
+    """
+    Just enough of a post to link to it, e.g. from a comment in a list of
+    comments. Join in the subreddit, see CompactCommentSerializer.
+    """
+    subreddit_title = serializers.CharField(
+        source='subreddit.title',
+        read_only=True
+    )
+    
+    class Meta:
+        model = Post
+        fields = ('pk', 'title', 'subreddit_title')
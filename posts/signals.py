@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.db.models import signals
+from django.dispatch import receiver
+
+from core.cache import invalidate
+from subs.models import Sub
+from votes.signals import item_votes_changed
+from .feeds import invalidate_subreddit, subreddit_pk_key
+from .models import Post
+
+def invalidate_listings(*sub_pks):
+    """
+    The cached post listings, see SubPostListView, of the subreddits and
+    of the pseudo subreddits, which show posts from all of them.
+    """
+    invalidate('listing', 'all', *sub_pks)
+
+@receiver(signals.post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    """
+    A new post may belong in the cached home feeds of the subreddit.
+    Any change to a post is seen in the cached listings and detail.
+    """
+    if created:
+        invalidate_subreddit(instance.subreddit_id)
+        # in case of a reused pk
+        invalidate('post_comments', instance.pk)
+    invalidate('post', instance.pk)
+    invalidate_listings(instance.subreddit_id)
+
+@receiver(signals.post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate_subreddit(instance.subreddit_id)
+    invalidate('post', instance.pk)
+    invalidate_listings(instance.subreddit_id)
+
+@receiver(item_votes_changed, sender=Post)
+def post_votes_changed(sender, items, **kwargs):
+    invalidate('post', *[post.pk for post in items])
+    invalidate_listings(*{post.subreddit_id for post in items})
+
+@receiver(signals.pre_save, sender=Sub)
+def sub_renamed(sender, instance, **kwargs):
+    """
+    Forget the cached pk of a renamed subreddit's old title.
+    """
+    if instance.pk is not None:
+        cache.delete_many([
+            subreddit_pk_key(title)
+            for title in Sub.objects.filter(
+                pk=instance.pk
+            ).values_list('title', flat=True)
+        ])
+
+@receiver(signals.post_save, sender=Sub)
+@receiver(signals.post_delete, sender=Sub)
+def sub_changed(sender, instance, **kwargs):
+    cache.delete(subreddit_pk_key(instance.title))
+    invalidate_listings(instance.pk)
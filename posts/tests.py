@@ -2,12 +2,40 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework.test import APIClient
+from rest_framework.utils.urls import replace_query_param
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import override_settings
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import json
+import warnings
+from base64 import urlsafe_b64encode
 
 from redditors.models import User, UserSubMembership
 from subs.models import Sub
-from posts.models import Post
+from posts.feeds import subreddit_pk_key
+from posts.models import Post, PopularPost
+from posts.serializers import PostSerializer
+from posts.views import PostListView
 from votes.models import PostVote
+from comments.models import Comment
+from comments.serializers import CommentSerializer
+from utilities import reddit_orderby
+
+def encode_cursor(ordering, position, reverse=False):
+    """
+    A cursor as PostCursorPagination encodes them
+    """
+    tokens = {'r': int(reverse), 'o': ordering, 'p': position}
+    encoded = urlsafe_b64encode(json.dumps(tokens).encode('utf-8'))
+    return encoded.decode('ascii')
 
 class PostTest(APITestCase):
     """
@@ -66,6 +94,54 @@ class PostTest(APITestCase):
                 body = "test body"
             )
             post.full_clean()
+            
+    def test_upvotes_without_vote_rows(self):
+        """
+        The default manager reads the score from the counters, the
+        votes are only loaded through objects_with_votes
+        """
+        post = Post.objects.create(
+            subreddit=self.subreddit,
+            poster=self.user,
+            **self.post_data
+        )
+        PostVote.objects.create(post=post, user=self.user, vote_type=1)
+        PostVote.objects.create(post=post, user=self.user2, vote_type=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [post.upvotes for post in Post.objects.all()],
+                [2]
+            )
+        with self.assertNumQueries(2):
+            post = Post.objects_with_votes.get()
+            self.assertEqual(len(post.votes.all()), 2)
+            
+    def test_benchmark_post_list_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_post_list',
+            posts=2,
+            votes=3,
+            repeat=1,
+            stdout=out
+        )
+        self.assertIn("scores from prefetched votes", out.getvalue())
+        self.assertFalse(Sub.objects.filter(title='benchmark_post_list'))
+        
+    @override_settings(ALLOWED_HOSTS=['example.com'])
+    def test_benchmark_post_list_command_allowed_hosts(self):
+        """
+        The requests of the command aren't from an allowed host
+        """
+        out = StringIO()
+        call_command(
+            'benchmark_post_list',
+            posts=2,
+            votes=3,
+            repeat=1,
+            stdout=out
+        )
+        self.assertIn("list view", out.getvalue())
         
 class PostRequestTests(APITestCase):
     """
@@ -264,6 +340,7 @@ class PostRetrieveRequestTests(APITestCase):
     pseudo-subreddits and pagination
     """
     def setUp(self):
+        cache.clear()
         # need a subreddit
         self.subreddit = Sub.objects.create(
             title='test_subreddit'
@@ -521,3 +598,989 @@ class PostRetrieveRequestTests(APITestCase):
         self.assertTrue(all(popularity))
         
         
+    def test_orderby_best_and_new(self):
+        """
+        Posts are ordered in the db by score for 'best' and by creation
+        date for 'new'
+        """
+        top_post = Post.objects.get(title="user_2_post_title_5")
+        PostVote.objects.create(post=top_post, user=self.user, vote_type=1)
+        bottom_post = Post.objects.get(title="user_1_post_title_5")
+        PostVote.objects.create(post=bottom_post, user=self.user, vote_type=-1)
+        
+        response = self.client.get(self.sub_post_list_url, {"orderby": "best"})
+        results = response.data["results"]
+        self.assertEqual(results[0]["pk"], top_post.pk)
+        self.assertEqual(results[0]["upvotes"], 1)
+        self.assertEqual(results[-1]["pk"], bottom_post.pk)
+        self.assertEqual(results[-1]["upvotes"], -1)
+        
+        response = self.client.get(self.sub_post_list_url, {"orderby": "new"})
+        results = response.data["results"]
+        self.assertEqual(results[0]["title"], "user_2_post_title_9")
+        self.assertEqual(results[-1]["title"], "user_1_post_title_0")
+        
+    def test_vote_state_batched(self):
+        """
+        An authenticated listing reports the user's votes in vote_state,
+        looked up with one query for the whole page
+        """
+        self.client.force_login(self.user)
+        upvoted = Post.objects.get(title="user_1_post_title_3")
+        downvoted = Post.objects.get(title="user_2_post_title_3")
+        PostVote.objects.create(post=upvoted, user=self.user, vote_type=1)
+        PostVote.objects.create(post=downvoted, user=self.user, vote_type=-1)
+        
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(self.sub_post_list_url, {"limit": 5})
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client.get(self.sub_post_list_url, {"limit": 20})
+        vote_queries = lambda queries: [
+            query for query in queries if "votes_postvote" in query["sql"]
+        ]
+        self.assertEqual(
+            len(vote_queries(small_page)),
+            len(vote_queries(large_page))
+        )
+        
+        vote_states = {
+            post["pk"]: post["vote_state"] for post in response.data["results"]
+        }
+        self.assertEqual(vote_states.pop(upvoted.pk), 1)
+        self.assertEqual(vote_states.pop(downvoted.pk), -1)
+        self.assertTrue(all(state == 0 for state in vote_states.values()))
+        
+    def test_cursor_pagination(self):
+        """
+        With pagination=cursor the next links walk through every post in
+        order exactly once and the previous link leads back
+        """
+        for post in Post.objects.filter(title__endswith="7"):
+            PostVote.objects.create(post=post, user=self.user, vote_type=1)
+        expected = list(
+            Post.objects.filter(subreddit=self.subreddit)
+            .order_by(*Post.orderings['best'])
+            .values_list('pk', flat=True)
+        )
+        
+        response = self.client.get(
+            self.sub_post_list_url,
+            {"pagination": "cursor", "limit": 7}
+        )
+        self.assertIsNone(response.data["previous"])
+        first_page = [post["pk"] for post in response.data["results"]]
+        pks = list(first_page)
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            pks.extend(post["pk"] for post in response.data["results"])
+        self.assertEqual(pks, expected)
+        
+        response = self.client.get(
+            self.sub_post_list_url,
+            {"pagination": "cursor", "limit": 7}
+        )
+        response = self.client.get(response.data["next"])
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [post["pk"] for post in response.data["results"]],
+            first_page
+        )
+        self.assertIsNone(response.data["previous"])
+        
+    def test_cursor_pagination_stable_under_votes(self):
+        """
+        Votes that move a post from an earlier page don't make the next
+        page skip any posts
+        """
+        params = {"pagination": "cursor", "limit": 5, "orderby": "best"}
+        response = self.client.get(self.sub_post_list_url, params)
+        first_page = [post["pk"] for post in response.data["results"]]
+        expected_next = list(
+            Post.objects.filter(subreddit=self.subreddit)
+            .order_by(*Post.orderings['best'])
+            .values_list('pk', flat=True)[5:10]
+        )
+        # bury the first post of the first page
+        PostVote.objects.create(
+            post_id=first_page[0],
+            user=self.user,
+            vote_type=-1
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [post["pk"] for post in response.data["results"]],
+            expected_next
+        )
+        
+    def test_cursor_pagination_invalid_cursor(self):
+        """
+        A cursor that wasn't produced by the api is a 404
+        """
+        response = self.client.get(
+            self.sub_post_list_url,
+            {"pagination": "cursor", "cursor": "not-a-cursor"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_cursor_pagination_other_ordering(self):
+        """
+        A cursor is only valid for the ordering it was made for
+        """
+        response = self.client.get(
+            self.sub_post_list_url,
+            {"pagination": "cursor", "limit": 5, "orderby": "hot"}
+        )
+        next_url = replace_query_param(response.data["next"], "orderby", "new")
+        response = self.client.get(next_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_cursor_pagination_tampered_cursor(self):
+        """
+        A cursor whose position doesn't fit the types of the ordering
+        fields is a 404
+        """
+        ordering = list(Post.orderings['best'])
+        for position in (
+            ["abc", 1],
+            ["abc", "2019-01-01T00:00:00+00:00", 1],
+            [1, "yesterday", 1],
+            [1, "2019-01-01T00:00:00", 1],
+            [1, "2019-01-01T00:00:00+00:00", [1]],
+            [None, "2019-01-01T00:00:00+00:00", 1],
+        ):
+            response = self.client.get(self.sub_post_list_url, {
+                "pagination": "cursor",
+                "cursor": encode_cursor(ordering, position),
+            })
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_404_NOT_FOUND,
+                position
+            )
+        response = self.client.get(self.sub_post_list_url, {
+            "pagination": "cursor",
+            "cursor": encode_cursor(
+                ordering,
+                [1, "2000-01-01T00:00:00+00:00", 1]
+            ),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+class PostRankingTests(APITestCase):
+    """
+    The precomputed 'hot' and 'controversial' rankings and the 'top'
+    time windows
+    """
+    def setUp(self):
+        self.subreddit = Sub.objects.create(title='test_subreddit')
+        self.voters = [
+            User.objects.create(
+                username="voter_{}".format(i),
+                email="voter_{}@gmail.com".format(i),
+                password="test_password"
+            )
+            for i in range(4)
+        ]
+        self.poster = self.voters[0]
+        self.sub_post_list_url = reverse(
+            'sub-post-list',
+            kwargs={"sub_title": self.subreddit.title}
+        )
+        
+    def make_post(self, title, votes, age=timedelta(0)):
+        post = Post.objects.create(
+            poster=self.poster,
+            subreddit=self.subreddit,
+            title=title,
+            created=timezone.now() - age
+        )
+        for voter, vote_type in zip(self.voters, votes):
+            PostVote.objects.create(post=post, user=voter, vote_type=vote_type)
+        post.refresh_from_db()
+        return post
+        
+    def get_titles(self, params):
+        response = self.client.get(self.sub_post_list_url, params)
+        return [post["title"] for post in response.data["results"]]
+        
+    def test_rankings_updated_on_vote(self):
+        """
+        The stored rankings follow the votes
+        """
+        post = self.make_post("post", [1, 1, -1])
+        self.assertAlmostEqual(
+            post.hot,
+            reddit_orderby.hot(1, post.created)
+        )
+        self.assertAlmostEqual(post.controversy, 3 ** 0.5)
+        
+    def test_hot_ordering(self):
+        """
+        A newer post needs fewer votes than an older one to be hotter
+        """
+        self.make_post("old_popular", [1, 1, 1], age=timedelta(days=2))
+        self.make_post("new_unvoted", [])
+        self.make_post("new_downvoted", [-1, -1])
+        self.assertEqual(
+            self.get_titles({"orderby": "hot"}),
+            ["new_unvoted", "new_downvoted", "old_popular"]
+        )
+        
+    def test_controversial_ordering(self):
+        """
+        Evenly split votes are the most controversial
+        """
+        self.make_post("unanimous", [1, 1, 1, 1])
+        self.make_post("split", [1, 1, -1, -1])
+        self.make_post("lopsided", [1, 1, 1, -1])
+        self.assertEqual(
+            self.get_titles({"orderby": "controversial"}),
+            ["split", "lopsided", "unanimous"]
+        )
+        
+    def test_top_time_window(self):
+        """
+        'top' ranks by score within the window given by 't'
+        """
+        self.make_post("last_year", [1, 1, 1], age=timedelta(days=200))
+        self.make_post("last_week", [1, 1], age=timedelta(days=3))
+        self.make_post("today", [1], age=timedelta(hours=2))
+        self.assertEqual(
+            self.get_titles({"orderby": "top", "t": "day"}),
+            ["today"]
+        )
+        self.assertEqual(
+            self.get_titles({"orderby": "top", "t": "week"}),
+            ["last_week", "today"]
+        )
+        self.assertEqual(
+            self.get_titles({"orderby": "top", "t": "all"}),
+            ["last_year", "last_week", "today"]
+        )
+        
+    def test_save_keeps_concurrent_counters(self):
+        """
+        Saving a post loaded before a vote or comment doesn't write the old
+        counters back
+        """
+        post = self.make_post("post", [1])
+        stale = Post.objects.get(pk=post.pk)
+        PostVote.objects.cast(self.voters[1], post.pk, PostVote.UPVOTE)
+        Comment.objects.create(poster=self.poster, post=post, body="comment")
+        stale.title = "edited_title"
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.title, "edited_title")
+        self.assertEqual(post.score, 2)
+        self.assertEqual(post.upvote_count, 2)
+        self.assertEqual(post.comment_count, 1)
+        self.assertAlmostEqual(
+            post.hot,
+            reddit_orderby.hot(2, post.created)
+        )
+        
+        # The same for an edit through the api
+        def vote_while_editing(serializer, data):
+            PostVote.objects.cast(self.voters[2], post.pk, PostVote.UPVOTE)
+            return data
+        
+        self.client.force_login(self.poster)
+        url = reverse('post-detail', kwargs={"pk": post.pk})
+        with mock.patch.object(
+            PostSerializer,
+            'validate',
+            autospec=True,
+            side_effect=vote_while_editing
+        ):
+            response = self.client.patch(url, {"body": "edited_body"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post.refresh_from_db()
+        self.assertEqual(post.body, "edited_body")
+        self.assertEqual(post.score, 3)
+        
+    def test_recompute_post_rankings(self):
+        """
+        The management command repairs the stored rankings
+        """
+        post = self.make_post("post", [1, -1])
+        Post.objects.filter(pk=post.pk).update(hot=0, controversy=0)
+        out = StringIO()
+        call_command('recompute_post_rankings', stdout=out)
+        self.assertIn("Recomputed the rankings of 1 posts", out.getvalue())
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.hot, reddit_orderby.hot(0, post.created))
+        self.assertAlmostEqual(post.controversy, 2.0)
+        
+class PopularFeedTests(APITestCase):
+    """
+    The materialized feed behind the 'popular' pseudo-subreddit
+    """
+    def setUp(self):
+        cache.clear()
+        self.subreddit = Sub.objects.create(title='test_subreddit')
+        self.voters = [
+            User.objects.create(
+                username="voter_{}".format(i),
+                email="voter_{}@gmail.com".format(i),
+                password="test_password"
+            )
+            for i in range(3)
+        ]
+        self.posts = [
+            Post.objects.create(
+                poster=self.voters[0],
+                subreddit=self.subreddit,
+                title="post_{}".format(i)
+            )
+            for i in range(4)
+        ]
+        self.popular_url = reverse(
+            'sub-post-list',
+            kwargs={"sub_title": "popular"}
+        )
+        
+    def vote(self, post, n_votes, vote_type=1):
+        for voter in self.voters[:n_votes]:
+            PostVote.objects.update_or_create(
+                post=post,
+                user=voter,
+                defaults={"vote_type": vote_type}
+            )
+            
+    def feed(self):
+        return list(
+            PopularPost.objects.order_by('rank').values_list('post_id', 'score')
+        )
+        
+    def test_incremental_refresh(self):
+        """
+        Only the changes since the last refresh are written
+        """
+        self.vote(self.posts[0], 2)
+        self.vote(self.posts[1], 3)
+        self.assertEqual(PopularPost.objects.refresh(), (0, 2, 0))
+        self.assertEqual(
+            self.feed(),
+            [(self.posts[1].pk, 3), (self.posts[0].pk, 2)]
+        )
+        
+        # post 1 loses its votes and post 2 joins
+        self.vote(self.posts[1], 3, vote_type=0)
+        self.vote(self.posts[2], 2)
+        self.assertEqual(PopularPost.objects.refresh(), (1, 1, 0))
+        self.assertEqual(
+            set(self.feed()),
+            {(self.posts[0].pk, 2), (self.posts[2].pk, 2)}
+        )
+        self.assertFalse(PopularPost.objects.is_stale())
+        
+    def test_feed_read_until_stale(self):
+        """
+        The view serves the materialized feed and only rebuilds it once
+        it is stale
+        """
+        self.vote(self.posts[0], 2)
+        response = self.client.get(self.popular_url)
+        self.assertEqual(
+            [post["pk"] for post in response.data["results"]],
+            [self.posts[0].pk]
+        )
+        self.vote(self.posts[3], 3)
+        response = self.client.get(self.popular_url)
+        self.assertEqual(len(response.data["results"]), 1)
+        
+        cache.set(
+            PopularPost.objects.refreshed_key,
+            timezone.now() - timedelta(days=1)
+        )
+        response = self.client.get(self.popular_url)
+        self.assertEqual(
+            [post["pk"] for post in response.data["results"]],
+            [self.posts[3].pk, self.posts[0].pk]
+        )
+        
+    def test_empty_feed_not_stale(self):
+        """
+        A feed without any posts popular enough is fresh after a refresh
+        """
+        self.assertTrue(PopularPost.objects.is_stale())
+        self.assertEqual(PopularPost.objects.refresh_if_stale(), (0, 0, 0))
+        self.assertFalse(PopularPost.objects.is_stale())
+        self.assertIsNone(PopularPost.objects.refresh_if_stale())
+        
+    def test_concurrent_refresh(self):
+        """
+        A request doesn't refresh the feed while another one is, and a
+        refresh that collides with another one serves the current feed
+        """
+        self.vote(self.posts[0], 2)
+        cache.add(PopularPost.objects.refresh_lock_key, True)
+        self.assertIsNone(PopularPost.objects.refresh_if_stale())
+        self.assertEqual(self.feed(), [])
+        cache.delete(PopularPost.objects.refresh_lock_key)
+        
+        # Another process adds the entry just before this one does
+        bulk_create = PopularPost.objects.bulk_create
+        
+        def racing_bulk_create(entries):
+            PopularPost.objects.create(post=self.posts[0], rank=0, score=2)
+            return bulk_create(entries)
+        
+        with mock.patch.object(
+            PopularPost.objects,
+            'bulk_create',
+            racing_bulk_create
+        ):
+            response = self.client.get(self.popular_url)
+        # The failed refresh is rolled back and the request still served
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+        self.assertIsNone(cache.get(PopularPost.objects.refresh_lock_key))
+        
+    def test_refresh_popular_feed_command(self):
+        self.vote(self.posts[2], 2)
+        out = StringIO()
+        call_command('refresh_popular_feed', stdout=out)
+        self.assertIn(
+            "Refreshed the popular feed: 0 removed, 1 added, 0 updated",
+            out.getvalue()
+        )
+        self.assertEqual(self.feed(), [(self.posts[2].pk, 2)])
+
+class HomeFeedTests(APITestCase):
+    """
+    The cached, merged home feed of an authenticated user
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_username",
+            email="test@gmail.com",
+            password="test_password"
+        )
+        self.subreddits = [
+            Sub.objects.create(title="test_subreddit_{}".format(i))
+            for i in range(3)
+        ]
+        for subreddit in self.subreddits[:2]:
+            UserSubMembership.objects.create(user=self.user, sub=subreddit)
+        self.posts = {}
+        for subreddit in self.subreddits:
+            for post_num in range(4):
+                post = Post.objects.create(
+                    poster=self.user,
+                    subreddit=subreddit,
+                    title="{}_post_{}".format(subreddit.title, post_num)
+                )
+                Post.objects.filter(pk=post.pk).update(
+                    score=(post_num * 7 + subreddit.pk) % 5
+                )
+                self.posts[post.pk] = subreddit
+        self.home_url = reverse(
+            'sub-post-list',
+            kwargs={"sub_title": "home"}
+        )
+        self.subscribe_url = lambda subreddit: reverse(
+            'subreddit-subscribe',
+            kwargs={"title": subreddit.title}
+        )
+        self.client.force_login(self.user)
+        
+    def home_pks(self, orderby='best'):
+        response = self.client.get(
+            self.home_url,
+            {"orderby": orderby, "limit": 100}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post["pk"] for post in response.data["results"]]
+        
+    def expected_pks(self, subreddits, orderby='best'):
+        return list(
+            Post.objects.filter(subreddit__in=subreddits)
+            .order_by(*Post.orderings[orderby])
+            .values_list('pk', flat=True)
+        )
+        
+    def test_merged_order(self):
+        for orderby in ('best', 'new', 'hot', 'controversial'):
+            self.assertEqual(
+                self.home_pks(orderby),
+                self.expected_pks(self.subreddits[:2], orderby)
+            )
+            
+    @override_settings(HOME_FEED_SIZE=3)
+    def test_merge_is_bounded(self):
+        self.assertEqual(
+            self.home_pks(),
+            self.expected_pks(self.subreddits[:2])[:3]
+        )
+        
+    def test_cached_feed(self):
+        """
+        The second request only reads the page of posts
+        """
+        self.home_pks()
+        with CaptureQueriesContext(connection) as queries:
+            self.home_pks()
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'redditors_usersubmembership' in query['sql']
+        ])
+        
+    def test_subscribe_invalidates(self):
+        self.home_pks()
+        response = self.client.post(
+            self.subscribe_url(self.subreddits[2]),
+            {"action": "sub"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.home_pks(),
+            self.expected_pks(self.subreddits)
+        )
+        
+        response = self.client.post(
+            self.subscribe_url(self.subreddits[0]),
+            {"action": "unsub"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.home_pks(),
+            self.expected_pks(self.subreddits[1:])
+        )
+        
+    def test_new_post_invalidates(self):
+        self.home_pks('new')
+        post = Post.objects.create(
+            poster=self.user,
+            subreddit=self.subreddits[1],
+            title="a_new_post"
+        )
+        self.assertEqual(self.home_pks('new')[0], post.pk)
+        post.delete()
+        self.assertNotIn(post.pk, self.home_pks('new'))
+
+class ResponseCacheTests(APITestCase):
+    """
+    The listing and detail responses are cached for every reader and
+    invalidated by writes
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_username",
+            email="test@gmail.com",
+            password="test_password"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        self.post = Post.objects.create(
+            poster=self.user,
+            subreddit=self.subreddit,
+            title="test_post"
+        )
+        self.list_url = reverse(
+            'sub-post-list',
+            kwargs={"sub_title": self.subreddit.title}
+        )
+        self.detail_url = reverse(
+            'post-detail',
+            kwargs={"pk": self.post.pk}
+        )
+        
+    def test_subreddit_pk_key(self):
+        """
+        Any title makes a valid memcached key
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            cache.validate_key(subreddit_pk_key("a title\n" + "x" * 300))
+        
+    def test_anonymous_hit_without_queries(self):
+        for url in (self.list_url, self.detail_url):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.data, second.data)
+            
+    def test_query_params_in_key(self):
+        self.client.get(self.list_url, {"orderby": "new"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url, {"orderby": "new", "limit": 5})
+        self.assertTrue(queries.captured_queries)
+            
+    def test_vote_state_merged(self):
+        """
+        Authenticated readers share the cached body but see their own votes
+        """
+        PostVote.objects.cast(self.user, self.post.pk, PostVote.UPVOTE)
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        
+        self.client.force_login(self.user)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data["results"][0]["vote_state"], 1)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["vote_state"], 1)
+        
+        self.client.logout()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data["results"][0]["vote_state"], 0)
+        
+    def test_votes_invalidate(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        PostVote.objects.cast(self.user, self.post.pk, PostVote.UPVOTE)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data["results"][0]["upvotes"], 1)
+        PostVote.objects.create(
+            post=self.post,
+            user=User.objects.create(username="voter", email="v@gmail.com"),
+            vote_type=PostVote.UPVOTE
+        )
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["upvotes"], 2)
+        
+    def test_post_writes_invalidate(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        self.post.title = "edited_title"
+        self.post.save()
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["title"], "edited_title")
+        
+        post = Post.objects.create(
+            poster=self.user,
+            subreddit=self.subreddit,
+            title="new_post"
+        )
+        response = self.client.get(self.list_url, {"orderby": "new"})
+        self.assertEqual(response.data["results"][0]["pk"], post.pk)
+        
+        self.post.delete()
+        response = self.client.get(self.list_url)
+        self.assertEqual(
+            [post["pk"] for post in response.data["results"]],
+            [post.pk]
+        )
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_renamed_subreddit(self):
+        self.client.get(self.list_url)
+        self.subreddit.title = "renamed_subreddit"
+        self.subreddit.save()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class CommentActivityTests(APITestCase):
+    """
+    The denormalized comment_count and last_comment_at of posts and the
+    'active' and 'comments' orderings they allow
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_username",
+            email="test@gmail.com",
+            password="test_password"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        self.posts = [
+            Post.objects.create(
+                poster=self.user,
+                subreddit=self.subreddit,
+                title="post_{}".format(i),
+                created=timezone.now() - timedelta(hours=3 - i)
+            )
+            for i in range(3)
+        ]
+        self.list_url = reverse(
+            'sub-post-list',
+            kwargs={"sub_title": self.subreddit.title}
+        )
+        
+    def comment(self, post, parent=None):
+        return Comment.objects.create(
+            post=post,
+            poster=self.user,
+            parent=parent,
+            body="test_comment"
+        )
+        
+    def get_titles(self, params):
+        response = self.client.get(self.list_url, params)
+        return [post["title"] for post in response.data["results"]]
+        
+    def test_new_post(self):
+        post = self.posts[0]
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(post.last_comment_at, post.created)
+        
+    def test_comment_creation_and_delete(self):
+        post = self.posts[0]
+        response = self.client.get(self.list_url, {"orderby": "new"})
+        self.assertEqual(response.data["results"][-1]["comment_count"], 0)
+        
+        comment = self.comment(post)
+        reply = self.comment(post, parent=comment)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(post.last_comment_at, reply.created)
+        response = self.client.get(self.list_url, {"orderby": "new"})
+        self.assertEqual(response.data["results"][-1]["comment_count"], 2)
+        
+        # Only the first reddit delete counts
+        serializer = CommentSerializer(reply)
+        serializer.reddit_delete()
+        serializer.reddit_delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.last_comment_at, reply.created)
+        response = self.client.get(
+            reverse('post-detail', kwargs={"pk": post.pk})
+        )
+        self.assertEqual(response.data["comment_count"], 1)
+        
+    def test_older_comment(self):
+        """
+        A comment created before the latest activity, e.g. by the seed
+        commands, doesn't move last_comment_at back
+        """
+        post = self.posts[2]
+        latest = self.comment(post)
+        Comment.objects.create(
+            post=post,
+            poster=self.user,
+            body="old_comment",
+            created=timezone.now() - timedelta(days=3)
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(post.last_comment_at, latest.created)
+        self.assertEqual(
+            self.get_titles({"orderby": "active"}),
+            ["post_2", "post_1", "post_0"]
+        )
+        
+    def test_active_ordering(self):
+        self.assertEqual(
+            self.get_titles({"orderby": "active"}),
+            ["post_2", "post_1", "post_0"]
+        )
+        self.comment(self.posts[0])
+        self.assertEqual(
+            self.get_titles({"orderby": "active"}),
+            ["post_0", "post_2", "post_1"]
+        )
+        
+    def test_comments_ordering(self):
+        for i in range(2):
+            self.comment(self.posts[1])
+        self.comment(self.posts[2])
+        self.assertEqual(
+            self.get_titles({"orderby": "comments"}),
+            ["post_1", "post_2", "post_0"]
+        )
+
+class FeedQueryCountTests(APITestCase):
+    """
+    Serializing a list of posts costs the same number of queries no
+    matter how many posts, posters and subreddits are in it
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_username",
+            email="test@gmail.com",
+            password="test_password"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        
+    def add_posts(self, n):
+        for i in range(n):
+            poster = User.objects.create(
+                username="poster_{}".format(Post.objects.count()),
+                email="poster_{}@gmail.com".format(Post.objects.count()),
+            )
+            Post.objects.create(
+                poster=poster,
+                subreddit=Sub.objects.create(
+                    title="sub_{}".format(Post.objects.count())
+                ) if i % 2 else self.subreddit,
+                title="search_term {}".format(i)
+            )
+            
+    def count_queries(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+        
+    def assertQueriesConstant(self, url, params=None):
+        self.add_posts(2)
+        few = self.count_queries(url, params)
+        self.add_posts(6)
+        self.assertEqual(self.count_queries(url, params), few)
+        
+    def test_post_list(self):
+        self.assertQueriesConstant(reverse('post-list'))
+        
+    def test_sub_post_list(self):
+        self.client.force_login(self.user)
+        self.assertQueriesConstant(
+            reverse('sub-post-list', kwargs={"sub_title": "test_subreddit"})
+        )
+        
+    def test_home_post_list(self):
+        self.assertQueriesConstant(
+            reverse('sub-post-list', kwargs={"sub_title": "home"})
+        )
+        
+    def test_search(self):
+        self.client.force_login(self.user)
+        self.assertQueriesConstant(reverse('search'), {"q": "search_term"})
+        
+    def test_profile_posts(self):
+        for i in range(3):
+            Post.objects.create(
+                poster=self.user,
+                subreddit=Sub.objects.create(title="profile_{}".format(i)),
+                title="profile_post"
+            )
+        url = reverse('user-profile', kwargs={"username": self.user.username})
+        few = self.count_queries(url)
+        for i in range(3, 9):
+            Post.objects.create(
+                poster=self.user,
+                subreddit=Sub.objects.create(title="profile_{}".format(i)),
+                title="profile_post"
+            )
+        self.assertEqual(self.count_queries(url), few)
+
+class PostListViewTests(APITestCase):
+    """
+    The list of all posts, filtered in the db and cursor paginated
+    """
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username="user_{}".format(i),
+                email="user_{}@gmail.com".format(i),
+                password="test_password"
+            )
+            for i in range(2)
+        ]
+        self.subreddits = [
+            Sub.objects.create(title="sub_{}".format(i)) for i in range(2)
+        ]
+        self.now = timezone.now()
+        self.posts = [
+            Post.objects.create(
+                poster=self.users[i % 2],
+                subreddit=self.subreddits[i // 3],
+                title="post_{}".format(i),
+                created=self.now - timedelta(days=i)
+            )
+            for i in range(6)
+        ]
+        self.post_list_url = reverse('post-list')
+        
+    def get_titles(self, params=None):
+        response = self.client.get(self.post_list_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post["title"] for post in response.data["results"]]
+        
+    def test_newest_first(self):
+        self.assertEqual(
+            self.get_titles(),
+            ["post_{}".format(i) for i in range(6)]
+        )
+        
+    def test_filters(self):
+        self.assertEqual(
+            self.get_titles({"username": "user_1"}),
+            ["post_1", "post_3", "post_5"]
+        )
+        self.assertEqual(
+            self.get_titles({"username": "user_1", "subreddit": "sub_0"}),
+            ["post_1"]
+        )
+        self.assertEqual(self.get_titles({"username": "nobody"}), [])
+        self.assertEqual(self.get_titles({"created_before": "2000-01-01"}), [])
+        self.assertEqual(
+            self.get_titles({
+                "created_after": (self.now - timedelta(days=3)).isoformat(),
+                "created_before": (self.now - timedelta(days=1)).isoformat(),
+            }),
+            ["post_2", "post_3"]
+        )
+        
+    def test_invalid_date(self):
+        response = self.client.get(
+            self.post_list_url,
+            {"created_after": "yesterday"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("created_after", response.data)
+        
+    def test_pagination(self):
+        titles = []
+        url, params = self.post_list_url, {"limit": 4, "username": "user_0"}
+        while url:
+            response = self.client.get(url, params)
+            titles.extend(post["title"] for post in response.data["results"])
+            url, params = response.data["next"], None
+        self.assertEqual(titles, ["post_0", "post_2", "post_4"])
+        
+        response = self.client.get(self.post_list_url, {"limit": 4})
+        self.assertEqual(len(response.data["results"]), 4)
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [post["title"] for post in response.data["results"]],
+            ["post_4", "post_5"]
+        )
+        self.assertIsNone(response.data["next"])
+        
+    def test_invalid_cursor(self):
+        response = self.client.get(self.post_list_url, {
+            "cursor": encode_cursor(['-created', '-pk'], ["abc", 1]),
+        })
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.post_list_url, {
+            "cursor": encode_cursor(['-hot', '-pk'], [1.5, 1]),
+        })
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_streaming(self):
+        """
+        The streamed list is the unpaginated list, read in chunks
+        """
+        PostVote.objects.cast(self.users[0], self.posts[4].pk, PostVote.UPVOTE)
+        self.client.force_login(self.users[0])
+        with mock.patch.object(PostListView, 'stream_chunk_size', 2):
+            response = self.client.get(
+                self.post_list_url,
+                {"stream": "true", "created_after": "2000-01-01"}
+            )
+            posts = json.loads(
+                b"".join(response.streaming_content).decode("utf-8")
+            )
+        self.assertEqual(
+            [post["title"] for post in posts],
+            ["post_{}".format(i) for i in range(6)]
+        )
+        self.assertEqual(
+            [post["vote_state"] for post in posts],
+            [0, 0, 0, 0, 1, 0]
+        )
+        self.assertEqual(posts[0], self.client.get(
+            self.post_list_url
+        ).data["results"][0])
+        
+        response = self.client.get(
+            self.post_list_url,
+            {"stream": "1", "username": "nobody"}
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"[]")
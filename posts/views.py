@@ -8,47 +8,90 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, exceptions
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.translation import gettext as _
-from django.db.models import Sum
+from datetime import datetime, time
 
-from .models import Post
+from .models import Post, PopularPost
+from .feeds import home_feed, subreddit_pk
 from .serializers import PostSerializer
 from .permissions import IsPosterOrModOrAdminOrReadOnly
-from .pagination import PostListPagination
+from .pagination import PostListPagination, PostCursorPagination
 from subs.models import Sub
-from redditors.models import User
+from core.mixins import CachedResponseMixin, StreamingListMixin
+from votes.mixins import VoteStateMixin
+from votes.models import PostVote
 
-class PostListView(ListAPIView):
+class PostListView(StreamingListMixin, VoteStateMixin, ListAPIView):
     """
-    Standard list view for posts
+    Standard list view for posts, newest first. The filters are applied
+    in the db and the list is cursor paginated, follow the 'next' links
+    to walk through all of the posts a page at a time, or stream it, see
+    StreamingListMixin.
     
-    query parameter: username
+    query parameter: username, subreddit, created_after, created_before,
+    limit, stream
     """
-    queryset=Post.objects.all()
     serializer_class=PostSerializer
+    pagination_class = PostCursorPagination
+    vote_model = PostVote
+    vote_states_context_key = 'post_vote_states'
     
     permission_classes = (IsAuthenticatedOrReadOnly,)
     
-    def get_serializer_context(self):
+    # Query parameter: lookup, for the created date range
+    created_filters = {
+        'created_after': 'created__gte',
+        'created_before': 'created__lt',
+    }
+    
+    def get_datetime_param(self, param):
         """
-        It will really speed up some vote lookups in the
-        serializer if we can turn a username into a user_pk at this point.
-        This is only relevant if the consumer provides a get param 'username'
+        A date or datetime in ISO 8601 format, e.g. '2019-02-14' or
+        '2019-02-14T23:50:00Z'. Naive ones are in the current time zone.
         """
-        context = super().get_serializer_context()
-        username = self.request.query_params.get('username')
+        value = self.request.query_params[param]
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                date = parse_date(value)
+                if date is not None:
+                    parsed = datetime.combine(date, time())
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            message = _("Enter a valid date or datetime in ISO 8601 format.")
+            raise exceptions.ValidationError({param: [message]})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+    
+    def get_queryset(self):
+        qs = Post.objects.feed()
+        params = self.request.query_params
+        username = params.get('username')
         if username:
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
-                return context
-            context['post_user_pk'] = user.pk
-        return context
+            qs = qs.filter(poster__username=username)
+        subreddit_title = params.get('subreddit')
+        if subreddit_title:
+            qs = qs.filter(subreddit__title=subreddit_title)
+        for param, lookup in self.created_filters.items():
+            if params.get(param):
+                qs = qs.filter(**{lookup: self.get_datetime_param(param)})
+        return qs.order_by(*Post.orderings['new'])
     
-class PostDetailView(RetrieveUpdateDestroyAPIView):
+class PostDetailView(CachedResponseMixin, RetrieveUpdateDestroyAPIView):
     queryset = Post.objects.all()
     serializer_class=PostSerializer
     permission_classes = (IsPosterOrModOrAdminOrReadOnly,)
+    vote_model = PostVote
+    vote_states_context_key = 'post_vote_states'
+    
+    def get_cache_dependencies(self):
+        return [('post', self.kwargs['pk'])]
+    
+    def get_voted_items(self, data):
+        return [data]
     
 class PostToSubredditView(CreateAPIView):
     serializer_class = PostSerializer
@@ -87,37 +130,86 @@ class PostToSubredditView(CreateAPIView):
             headers=headers
         )
     
-class SubPostListView(ListAPIView):
+class SubPostListView(CachedResponseMixin, ListAPIView):
     """
     For a particular sub return list of all posts.
     Posts can be ordered with optional GET parameter 'orderby'.
     By default they are ordered by most popular.
+    Pagination is limit/offset unless 'pagination=cursor' is requested.
+    The pages are cached for every reader except for the home feeds of
+    authenticated users, see CachedResponseMixin.
     
-    query parameter: orderby
+    query parameter: orderby, t, pagination
     """
     serializer_class = PostSerializer
     pagination_class = PostListPagination
+    cursor_pagination_class = PostCursorPagination
+    vote_model = PostVote
+    vote_states_context_key = 'post_vote_states'
     
-    def get_sort_function(self):
+    @property
+    def paginator(self):
         """
-        Given an api sort description (e.g. 'popular' or 'new') return
-        a key function that can be used in sort based on the acutal
-        model attributes nomenclature.
+        Consumers that scroll through a feed can ask for cursor pagination,
+        which costs the same for every page and doesn't skip or repeat
+        posts as the scores change.
         """
-        sort_functions = {
-            'best': (lambda post: -post.upvotes),
-            'new': (lambda post: (timezone.now() - post.created))
-        }
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
+    def is_authenticated_home(self):
+        return (
+            self.kwargs['sub_title'].lower() == 'home'
+            and self.request.user and self.request.user.is_authenticated
+        )
+    
+    def is_cacheable(self):
+        return not self.is_authenticated_home()
+    
+    def get_cache_dependencies(self):
+        sub_title = self.kwargs['sub_title']
+        if sub_title.lower() in Sub.pseudo_subreddits:
+            if sub_title.lower() != 'home':
+                self.refresh_stale_popular_feed()
+            return [('listing', 'all')]
+        return [('listing', subreddit_pk(sub_title))]
+    
+    def get_voted_items(self, data):
+        return data['results']
+    
+    def get_sort_key(self):
         api_sort_key = self.request.query_params.get('orderby', 'best')
-        return sort_functions.get(api_sort_key, sort_functions['best'])
+        return api_sort_key if api_sort_key in Post.orderings else 'best'
+    
+    def get_ordering(self):
+        """
+        Given an api sort description (e.g. 'best' or 'new') return
+        the db ordering, see Post.orderings.
+        """
+        return Post.orderings[self.get_sort_key()]
+    
+    def filter_top_window(self, qs):
+        """
+        'top' only ranks the posts created within the time window given
+        by the 't' query parameter, e.g. 'day' or 'week'.
+        """
+        window = Post.top_windows.get(
+            self.request.query_params.get('t', 'all')
+        )
+        if window is None:
+            return qs
+        return qs.filter(created__gte=timezone.now() - window)
     
     def get_queryset(self):
         """
         Check if posts are requested from a psuedo-subreddit
         or ensure that the requested subreddit exists.
-        Either way order the subreddit too.
-        NOTE: At this point can't sort with qs.order_by because
-        upvotes are not a column of the post table in db.
+        Either way order the subreddit too, the ordering is done
+        in the db so the paginator only pulls a single page.
         """
         subreddit_title = self.kwargs.get('sub_title', None)
         
@@ -136,35 +228,46 @@ class SubPostListView(ListAPIView):
                 ))
                 raise exceptions.NotFound(message)
             qs = subreddit.posts.all()
-        return sorted(qs, key=self.get_sort_function())
+        if self.get_sort_key() == 'top':
+            qs = self.filter_top_window(qs)
+        return qs.feed().order_by(*self.get_ordering())
         
     def get_home_queryset(self):
         """
         Create a list of posts for a 'home' subreddit on the fly.
         This will depend on whether the user is signed in or not.
-        If they are authenticated then only select posts from
-        thier subscribed subreddits. Otherwise just return a list
-        of all posts.
+        If they are authenticated then only select the top posts from
+        thier subscribed subreddits, see posts.feeds. Otherwise just
+        return a list of all posts.
         """
-        if self.request.user and self.request.user.is_authenticated:
-            return Post.objects.filter(
-                subreddit__in=self.request.user.subs.all()
-            )
+        if self.is_authenticated_home():
+            return Post.objects.filter(pk__in=home_feed(
+                self.request.user,
+                self.get_sort_key(),
+                self.request.query_params.get('t', 'all')
+            ))
             
         # return all posts if unauthed
         return Post.objects.all()
     
     def get_popular_queryset(self):
         """
-        Create a list of posts popular posts on the fly that serves as the
-        'Popular' psuedo subreddit.
+        The posts in the materialized popular feed, see PopularPost, serve
+        as the 'Popular' psuedo subreddit. The feed is normally kept up to
+        date by the refresh_popular_feed command, only refresh it here if
+        that isn't running.
         """
-        # Arbitrary popularity limit
-        popularity_limit = 1
-        
-        return Post.objects.annotate(
-            custom_upvotes=Sum("votes__vote_type")
-        ).filter(custom_upvotes__gt=popularity_limit)
+        self.refresh_stale_popular_feed()
+        return Post.objects.filter(popular_entry__isnull=False)
+    
+    def refresh_stale_popular_feed(self):
+        """
+        Checked before the cached pages are looked up, the refresh
+        invalidates them if the feed changed.
+        """
+        if not getattr(self, 'popular_feed_checked', False):
+            PopularPost.objects.refresh_if_stale()
+            self.popular_feed_checked = True
     
     def get_all_queryset(self):
         """
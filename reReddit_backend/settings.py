@@ -46,6 +46,40 @@ BLEACH_ALLOWED_ATTRIBUTES = [
 ]
 AUTH_USER_MODEL = 'redditors.User'
 
+# The 'popular' pseudo-subreddit is read from a materialized feed of the
+# hottest posts with a score above POPULAR_FEED_MIN_SCORE created in the last
+# POPULAR_FEED_WINDOW_DAYS (None for no limit). It is rebuilt by the
+# refresh_popular_feed command, or on a request once it is older than
+# POPULAR_FEED_REFRESH_SECONDS.
+POPULAR_FEED_SIZE = 1000
+POPULAR_FEED_MIN_SCORE = 1
+POPULAR_FEED_WINDOW_DAYS = None
+POPULAR_FEED_REFRESH_SECONDS = 300
+
+# The 'home' pseudo-subreddit of an authenticated user merges the top
+# HOME_FEED_SIZE posts of each subscribed subreddit, see posts.feeds. The
+# cached lists expire after HOME_FEED_CACHE_SECONDS.
+HOME_FEED_SIZE = 500
+HOME_FEED_CACHE_SECONDS = 60
+
+# With VOTE_BUFFER_ENABLED votes are collected in a buffer, VOTE_BUFFER_CLASS,
+# and written to the db in batches of up to VOTE_BUFFER_FLUSH_BATCH every
+# VOTE_BUFFER_FLUSH_MS milliseconds, see votes/buffer.py.
+VOTE_BUFFER_ENABLED = False
+VOTE_BUFFER_CLASS = 'votes.buffer.LocalVoteBuffer'
+VOTE_BUFFER_FLUSH_MS = 500
+VOTE_BUFFER_FLUSH_BATCH = 500
+
+# The post listings, post details and comment trees are cached for every
+# reader for up to RESPONSE_CACHE_SECONDS, see core.mixins. Writes
+# invalidate them, the timeout only bounds how stale the relative
+# 'created' times and the karma of the posters get.
+RESPONSE_CACHE_SECONDS = 60
+
+# The profile header of a user (karma, cake day, subreddits) is cached for
+# every reader for PROFILE_CACHE_SECONDS, see redditors.profiles.
+PROFILE_CACHE_SECONDS = 30
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -59,13 +93,12 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
-    'mptt',
     'django_bleach',
     
     'subs',
     'redditors.apps.RedditorsConfig',
-    'posts',
-    'comments',
+    'posts.apps.PostsConfig',
+    'comments.apps.CommentsConfig',
     'votes',
     'core',
 ]
@@ -112,6 +145,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# The feeds are invalidated through the cache, so with more than one
+# process this should be a shared cache such as memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rereddit',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
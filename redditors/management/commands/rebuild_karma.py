@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from redditors.models import User
+from votes.models import CommentVote, PostVote
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the karma, post_karma and comment_karma of every user "
+        "from the votes on their posts and comments"
+    )
+    
+    # How many mismatched users are listed by --verify
+    max_reported = 20
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help=('Only compare the stored karma with the votes and '
+                'report any differences, nothing is written')
+        )
+    
+    def vote_sum(self, vote_model):
+        """
+        Correlated subquery summing the votes on a user's posts or
+        comments, grouped by the poster
+        """
+        poster_field = vote_model.item_field + '__poster'
+        votes = vote_model.objects.filter(
+            **{poster_field: OuterRef('pk')}
+        ).order_by().values(poster_field).annotate(total=Sum('vote_type'))
+        return Coalesce(
+            Subquery(votes.values('total')),
+            Value(0),
+            output_field=IntegerField()
+        )
+    
+    def rebuild(self):
+        n_users = User.objects.update(
+            post_karma=self.vote_sum(PostVote),
+            comment_karma=self.vote_sum(CommentVote),
+            karma=self.vote_sum(PostVote) + self.vote_sum(CommentVote),
+        )
+        self.stdout.write("Rebuilt the karma of {} users".format(n_users))
+    
+    def verify(self):
+        mismatched = User.objects.annotate(
+            actual_post_karma=self.vote_sum(PostVote),
+            actual_comment_karma=self.vote_sum(CommentVote),
+        ).filter(
+            ~Q(post_karma=F('actual_post_karma'))
+            | ~Q(comment_karma=F('actual_comment_karma'))
+            | ~Q(karma=(
+                F('actual_post_karma') + F('actual_comment_karma')
+            ))
+        ).order_by('pk')
+        n_mismatched = mismatched.count()
+        self.stdout.write(
+            "{} users with karma that doesn't match the votes".format(
+                n_mismatched
+            )
+        )
+        for user in mismatched[:self.max_reported]:
+            self.stdout.write((
+                "\t-- {}: stored: {} ({}/{}), votes: {} ({}/{})"
+            ).format(
+                user.username,
+                user.karma, user.post_karma, user.comment_karma,
+                user.actual_post_karma + user.actual_comment_karma,
+                user.actual_post_karma, user.actual_comment_karma,
+            ))
+        return n_mismatched
+    
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
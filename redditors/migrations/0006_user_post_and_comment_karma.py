@@ -0,0 +1,49 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:42
+
+from django.db import migrations, models
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_karma(apps, schema_editor):
+    User = apps.get_model('redditors', 'User')
+    PostVote = apps.get_model('votes', 'PostVote')
+    CommentVote = apps.get_model('votes', 'CommentVote')
+
+    def vote_sum(vote_model, poster_field):
+        votes = vote_model.objects.filter(
+            **{poster_field: OuterRef('pk')}
+        ).order_by().values(poster_field).annotate(total=Sum('vote_type'))
+        return Coalesce(
+            Subquery(votes.values('total')),
+            Value(0),
+            output_field=IntegerField()
+        )
+
+    User.objects.update(
+        post_karma=vote_sum(PostVote, 'post__poster'),
+        comment_karma=vote_sum(CommentVote, 'comment__poster'),
+    )
+    User.objects.update(karma=F('post_karma') + F('comment_karma'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('redditors', '0005_auto_20190313_2215'),
+        ('votes', '0003_auto_20190129_1618'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='comment_karma',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='post_karma',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_karma, migrations.RunPython.noop),
+    ]
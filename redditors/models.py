@@ -5,7 +5,13 @@ from datetime import datetime
 from subs.models import Sub
 
 class User(AbstractUser):
+    # Karma is the net score of the votes on the user's posts and comments.
+    # karma is the total of post_karma and comment_karma, all three are
+    # incremented by every vote, see redditors.signals. The rebuild_karma
+    # command recomputes them from the votes.
     karma = models.IntegerField(default=0)
+    post_karma = models.IntegerField(default=0)
+    comment_karma = models.IntegerField(default=0)
     subs = models.ManyToManyField(
         Sub,
         through='UserSubMembership',
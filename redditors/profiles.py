@@ -0,0 +1,31 @@
+"""
+The header of a user's profile page, i.e. everything but their posts and
+comments, which are paginated separately, see redditors.views.
+
+The header is the same for every reader so it is cached for
+PROFILE_CACHE_SECONDS. It isn't invalidated, the timeout bounds how stale
+the karma and subreddits shown get.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+from .serializers import UserProfileSerializer
+
+
+def profile_header_key(username):
+    return 'profile_header:{}'.format(username)
+
+
+def profile_header(username):
+    """
+    The serialized header of the profile of the user with username, see
+    UserProfileSerializer. Raises User.DoesNotExist.
+    """
+    key = profile_header_key(username)
+    header = cache.get(key)
+    if header is None:
+        user = User.objects.get(username=username)
+        header = UserProfileSerializer(user).data
+        cache.set(key, header, timeout=settings.PROFILE_CACHE_SECONDS)
+    return header
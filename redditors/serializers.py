@@ -152,12 +152,12 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         return user
     
 
-from comments.serializers import CommentSerializer
-from posts.serializers import PostSerializer
 class UserProfileSerializer(serializers.ModelSerializer):
     """
     Provide the detail of a user, not for login but for profile pages.
     All information provied here will be publicly accessable.
+    This is the header of the profile, the posts and comments of the user
+    are listed a page at a time, see redditors.views.
     """
     subs = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -170,8 +170,6 @@ class UserProfileSerializer(serializers.ModelSerializer):
     cake_day = serializers.DateTimeField(
         source='date_joined'
     )
-    comments = serializers.SerializerMethodField()
-    posts = serializers.SerializerMethodField()
     
     class Meta:
         model = User
@@ -180,25 +178,6 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'username',
             'subs',
             'moderated_subs',
-            'comments',
-            'posts',
             'karma',
             'cake_day'
         )
-        
-    def get_comments(self, obj):
-        serializer = CommentSerializer(
-            obj.comments.all().order_by("-created"),
-            many=True,
-            context=self.context
-        )
-        return serializer.data
-    def get_posts(self, obj):
-        serializer = PostSerializer(
-            obj.posts.all().order_by("-created"),
-            many=True,
-            context=self.context
-        )
-        return serializer.data
-    
-    
@@ -1,43 +1,40 @@
-from django.db.models import signals, Sum
+from django.db.models import signals
 from django.dispatch import receiver
 
-from redditors.models import User
+from posts.feeds import invalidate_home
+from redditors.models import UserSubMembership
 from votes.models import CommentVote, PostVote
 
+@receiver(signals.post_save, sender=UserSubMembership)
+@receiver(signals.post_delete, sender=UserSubMembership)
+def home_feed_on_subscription(sender, instance, **kwargs):
+    """
+    Subscribing or unsubscribing, e.g. through the
+    SubredditSubscribeSerializer, changes the user's home feed.
+    """
+    invalidate_home(instance.user_id)
+
 @receiver(signals.post_save, sender=CommentVote)
 @receiver(signals.post_save, sender=PostVote)
-def karma_on_comment_vote(sender, instance, **kwargs):
+def karma_on_vote(sender, instance, created, **kwargs):
+    """
+    On a vote creation or update, change the karma of the poster of the
+    voted post or comment by the change in the vote. This runs inside the
+    transaction of VoteAbstractBase.save, before the new vote_type is
+    recorded as saved.
+    """
+    old_vote_type = sender.NO_VOTE if created else instance._saved_vote_type
+    instance.update_poster_karma(old_vote_type)
+
+@receiver(signals.post_delete, sender=CommentVote)
+@receiver(signals.post_delete, sender=PostVote)
+def vote_deleted(sender, instance, **kwargs):
     """
-    On a vote creation or update, make the appropriate change to user karma.
-    
-    TODO: Now I wish that I hadn't made the vote class abstract. I could
-    get away with one aggregate query. Should investigate if migrating to a
-    multi-table inheritance for votes would cause any problems.
-    
-    Alternatively I could probably come up with a more complex but
-    efficient way to do this with incrementing for each vote change.
-    This has become a little inefficient but it's a more difficult problem
-    than it seems.
-    
-    Another idea that could make this easier is to recognize that reddit
-    separates karma into comment and post karma, we could make the User
-    model reflect that and then handle each separately here.
+    A deleted vote, e.g. along with its user or the voted item, no longer
+    counts towards the counters of the item and the karma of its poster.
+    The counters are only ever changed by the vote deltas, so take the
+    stored vote back out of them.
     """
-    
-    # Need the poster of the comment or vote.
-    if sender == CommentVote:
-        poster = instance.comment.poster
-    elif sender == PostVote:
-        poster = instance.post.poster
-        
-    comment_karma = CommentVote.objects.filter(
-        comment__poster_id=poster.pk
-    ).aggregate( Sum('vote_type'))["vote_type__sum"] or 0
-    post_karma = PostVote.objects.filter(
-        post__poster_id=poster.pk
-    ).aggregate( Sum('vote_type') )["vote_type__sum"] or 0
-    
-    poster.karma = post_karma + comment_karma
-    poster.save()
-        
-        
+    old_vote_type = instance._saved_vote_type
+    instance.update_item_counters(old_vote_type, sender.NO_VOTE)
+    instance.update_poster_karma(old_vote_type, sender.NO_VOTE)
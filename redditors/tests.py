@@ -6,12 +6,18 @@ from rest_framework import status
 from django.urls import reverse
 from django.core.management import call_command
 from io import StringIO
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
 from rest_framework.authtoken.models import Token
 
 from redditors.models import User, UserSubMembership
 from subs.models import Sub
 from posts.models import Post
 from comments.models import Comment
+from votes.models import CommentVote, PostVote
 
 class UserORMTests(TestCase):
     """Tests of user creation within django, i.e. no client requests"""
@@ -119,6 +125,7 @@ class UserProfileTest(APITestCase):
     Can get a user profile.
     """
     def setUp(self):
+        cache.clear()
         self.user_data = {
             "username": "testUsername",
             'email': "test@gmail.com",
@@ -197,6 +204,47 @@ class UserProfileTest(APITestCase):
         self.assertEqual(comment_2_data["post"]["poster"], self.user.pk)
 
 
+    def test_compact_comments(self):
+        """
+        With compact=true the comments only contain a summary of their post
+        """
+        response = self.client.get(self.user_profile_url, {"compact": "true"})
+        self.assertEqual(
+            [comment["post"] for comment in response.data["comments"]],
+            [{
+                "pk": self.post.pk,
+                "title": "test post title",
+                "subreddit_title": "test subreddit",
+            }] * 2
+        )
+        self.assertEqual(
+            response.data["posts"][0]["body"],
+            self.post_data["body"]
+        )
+        
+    def test_profile_vote_states(self):
+        """
+        An authenticated viewer sees their own votes on the profile's
+        posts and comments, including the posts nested in the comments
+        """
+        viewer = User.objects.create(**self.user_data_2)
+        PostVote.objects.create(post=self.post, user=viewer, vote_type=1)
+        CommentVote.objects.create(
+            comment=self.comment_2,
+            user=viewer,
+            vote_type=-1
+        )
+        self.client.force_login(viewer)
+        response = self.client.get(self.user_profile_url)
+        self.assertEqual(response.data["posts"][0]["vote_state"], 1)
+        comment_vote_states = {
+            c["pk"]: c["vote_state"] for c in response.data["comments"]
+        }
+        self.assertEqual(comment_vote_states[self.comment.pk], 0)
+        self.assertEqual(comment_vote_states[self.comment_2.pk], -1)
+        for comment_data in response.data["comments"]:
+            self.assertEqual(comment_data["post"]["vote_state"], 1)
+        
     def test_user_profile_name_error(self):
         """When given a non-existant username, returns a 404"""
         response = self.client.get(reverse(
@@ -223,3 +271,163 @@ class SeedUsersCommandTests(TestCase):
         expected_out = "Creating 10 new users"
         self.assertIn(expected_out, out.getvalue())
         self.assertEqual(User.objects.count(), 10)
+
+class UserProfileSectionTests(APITestCase):
+    """
+    The cached profile header and the cursor paginated lists of the
+    user's posts and comments
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="test_username",
+            email="test@gmail.com",
+            password="test_password"
+        )
+        self.viewer = User.objects.create(
+            username="test_viewer",
+            email="test_viewer@gmail.com",
+            password="test_password"
+        )
+        self.subreddit = Sub.objects.create(title="test_subreddit")
+        UserSubMembership.objects.create(user=self.user, sub=self.subreddit)
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(
+                poster=self.user,
+                subreddit=self.subreddit,
+                title="post_{}".format(i),
+                created=now - timedelta(hours=i)
+            )
+            for i in range(5)
+        ]
+        self.comments = [
+            Comment.objects.create(
+                poster=self.user,
+                post=self.posts[i % 2],
+                body="comment_{}".format(i),
+                created=now - timedelta(hours=i)
+            )
+            for i in range(5)
+        ]
+        self.profile_url = reverse(
+            'user-profile',
+            kwargs={'username': self.user.username}
+        )
+        self.posts_url = reverse(
+            'user-profile-posts',
+            kwargs={'username': self.user.username}
+        )
+        self.comments_url = reverse(
+            'user-profile-comments',
+            kwargs={'username': self.user.username}
+        )
+        
+    def read_all(self, url, params, key):
+        items = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            items.extend(item[key] for item in response.data["results"])
+            url, params = response.data["next"], None
+        return items
+        
+    def test_paginated_sections(self):
+        self.assertEqual(
+            self.read_all(self.posts_url, {"limit": 2}, "title"),
+            ["post_{}".format(i) for i in range(5)]
+        )
+        self.assertEqual(
+            self.read_all(self.comments_url, {"limit": 2}, "body"),
+            ["comment_{}".format(i) for i in range(5)]
+        )
+        
+    def test_profile_first_pages(self):
+        response = self.client.get(self.profile_url, {"limit": 2})
+        self.assertEqual(response.data["username"], self.user.username)
+        self.assertEqual(response.data["subs"], [self.subreddit.pk])
+        self.assertEqual(
+            [post["title"] for post in response.data["posts"]],
+            ["post_0", "post_1"]
+        )
+        self.assertEqual(
+            [comment["body"] for comment in response.data["comments"]],
+            ["comment_0", "comment_1"]
+        )
+        # The next links continue in the sections
+        response = self.client.get(response.data["comments_next"])
+        self.assertEqual(
+            [comment["body"] for comment in response.data["results"]],
+            ["comment_2", "comment_3"]
+        )
+        
+    def test_profile_next_to_the_end(self):
+        """
+        The first pages on the profile followed by their next links return
+        every post and comment exactly once, in order
+        """
+        response = self.client.get(self.profile_url, {"limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [post["title"] for post in response.data["posts"]]
+        titles += self.read_all(response.data["posts_next"], None, "title")
+        self.assertEqual(titles, ["post_{}".format(i) for i in range(5)])
+        bodies = [comment["body"] for comment in response.data["comments"]]
+        bodies += self.read_all(response.data["comments_next"], None, "body")
+        self.assertEqual(bodies, ["comment_{}".format(i) for i in range(5)])
+        
+    def test_cached_header(self):
+        self.client.get(self.profile_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.profile_url)
+        # Only the posts and the comments
+        self.assertEqual(len(queries.captured_queries), 2)
+        
+        other_subreddit = Sub.objects.create(title="other_subreddit")
+        UserSubMembership.objects.create(user=self.user, sub=other_subreddit)
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.data["subs"], [self.subreddit.pk])
+        cache.clear()
+        response = self.client.get(self.profile_url)
+        self.assertEqual(
+            sorted(response.data["subs"]),
+            [self.subreddit.pk, other_subreddit.pk]
+        )
+        
+    def test_vote_states(self):
+        PostVote.objects.create(
+            post=self.posts[1],
+            user=self.viewer,
+            vote_type=1
+        )
+        CommentVote.objects.create(
+            comment=self.comments[0],
+            user=self.viewer,
+            vote_type=-1
+        )
+        self.client.force_login(self.viewer)
+        response = self.client.get(self.posts_url)
+        self.assertEqual(
+            [post["vote_state"] for post in response.data["results"]],
+            [0, 1, 0, 0, 0]
+        )
+        response = self.client.get(self.comments_url)
+        self.assertEqual(response.data["results"][0]["vote_state"], -1)
+        self.assertEqual(response.data["results"][1]["post"]["vote_state"], 1)
+        
+        response = self.client.get(self.comments_url, {"compact": "true"})
+        self.assertEqual(
+            response.data["results"][1]["post"],
+            {
+                "pk": self.posts[1].pk,
+                "title": "post_1",
+                "subreddit_title": "test_subreddit",
+            }
+        )
+        
+    def test_unknown_user(self):
+        for url_name in ('user-profile-posts', 'user-profile-comments'):
+            response = self.client.get(reverse(
+                url_name,
+                kwargs={'username': 'not_a_name'}
+            ))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
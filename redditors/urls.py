@@ -14,7 +14,17 @@ urlpatterns = [
         'profile/<slug:username>/',
         views.UserProfileDetailView.as_view(),
         name='user-profile'
-    )
+    ),
+    path(
+        'profile/<slug:username>/posts/',
+        views.UserPostListView.as_view(),
+        name='user-profile-posts'
+    ),
+    path(
+        'profile/<slug:username>/comments/',
+        views.UserCommentListView.as_view(),
+        name='user-profile-comments'
+    ),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from rest_framework import generics, permissions, renderers, status
+from rest_framework import exceptions, generics, permissions, renderers, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import (
@@ -8,19 +8,30 @@ from rest_framework.permissions import (
 )
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
+from django.urls import reverse
 
 from .models import User
 from .serializers import (
     UserSerializer,
     UserCreateSerializer,
     UserUpdateSerializer,
-    UserProfileSerializer
 )
+from .profiles import profile_header
 from subs.serializers import SubSerializer
 from redditors.permissions import IsLoggedInOrReadOnly
+from core.mixins import StreamingListMixin
+from comments.models import Comment
+from comments.serializers import (
+    CommentSerializer, CompactCommentSerializer, wants_compact_comments
+)
+from posts.models import Post
+from posts.pagination import PostCursorPagination
+from posts.serializers import PostSerializer
+from votes.mixins import VoteStateMixin
+from votes.models import CommentVote, PostVote
 
-class UserListView(generics.ListAPIView):
-    queryset = User.objects.all()
+class UserListView(StreamingListMixin, generics.ListAPIView):
+    queryset = User.objects.prefetch_related('subs', 'moderated_subs')
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
     
@@ -37,11 +48,114 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
         if  self.request.method.lower() == "patch":
             return UserUpdateSerializer
         return UserSerializer
+    
+def profile_header_or_404(username):
+    try:
+        return profile_header(username)
+    except User.DoesNotExist:
+        raise exceptions.NotFound()
+    
+class UserProfileSectionMixin(VoteStateMixin):
+    """
+    For the lists of a user's posts and comments on their profile, newest
+    first and cursor paginated. The user is found from the cached profile
+    header, see redditors.profiles.
+    """
+    pagination_class = PostCursorPagination
+    permission_classes = (IsAuthenticatedOrReadOnly, )
+    ordering = ('-created', '-pk')
+    
+    def get_user_pk(self):
+        return profile_header_or_404(self.kwargs['username'])['pk']
+    
+class UserPostListView(UserProfileSectionMixin, generics.ListAPIView):
+    serializer_class = PostSerializer
+    vote_model = PostVote
+    vote_states_context_key = 'post_vote_states'
+    
+    def get_queryset(self):
+        return Post.objects.feed().filter(
+            poster_id=self.get_user_pk()
+        ).order_by(*self.ordering)
+    
+class UserCommentListView(UserProfileSectionMixin, generics.ListAPIView):
+    """
+    With compact=true the posts of the comments are only summed up, see
+    CompactCommentSerializer.
+    """
+    vote_model = CommentVote
+    vote_states_context_key = 'comment_vote_states'
+    
+    def is_compact(self):
+        return wants_compact_comments(self.request)
+    
+    def get_serializer_class(self):
+        if self.is_compact():
+            return CompactCommentSerializer
+        return CommentSerializer
+    
+    def get_queryset(self):
+        comments = Comment.objects.filter(
+            poster_id=self.get_user_pk()
+        ).order_by(*self.ordering)
+        if self.is_compact():
+            return CompactCommentSerializer.compact_queryset(comments)
+        return comments.select_related('post__poster', 'post__subreddit')
+    
+    def get_serializer(self, *args, **kwargs):
+        """
+        The full posts nested in the comments get the user's votes from
+        one query as well.
+        """
+        serializer = super().get_serializer(*args, **kwargs)
+        if kwargs.get('many') and args and not self.is_compact():
+            serializer.context['post_vote_states'] = (
+                PostVote.objects.vote_states(
+                    self.request.user,
+                    [comment.post_id for comment in args[0]]
+                )
+            )
+        return serializer
+    
 class UserProfileDetailView(generics.RetrieveAPIView):
-    queryset = User.objects.all()
+    """
+    The profile header, cached for every reader, with the first page of
+    the user's posts and of their comments. The following pages are read
+    from UserPostListView and UserCommentListView by following the
+    'posts_next' and 'comments_next' links.
+    """
     permission_classes = (IsAuthenticatedOrReadOnly, )
-    lookup_field = 'username'
-    serializer_class = UserProfileSerializer
+    # (field, view, url name) of the paginated sections of the profile
+    sections = (
+        ('posts', UserPostListView, 'user-profile-posts'),
+        ('comments', UserCommentListView, 'user-profile-comments'),
+    )
+    
+    def get_section_url(self, url_name):
+        """
+        The url of a section with the same query parameters, e.g. limit
+        and compact.
+        """
+        url = reverse(url_name, kwargs={'username': self.kwargs['username']})
+        query = self.request.META.get('QUERY_STRING')
+        if query:
+            url = '{}?{}'.format(url, query)
+        return self.request.build_absolute_uri(url)
+    
+    def retrieve(self, request, *args, **kwargs):
+        data = dict(profile_header_or_404(kwargs['username']))
+        for field, view_class, url_name in self.sections:
+            view = view_class(
+                request=request,
+                args=args,
+                kwargs=kwargs,
+                format_kwarg=self.format_kwarg
+            )
+            page = view.paginate_queryset(view.get_queryset())
+            data[field] = view.get_serializer(page, many=True).data
+            view.paginator.base_url = self.get_section_url(url_name)
+            data[field + '_next'] = view.paginator.get_next_link()
+        return Response(data)
     
 class UserCreateView(generics.CreateAPIView):
     queryset = User.objects.all()
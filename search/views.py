@@ -8,6 +8,7 @@ from subs.models import Sub
 from subs.serializers import SubSerializer
 from redditors.models import User
 from redditors.serializers import UserSerializer
+from votes.models import PostVote
 
 
 class SearchView(APIView):
@@ -28,10 +29,19 @@ class SearchView(APIView):
             'request': request
         }
             
+        post_queryset = Post.objects.feed().filter(
+            title__icontains=search_term
+        )
         posts = PostSerializer(
-            Post.objects.filter(title__icontains=search_term),
+            post_queryset,
             many=True,
-            context=serializer_context
+            context={
+                **serializer_context,
+                'post_vote_states': PostVote.objects.vote_states(
+                    request.user,
+                    post_queryset.values('pk')
+                ),
+            }
         )
         users = UserSerializer(
             User.objects.filter(username__icontains=search_term),
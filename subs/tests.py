@@ -1,10 +1,12 @@
 from django.test import TestCase, Client
-from django.db import transaction
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework import status
 from django.urls import reverse
 from django.core.management import call_command
 from io import StringIO
+import json
 
 from subs.models import Sub
 from redditors.models import User, UserSubMembership
@@ -96,6 +98,49 @@ class SubredditTest(APITestCase):
         self.assertIn(self.user1.pk, response.data["moderators"])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
+    def test_streamed_subreddit_list(self):
+        """
+        The streamed list has the same subreddits as the regular one
+        """
+        for i in range(3):
+            Sub.objects.create(title="test_subreddit_{}".format(i))
+        response = self.client.get(self.create_subreddit_url)
+        streamed = self.client.get(
+            self.create_subreddit_url,
+            {"stream": "true"}
+        )
+        self.assertEqual(
+            json.loads(b"".join(streamed.streaming_content).decode("utf-8")),
+            json.loads(response.content.decode("utf-8"))
+        )
+        
+    def test_streamed_subreddit_list_queries(self):
+        """
+        The members and moderators are prefetched for every chunk rather
+        than queried for every subreddit
+        """
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                streamed = self.client.get(
+                    self.create_subreddit_url,
+                    {"stream": "true"}
+                )
+                data = json.loads(
+                    b"".join(streamed.streaming_content).decode("utf-8")
+                )
+            return data, len(queries.captured_queries)
+        
+        for i in range(2):
+            sub = Sub.objects.create(title="test_subreddit_{}".format(i))
+            sub.moderators.add(self.user1)
+        _, few = count_queries()
+        for i in range(2, 8):
+            Sub.objects.create(title="test_subreddit_{}".format(i))
+        data, many = count_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(data[0]["moderators"], [self.user1.pk])
+        
         
 class SubredditSubscriptionTests(APITestCase):
     def setUp(self):
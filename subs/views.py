@@ -11,10 +11,11 @@ from .models import Sub
 from .serializers import SubSerializer, SubredditSubscribeSerializer
 from redditors.models import UserSubMembership
 from posts.models import Post
+from core.mixins import StreamingListMixin
 
 
-class SubListView(generics.ListCreateAPIView):
-    queryset=Sub.objects.all()
+class SubListView(StreamingListMixin, generics.ListCreateAPIView):
+    queryset=Sub.objects.prefetch_related('moderators', 'members')
     serializer_class=SubSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     
@@ -61,16 +61,25 @@ class AppState:
     def get_posts(self):
         """
         Read the posts that are currently in the database and
-        store them in the self.posts list
+        store them in the self.posts list. The post list is paginated,
+        follow the 'next' links one page at a time.
         """
         print("\nReading posts currently in database")
         print("---------------------------------------")
     
-        res = requests.get(API_POST_URL)
-        self.posts.extend(res.json())
+        url = API_POST_URL
+        params = {'limit': 100}
+        while url:
+            res = requests.get(url, params=params)
+            res.raise_for_status()
+            page = res.json()
+            self.posts.extend(page['results'])
+            # The next link already has the query parameters
+            url = page['next']
+            params = None
             
         print("{} posts read from database successfully".format(
-            len(res.json()))
+            len(self.posts))
         )
     def get_comments(self):
         """
@@ -8,6 +8,8 @@ API_USER_CREATE_URL = API_USER_URL + 'create/'
 API_USER_LOGIN_URL = API_USER_URL + 'login/'
 
 API_COMMENT_VOTE_URL = API_COMMENT_URL + 'vote/'
+API_VOTE_URL = API_ROOT_URL + 'vote/'
+API_VOTE_BULK_URL = API_VOTE_URL + 'bulk/'
 
 
 
@@ -8,7 +8,7 @@ import random
 
 from constants import (API_SUB_URL, API_USER_CREATE_URL, API_USER_LOGIN_URL,
                        API_USER_URL, API_SUB_SUBSCRIBE_URL_, API_POST_URL,
-                       API_COMMENT_URL, API_COMMENT_VOTE_URL,)
+                       API_COMMENT_URL, API_VOTE_BULK_URL,)
 
 """
 TODO: Break this monster into smaller classes. I think one logical
@@ -392,25 +392,32 @@ class Populate:
             current_to_add = n_to_add[idx]
             vote_types = [1]*current_to_add
             vote_types[0:int(current_to_add/3)] = [-1]*int(current_to_add/3)
+            # All of a user's votes go in one bulk request
+            votes = []
             for vote_number in range(current_to_add):
                 c_idx = np.random.choice(len(self.comments))
                 comment_pk = self.comments[c_idx][0]
-                data = {
+                votes.append({
                     'vote_type' : vote_types[vote_number],
-                    'comment' : comment_pk,
-                }
-                try:
-                    res = requests.post(
-                        API_COMMENT_VOTE_URL,
-                        headers=header,
-                        json=data
-                    )
-                    res.raise_for_status()
-                    n_comment_votes_added +=1
-                except requests.HTTPError as e:
-                    print(e)
-                    print(res.json())
-                    exit()
+                    'item_fn' : 't1_{}'.format(comment_pk),
+                })
+            if not votes:
+                continue
+            try:
+                res = requests.post(
+                    API_VOTE_BULK_URL,
+                    headers=header,
+                    json={'votes': votes}
+                )
+                res.raise_for_status()
+                n_comment_votes_added += len([
+                    vote for vote in res.json()['votes']
+                    if 'error' not in vote
+                ])
+            except requests.HTTPError as e:
+                print(e)
+                print(res.json())
+                exit()
         print("{} comment votes added".format(n_comment_votes_added))
         
 if __name__ == '__main__':
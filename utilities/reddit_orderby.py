@@ -1,4 +1,43 @@
-ordering = {
-    'popular': 'upvotes',
-    'new' : '-created',
-}
+"""
+Rankings used to order posts, based on the algorithms in the open source
+reddit code. Both only depend on a post's vote counts and creation date so
+they are computed when a post is saved or voted on and stored in the db,
+that way every ordering is an index scan.
+"""
+from datetime import datetime
+from math import log10
+
+from django.utils import timezone
+
+# Dates are measured from this point, anything will do since only the
+# differences between posts matter. This is the reddit value.
+EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=timezone.utc)
+
+# The number of seconds that a post needs to be newer to be worth the
+# same as ten times the score
+HOT_DECAY_SECONDS = 45000
+
+def hot(score, created):
+    """
+    Log of the score plus a term that grows linearly with the creation
+    date. Newer posts need exponentially fewer votes to rank as high as
+    older ones, so the ranking decays without ever being recomputed.
+    """
+    order = log10(max(abs(score), 1))
+    sign = (score > 0) - (score < 0)
+    seconds = (created - EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+def controversy(upvote_count, downvote_count):
+    """
+    High for posts with many votes that are evenly split between
+    upvotes and downvotes, zero if either is missing.
+    """
+    if upvote_count <= 0 or downvote_count <= 0:
+        return 0
+    magnitude = upvote_count + downvote_count
+    if upvote_count > downvote_count:
+        balance = downvote_count / upvote_count
+    else:
+        balance = upvote_count / downvote_count
+    return magnitude ** balance
@@ -0,0 +1,248 @@
+"""
+Optional write-behind buffer for votes, see the VOTE_BUFFER_* settings.
+
+Instead of writing every vote to the db, the vote endpoint records the
+resulting vote_type in a buffer keyed by (vote model, user, item). Repeated
+votes of a user on the same item just replace the buffered one, so a burst
+of toggles costs a single write. Every VOTE_BUFFER_FLUSH_MS a background
+thread writes the buffered votes with VoteManager.cast_many, which applies
+the aggregated counter and karma changes of the whole batch at once.
+
+The default buffer lives in the memory of the process, VOTE_BUFFER_CLASS
+can point to another store with the same methods, its toggle has to be
+atomic. Buffered votes are lost if the process dies before they are
+flushed. A user's buffered votes, including the ones being flushed until
+the flush commits, are overlaid on their vote_state (see
+VoteManager.vote_states), the scores of the items only change once the
+votes are flushed.
+"""
+import atexit
+import logging
+import threading
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+class LocalVoteBuffer:
+    """
+    Buffered votes in a dict of
+    {vote model label: {user_pk: {item_pk: vote_type}}}
+
+    drain moves the pending votes to in_flight, where they are still read
+    until the flush has committed them (done) or given them back
+    (restore).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.in_flight = {}
+
+    def get(self, vote_model, user_pk):
+        """
+        {item_pk: vote_type} of user's buffered votes
+        """
+        label = vote_model._meta.label
+        with self.lock:
+            votes = dict(self.in_flight.get(label, {}).get(user_pk, {}))
+            votes.update(self.pending.get(label, {}).get(user_pk, {}))
+            return votes
+
+    def toggle(self, vote_model, user_pk, item_pk, vote_type,
+               stored_vote_type=None):
+        """
+        Buffer the vote, toggled off if it repeats the buffered vote or,
+        without one, stored_vote_type. The buffered vote is read and
+        replaced under the lock so concurrent toggles of the same vote
+        each see the other's result. Returns the buffered vote_type, or
+        None if there is no buffered vote and stored_vote_type wasn't
+        given, nothing is buffered then.
+        """
+        with self.lock:
+            label = vote_model._meta.label
+            current = self.pending.get(label, {}).get(user_pk, {}).get(
+                item_pk,
+                self.in_flight.get(label, {}).get(user_pk, {}).get(
+                    item_pk,
+                    stored_vote_type
+                )
+            )
+            if current is None:
+                return None
+            if current == vote_type:
+                vote_type = vote_model.NO_VOTE
+            users = self.pending.setdefault(label, {})
+            users.setdefault(user_pk, {})[item_pk] = vote_type
+            return vote_type
+
+    def _discard_in_flight(self, label, votes):
+        # Unless a later drain has put another vote in flight
+        users = self.in_flight.get(label, {})
+        for (user_pk, item_pk), vote_type in votes.items():
+            items = users.get(user_pk, {})
+            if items.get(item_pk) == vote_type:
+                del items[item_pk]
+                if not items:
+                    del users[user_pk]
+        if not users:
+            self.in_flight.pop(label, None)
+
+    def done(self, label, votes):
+        """
+        Forget votes taken by drain, {(user_pk, item_pk): vote_type}, once
+        they are committed to the db.
+        """
+        with self.lock:
+            self._discard_in_flight(label, votes)
+
+    def restore(self, label, votes):
+        """
+        Put back votes taken by drain, {(user_pk, item_pk): vote_type},
+        unless the user has voted on the item again in the meantime.
+        """
+        with self.lock:
+            self._discard_in_flight(label, votes)
+            users = self.pending.setdefault(label, {})
+            for (user_pk, item_pk), vote_type in votes.items():
+                users.setdefault(user_pk, {}).setdefault(item_pk, vote_type)
+
+    def drain(self):
+        """
+        Take everything out of the buffer as
+        {vote model label: {(user_pk, item_pk): vote_type}} and keep it in
+        flight, see done and restore.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for label, users in pending.items():
+                in_flight = self.in_flight.setdefault(label, {})
+                for user_pk, items in users.items():
+                    in_flight.setdefault(user_pk, {}).update(items)
+        return {
+            label: {
+                (user_pk, item_pk): vote_type
+                for user_pk, items in users.items()
+                for item_pk, vote_type in items.items()
+            }
+            for label, users in pending.items()
+        }
+
+_buffer = None
+_flusher = None
+_lock = threading.Lock()
+
+def get_vote_buffer():
+    global _buffer
+    if _buffer is None:
+        with _lock:
+            if _buffer is None:
+                _buffer = import_string(settings.VOTE_BUFFER_CLASS)()
+    return _buffer
+
+def buffer_vote(vote_model, user, item_pk, vote_type):
+    """
+    Buffer user's vote on the item with item_pk and return the resulting
+    vote_type, toggling against the buffered or else the stored vote like
+    VoteManager.cast. Raises the item model's DoesNotExist if there is no
+    such item.
+    """
+    buffer = get_vote_buffer()
+    buffered = buffer.toggle(vote_model, user.pk, item_pk, vote_type)
+    if buffered is None:
+        old_votes = vote_model.objects.filter(
+            user_id=user.pk,
+            **{vote_model.item_field: OuterRef('pk')}
+        ).values('vote_type')[:1]
+        stored_vote_type = vote_model.item_model()._base_manager.filter(
+            pk=item_pk
+        ).annotate(
+            old_vote_type=Subquery(old_votes)
+        ).values_list('old_vote_type', flat=True).get()
+        if stored_vote_type is None:
+            stored_vote_type = vote_model.NO_VOTE
+        # A vote buffered in the meantime takes precedence
+        buffered = buffer.toggle(
+            vote_model,
+            user.pk,
+            item_pk,
+            vote_type,
+            stored_vote_type
+        )
+    start_flusher()
+    return buffered
+
+def flush_vote_buffer():
+    """
+    Write all of the buffered votes to the db, in batches of
+    VOTE_BUFFER_FLUSH_BATCH votes. Returns the number of votes written.
+    """
+    buffer = get_vote_buffer()
+    batch_size = settings.VOTE_BUFFER_FLUSH_BATCH
+    n_votes = 0
+    pending = list(buffer.drain().items())
+    for index, (label, votes) in enumerate(pending):
+        vote_model = apps.get_model(label)
+        keys = list(votes)
+        for start in range(0, len(keys), batch_size):
+            batch = {
+                key: votes[key] for key in keys[start:start + batch_size]
+            }
+            try:
+                with transaction.atomic():
+                    vote_model.objects.cast_many(
+                        [(user_pk, item_pk, vote_type)
+                        for (user_pk, item_pk), vote_type in batch.items()],
+                        toggle=False
+                    )
+                    # Read in flight until then
+                    transaction.on_commit(
+                        partial(buffer.done, label, batch)
+                    )
+            except Exception:
+                buffer.restore(label, {
+                    key: votes[key] for key in keys[start:]
+                })
+                for later_label, later_votes in pending[index + 1:]:
+                    buffer.restore(later_label, later_votes)
+                raise
+            n_votes += len(batch)
+    return n_votes
+
+class VoteFlusher(threading.Thread):
+    """
+    Flushes the vote buffer every interval seconds
+    """
+    def __init__(self, interval):
+        super().__init__(name='vote-buffer-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                flush_vote_buffer()
+            except Exception:
+                logger.exception("Flushing the vote buffer failed")
+            finally:
+                # this thread's own connection
+                connection.close()
+
+def start_flusher():
+    """
+    Start the flusher thread of this process, once. With
+    VOTE_BUFFER_FLUSH_MS set to None nothing is flushed automatically and
+    flush_vote_buffer has to be called.
+    """
+    global _flusher
+    if _flusher is not None or not settings.VOTE_BUFFER_FLUSH_MS:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = VoteFlusher(settings.VOTE_BUFFER_FLUSH_MS / 1000)
+            _flusher.start()
+            atexit.register(flush_vote_buffer)
@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (
+    Count, F, IntegerField, OuterRef, Q, Subquery, Value
+)
+from django.db.models.functions import Coalesce
+
+class CounterRebuildCommandBase(BaseCommand):
+    """
+    Rebuild, or just verify, the denormalized score counters of the items
+    (posts or comments) voted on through vote_model.
+    """
+    vote_model = None
+    
+    # How many mismatched items are listed by --verify
+    max_reported = 20
+    
+    @property
+    def item_field(self):
+        return self.vote_model.item_field
+    
+    @property
+    def item_model(self):
+        return self.vote_model._meta.get_field(self.item_field).related_model
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help=('Only compare the stored counters with the votes and '
+                'report any differences, nothing is written')
+        )
+    
+    def vote_count(self, vote_type):
+        """
+        Correlated subquery counting the votes of vote_type on an item
+        """
+        votes = self.vote_model.objects.filter(
+            **{self.item_field: OuterRef('pk'), 'vote_type': vote_type}
+        ).order_by().values(self.item_field).annotate(count=Count('pk'))
+        return Coalesce(
+            Subquery(votes.values('count')),
+            Value(0),
+            output_field=IntegerField()
+        )
+    
+    def rebuild(self):
+        items = self.item_model._base_manager.all()
+        with transaction.atomic():
+            n_items = items.update(
+                upvote_count=self.vote_count(self.vote_model.UPVOTE),
+                downvote_count=self.vote_count(self.vote_model.DOWNVOTE),
+            )
+            items.update(score=F('upvote_count') - F('downvote_count'))
+        self.stdout.write("Rebuilt the vote counters of {} {}".format(
+            n_items,
+            self.item_model._meta.verbose_name_plural
+        ))
+    
+    def verify(self):
+        mismatched = self.item_model._base_manager.annotate(
+            actual_upvote_count=self.vote_count(self.vote_model.UPVOTE),
+            actual_downvote_count=self.vote_count(self.vote_model.DOWNVOTE),
+        ).filter(
+            ~Q(upvote_count=F('actual_upvote_count'))
+            | ~Q(downvote_count=F('actual_downvote_count'))
+            | ~Q(score=(
+                F('actual_upvote_count') - F('actual_downvote_count')
+            ))
+        ).order_by('pk')
+        n_mismatched = mismatched.count()
+        self.stdout.write("{} {} with counters that don't match the votes".format(
+            n_mismatched,
+            self.item_model._meta.verbose_name_plural
+        ))
+        for item in mismatched[:self.max_reported]:
+            self.stdout.write((
+                "\t-- pk: {}, stored: {} ({}/{}), votes: {} ({}/{})"
+            ).format(
+                item.pk,
+                item.score, item.upvote_count, item.downvote_count,
+                item.actual_upvote_count - item.actual_downvote_count,
+                item.actual_upvote_count, item.actual_downvote_count,
+            ))
+        return n_mismatched
+    
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
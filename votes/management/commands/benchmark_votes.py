@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from core.management.commands._base_benchmark_command import (
+    BenchmarkCommandBase
+)
+from posts.models import Post
+from redditors.models import User
+from subs.models import Sub
+from votes.models import PostVote
+
+class Command(BenchmarkCommandBase):
+    help = (
+        "Benchmark the votes per second of the vote write path against "
+        "saving the votes through the model, as the seed commands do. "
+        "Nothing is left in the database."
+    )
+    
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--votes',
+            type=int,
+            default=1000,
+            help='Number of votes cast in each run'
+        )
+    
+    def setup(self, **options):
+        subreddit = Sub.objects.create(title='benchmark_votes')
+        User.objects.bulk_create([
+            User(
+                username='benchmark_voter_{}'.format(i),
+                email='benchmark_voter_{}@example.com'.format(i),
+            )
+            for i in range(options['votes'])
+        ])
+        self.voters = list(User.objects.filter(
+            username__startswith='benchmark_voter_'
+        ))
+        self.post = Post.objects.create(
+            poster=self.voters[0],
+            subreddit=subreddit,
+            title='benchmark_post'
+        )
+    
+    def run(self, **options):
+        def model_save():
+            """
+            What the vote serializer used to do for every vote
+            """
+            for voter in self.voters:
+                with transaction.atomic():
+                    vote, created = PostVote.objects.select_for_update(
+                    ).get_or_create(
+                        post=self.post,
+                        user=voter,
+                        defaults={'vote_type': 1}
+                    )
+                    if not created:
+                        vote.vote_type = 0 if vote.vote_type == 1 else 1
+                        vote.save()
+        
+        def cast():
+            for voter in self.voters:
+                PostVote.objects.cast(voter, self.post.pk, 1)
+        
+        for label, fn in (('model save', model_save), ('cast', cast)):
+            seconds, _, _ = self.measure(label, fn)
+            self.stdout.write("{:<40} {:>9.0f} votes/s".format(
+                '', len(self.voters) / seconds
+            ))
@@ -0,0 +1,12 @@
+from votes.management.commands._base_counter_command import (
+    CounterRebuildCommandBase
+)
+
+from votes.models import CommentVote
+
+class Command(CounterRebuildCommandBase):
+    help = (
+        "Recompute the score, upvote_count and downvote_count of every "
+        "comment from the CommentVote table"
+    )
+    vote_model = CommentVote
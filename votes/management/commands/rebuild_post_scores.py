@@ -0,0 +1,12 @@
+from votes.management.commands._base_counter_command import (
+    CounterRebuildCommandBase
+)
+
+from votes.models import PostVote
+
+class Command(CounterRebuildCommandBase):
+    help = (
+        "Recompute the score, upvote_count and downvote_count of every "
+        "post from the PostVote table"
+    )
+    vote_model = PostVote
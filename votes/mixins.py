@@ -0,0 +1,30 @@
+from django.db.models import QuerySet
+
+class VoteStateMixin:
+    """
+    For list views of votable items. Looks up the authenticated user's
+    votes on everything being serialized, e.g. the current page, with one
+    query and hands them to the serializer as a {pk: vote_type} map in the
+    context under vote_states_context_key.
+    """
+    vote_model = None
+    vote_states_context_key = None
+    
+    def get_vote_states(self, items):
+        if isinstance(items, QuerySet):
+            item_pks = items.order_by().values('pk')
+        else:
+            item_pks = [item.pk for item in items]
+        return self.vote_model.objects.vote_states(
+            self.request.user,
+            item_pks
+        )
+    
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        kwargs['context'] = self.get_serializer_context()
+        if kwargs.get('many') and args:
+            kwargs['context'][self.vote_states_context_key] = (
+                self.get_vote_states(args[0])
+            )
+        return serializer_class(*args, **kwargs)
@@ -1,8 +1,327 @@
-from django.db import models, IntegrityError
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, models, transaction, IntegrityError
+from django.db.models import (
+    Case, F, FloatField, IntegerField, OuterRef, Subquery, Value, When
+)
 
 from comments.models import Comment
 from posts.models import Post
 from redditors.models import User
+from .buffer import get_vote_buffer
+from .signals import item_votes_changed
+
+def chunked(keys, size):
+    keys = list(keys)
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+def case_values(values, output_field):
+    """
+    CASE expression picking the value for each pk from {pk: value},
+    0 for any other row.
+    """
+    return Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+        default=Value(0),
+        output_field=output_field
+    )
+
+class VoteManager(models.Manager):
+    # The denormalized counters of the voted items, see counter_deltas
+    counter_fields = ('score', 'upvote_count', 'downvote_count')
+    
+    # The fields of the voted items read while they are locked
+    item_fields = ('poster', 'created') + counter_fields
+    
+    # Items or users updated per CASE statement by cast_many, each
+    # adds a couple of query parameters per counter
+    case_chunk_size = 50
+    
+    def vote_states(self, user, item_pks):
+        """
+        Map item pk -> vote_type for all of user's votes on the items in
+        item_pks with a single query. item_pks can be a list or a values
+        queryset, which is used as a subquery. Items without a vote, or any
+        item if the user isn't authenticated, are left out of the map.
+        Votes still in the vote buffer take precedence, see votes.buffer.
+        """
+        if not (user and user.is_authenticated):
+            return {}
+        item_field = self.model.item_field
+        vote_states = dict(self.filter(
+            user_id=user.pk,
+            **{item_field + '__in': item_pks}
+        ).values_list(item_field, 'vote_type'))
+        if settings.VOTE_BUFFER_ENABLED:
+            # The user's votes that haven't been written yet, this may
+            # include items that aren't in item_pks
+            vote_states.update(get_vote_buffer().get(self.model, user.pk))
+        return vote_states
+    
+    def supports_upsert(self):
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            return True
+        return connection.vendor == 'sqlite' and (
+            connection.Database.sqlite_version_info >= (3, 24, 0)
+        )
+    
+    def upsert_sql(self):
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        return (
+            "INSERT INTO {table} ({item}, {user}, {vote_type}) "
+            "VALUES (%s, %s, %s) "
+            "ON CONFLICT ({item}, {user}) "
+            "DO UPDATE SET {vote_type} = EXCLUDED.{vote_type}"
+        ).format(
+            table=qn(self.model._meta.db_table),
+            item=qn(self.model._meta.get_field(self.model.item_field).column),
+            user=qn(self.model._meta.get_field('user').column),
+            vote_type=qn('vote_type'),
+        )
+    
+    def upsert(self, user_pk, item_pk, vote_type, exists):
+        """
+        Store vote_type as user's vote on the item, without any of the
+        counter updates in Vote.save. Where the database supports it this
+        is a single INSERT ... ON CONFLICT, otherwise exists says whether
+        to update or insert.
+        """
+        item_field = self.model.item_field
+        if self.supports_upsert():
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(self.upsert_sql(), [item_pk, user_pk, vote_type])
+        elif exists:
+            self.filter(
+                user_id=user_pk,
+                **{item_field: item_pk}
+            ).update(vote_type=vote_type)
+        else:
+            self.bulk_create([self.model(
+                user_id=user_pk,
+                vote_type=vote_type,
+                **{item_field + '_id': item_pk}
+            )])
+    
+    def upsert_many(self, votes, existing):
+        """
+        Store many votes, {(user_pk, item_pk): vote_type}, like upsert.
+        existing maps the (user_pk, item_pk) of votes that are already in
+        the db to their pk. Without an upsert the new votes are inserted
+        with one bulk_create and the existing ones updated with one UPDATE
+        per vote_type.
+        """
+        if self.supports_upsert():
+            with connections[self.db].cursor() as cursor:
+                cursor.executemany(self.upsert_sql(), [
+                    [item_pk, user_pk, vote_type]
+                    for (user_pk, item_pk), vote_type in votes.items()
+                ])
+            return
+        self.bulk_create([
+            self.model(
+                user_id=user_pk,
+                vote_type=vote_type,
+                **{self.model.item_field + '_id': item_pk}
+            )
+            for (user_pk, item_pk), vote_type in votes.items()
+            if (user_pk, item_pk) not in existing
+        ])
+        by_vote_type = defaultdict(list)
+        for key, vote_type in votes.items():
+            if key in existing:
+                by_vote_type[vote_type].append(existing[key])
+        for vote_type, pks in by_vote_type.items():
+            self.filter(pk__in=pks).update(vote_type=vote_type)
+    
+    def lock_items(self):
+        """
+        The items voted on, locked for the counter updates, with just the
+        fields those need.
+        """
+        return self.model.item_model()._base_manager.using(
+            self.db
+        ).select_for_update().only(
+            *self.item_fields,
+            self.model.item_parent_field
+        )
+    
+    def cast(self, user, item_pk, vote_type):
+        """
+        Record user's vote on the item with item_pk and return the stored
+        vote_type. Repeating the current vote toggles it off.
+        
+        This is the write path of the vote endpoint. It runs a fixed four
+        statements in one transaction: lock the item and read the old
+        vote, upsert the vote, update the item's counters (and rankings)
+        and update the poster's karma. Raises the item model's
+        DoesNotExist if there is no such item.
+        """
+        model = self.model
+        item_model = model.item_model()
+        old_votes = self.filter(
+            user_id=user.pk,
+            **{model.item_field: OuterRef('pk')}
+        ).values('vote_type')[:1]
+        with transaction.atomic(using=self.db):
+            item = self.lock_items().annotate(
+                old_vote_type=Subquery(old_votes)
+            ).get(pk=item_pk)
+            old_vote_type = item.old_vote_type
+            if old_vote_type == vote_type:
+                vote_type = model.NO_VOTE
+            self.upsert(user.pk, item.pk, vote_type, old_vote_type is not None)
+            
+            deltas = model.counter_deltas(
+                model.NO_VOTE if old_vote_type is None else old_vote_type,
+                vote_type
+            )
+            updates = {
+                field: F(field) + delta
+                for field, delta in deltas.items() if delta
+            }
+            if updates:
+                # Items that store rankings based on the counters, the
+                # item is locked so they can be computed here
+                if hasattr(item_model, 'ranking_fields'):
+                    for field, delta in deltas.items():
+                        setattr(item, field, getattr(item, field) + delta)
+                    item.set_rankings()
+                    updates.update({
+                        field: getattr(item, field)
+                        for field in item_model.ranking_fields
+                    })
+                item_model._base_manager.using(self.db).filter(
+                    pk=item.pk
+                ).update(**updates)
+                User.objects.using(self.db).filter(
+                    pk=item.poster_id
+                ).update(**model.karma_updates(deltas['score']))
+                item_votes_changed.send(sender=item_model, items=[item])
+        return vote_type
+    
+    def cast_many(self, votes, toggle=True, per_vote=False):
+        """
+        Record many votes at once, given as (user_pk, item_pk, vote_type)
+        in the order they were made. With toggle, repeating the current
+        vote toggles it off as in cast, otherwise vote_type is stored as
+        it is. Votes on items that don't exist are skipped.
+        
+        Returns {(user_pk, item_pk): stored vote_type}, or with per_vote
+        the list of the vote_type each vote resulted in, in order, None for
+        the skipped ones. A user's earlier votes on an item can differ from
+        what is finally stored for it. However many votes
+        there are this takes the same few statements: lock the items, read
+        the old votes, upsert the changed votes, then the item counters
+        and the karma are updated with CASE expressions, one UPDATE for
+        every chunk of case_chunk_size items or posters.
+        """
+        model = self.model
+        item_field = model.item_field
+        votes = list(votes)
+        if not votes:
+            return [] if per_vote else {}
+        with transaction.atomic(using=self.db):
+            items = {
+                item.pk: item
+                for item in self.lock_items().filter(
+                    pk__in={item_pk for _, item_pk, _ in votes}
+                )
+            }
+            old = {
+                (user_pk, item_pk): (pk, vote_type)
+                for pk, user_pk, item_pk, vote_type in self.filter(
+                    user_id__in={user_pk for user_pk, _, _ in votes},
+                    **{item_field + '__in': list(items)}
+                ).values_list('pk', 'user_id', item_field, 'vote_type')
+            }
+            stored = {}
+            results = []
+            for user_pk, item_pk, vote_type in votes:
+                if item_pk not in items:
+                    results.append(None)
+                    continue
+                key = (user_pk, item_pk)
+                current = stored.get(key, old.get(key, (None, None))[1])
+                if toggle and current == vote_type:
+                    vote_type = model.NO_VOTE
+                stored[key] = vote_type
+                results.append(vote_type)
+            changed = {
+                key: vote_type for key, vote_type in stored.items()
+                if key not in old or old[key][1] != vote_type
+            }
+            if not changed:
+                return results if per_vote else stored
+            self.upsert_many(
+                changed,
+                {key: pk for key, (pk, _) in old.items()}
+            )
+            
+            item_deltas = defaultdict(Counter)
+            karma_deltas = Counter()
+            for (user_pk, item_pk), vote_type in changed.items():
+                old_vote_type = old.get(
+                    (user_pk, item_pk),
+                    (None, model.NO_VOTE)
+                )[1]
+                deltas = model.counter_deltas(old_vote_type, vote_type)
+                item_deltas[item_pk].update(deltas)
+                karma_deltas[items[item_pk].poster_id] += deltas['score']
+            self.update_item_counters(items, item_deltas)
+            karma_deltas.pop(None, None)
+            for chunk in chunked(karma_deltas, self.case_chunk_size):
+                User.objects.using(self.db).filter(pk__in=chunk).update(**{
+                    field: F(field) + case_values(
+                        {pk: karma_deltas[pk] for pk in chunk},
+                        IntegerField()
+                    )
+                    for field in (model.karma_field, 'karma')
+                })
+        return results if per_vote else stored
+    
+    def update_item_counters(self, items, item_deltas):
+        """
+        Apply {item_pk: {counter: delta}} to the locked items, including
+        their rankings if they store any.
+        """
+        item_model = self.model.item_model()
+        ranking_fields = getattr(item_model, 'ranking_fields', ())
+        for chunk in chunked(item_deltas, self.case_chunk_size):
+            updates = {}
+            for field in self.counter_fields:
+                deltas = {
+                    pk: item_deltas[pk][field] for pk in chunk
+                    if item_deltas[pk][field]
+                }
+                if deltas:
+                    updates[field] = F(field) + case_values(
+                        deltas,
+                        IntegerField()
+                    )
+            for pk in chunk:
+                item = items[pk]
+                for field, delta in item_deltas[pk].items():
+                    setattr(item, field, getattr(item, field) + delta)
+                if ranking_fields:
+                    item.set_rankings()
+            for field in ranking_fields:
+                updates[field] = case_values(
+                    {pk: getattr(items[pk], field) for pk in chunk},
+                    FloatField()
+                )
+            if updates:
+                item_model._base_manager.using(self.db).filter(
+                    pk__in=chunk
+                ).update(**updates)
+        if item_deltas:
+            item_votes_changed.send(
+                sender=item_model,
+                items=[items[pk] for pk in item_deltas]
+            )
 
 class VoteAbstractBase(models.Model):
     UPVOTE = 1
@@ -19,10 +338,127 @@ class VoteAbstractBase(models.Model):
         default=NO_VOTE,
     )
     
+    objects = VoteManager()
+    
+    # Name of the foreign key to the item being voted on. That item
+    # carries the denormalized score counters that are kept up to date here.
+    item_field = None
+    
+    # The field of the poster's karma that votes on the item count towards
+    karma_field = None
+    
+    # The foreign key of the item to what the cached pages that show its
+    # score are keyed by. It is read along with the item so the receivers
+    # of item_votes_changed don't have to query for it.
+    item_parent_field = None
+    
+    # The vote_type currently stored in the db for this vote
+    _saved_vote_type = NO_VOTE
+    
     class Meta:
         abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'vote_type' in field_names:
+            instance._saved_vote_type = instance.vote_type
+        return instance
+    
+    @classmethod
+    def item_model(cls):
+        return cls._meta.get_field(cls.item_field).related_model
+    
+    @classmethod
+    def karma_updates(cls, delta):
+        """
+        The update to the poster's karma fields for a change of delta in
+        the score of one of their items.
+        """
+        return {
+            cls.karma_field: F(cls.karma_field) + delta,
+            'karma': F('karma') + delta,
+        }
+    
+    @classmethod
+    def counter_deltas(cls, old_vote_type, new_vote_type):
+        """
+        The change to each of the voted item's counters when a vote
+        goes from old_vote_type to new_vote_type.
+        """
+        return {
+            'score': new_vote_type - old_vote_type,
+            'upvote_count': (
+                (new_vote_type == cls.UPVOTE) - (old_vote_type == cls.UPVOTE)
+            ),
+            'downvote_count': (
+                (new_vote_type == cls.DOWNVOTE)
+                - (old_vote_type == cls.DOWNVOTE)
+            ),
+        }
+    
+    def update_item_counters(self, old_vote_type, new_vote_type=None):
+        """
+        Apply the change in this vote, from old_vote_type to new_vote_type
+        (by default its vote_type), to the voted item's counters with a
+        single UPDATE, using F() so concurrent votes don't clobber each
+        other.
+        """
+        if new_vote_type is None:
+            new_vote_type = self.vote_type
+        deltas = self.counter_deltas(old_vote_type, new_vote_type)
+        updates = {
+            field: F(field) + delta
+            for field, delta in deltas.items() if delta
+        }
+        if not updates:
+            return
+        item_model = self.item_model()
+        item_pk = getattr(self, self.item_field + '_id')
+        item_model._base_manager.filter(pk=item_pk).update(**updates)
+        # Items that store rankings based on the counters, i.e. posts
+        if hasattr(item_model, 'refresh_rankings'):
+            items = item_model.refresh_rankings(
+                [item_pk],
+                self.item_parent_field
+            )
+        else:
+            items = [getattr(self, self.item_field)]
+        item_votes_changed.send(sender=item_model, items=items)
+    
+    def update_poster_karma(self, old_vote_type, new_vote_type=None):
+        """
+        Apply the change in this vote, as for update_item_counters, to the
+        karma of the voted item's poster with a single UPDATE.
+        """
+        if new_vote_type is None:
+            new_vote_type = self.vote_type
+        delta = new_vote_type - old_vote_type
+        if not delta:
+            return
+        posters = self.item_model()._base_manager.filter(
+            pk=getattr(self, self.item_field + '_id')
+        ).values('poster_id')
+        User.objects.filter(pk__in=Subquery(posters)).update(
+            **self.karma_updates(delta)
+        )
+    
+    def save(self, *args, **kwargs):
+        """
+        Save the vote and the voted item's counters together.
+        """
+        old_vote_type = (
+            self.NO_VOTE if self._state.adding else self._saved_vote_type
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_item_counters(old_vote_type)
+        self._saved_vote_type = self.vote_type
 
 class CommentVote(VoteAbstractBase):
+    item_field = 'comment'
+    karma_field = 'comment_karma'
+    item_parent_field = 'post'
 
     comment = models.ForeignKey(
         Comment,
@@ -59,6 +495,10 @@ class CommentVote(VoteAbstractBase):
         unique_together = ('comment', 'user')
         
 class PostVote(VoteAbstractBase):
+    item_field = 'post'
+    karma_field = 'post_karma'
+    item_parent_field = 'subreddit'
+    
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
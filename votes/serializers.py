@@ -1,46 +1,153 @@
+from functools import partial
+
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils.translation import gettext as _
 
-from .models import CommentVote, PostVote
-from comments.models import Comment, Post
+from .buffer import buffer_vote
+from .models import VoteAbstractBase, CommentVote, PostVote
 
-class VoteSerializer(serializers.ModelSerializer):
+class VoteCastSerializer(serializers.Serializer):
+    """
+    A vote on a comment or post given by its full name, 'item_fn', i.e.
+    't1_<comment pk>' or 't2_<post pk>'. Voting the same way twice
+    toggles the vote off.
+    
+    The vote is written through VoteManager.cast, or buffered if
+    VOTE_BUFFER_ENABLED, see votes.buffer. The response is the resulting
+    vote_type and the pk of the comment or post.
+    """
+    vote_models = {
+        't1': CommentVote,
+        't2': PostVote,
+    }
+    
+    item_fn = serializers.CharField(write_only=True)
+    vote_type = serializers.ChoiceField(
+        choices=VoteAbstractBase.VOTE_CHOICES
+    )
+    
+    def validate_item_fn(self, value):
+        try:
+            self.parse_item_fn(value)
+        except (KeyError, ValueError):
+            message = _(
+                "item_fn is required and must be a 'full name', "
+                "i.e. it must begin with either 't1_' or 't2_'"
+            )
+            raise serializers.ValidationError(message)
+        return value
+    
+    @classmethod
+    def parse_item_fn(cls, item_fn):
+        """
+        The vote model and pk of the item given by a full name. Raises
+        KeyError or ValueError if it isn't one.
+        """
+        prefix, _sep, pk = item_fn.partition('_')
+        if not pk.isdigit():
+            raise ValueError(item_fn)
+        return cls.vote_models[prefix], int(pk)
+    
     def create(self, validated_data):
+        vote_model, pk = self.parse_item_fn(validated_data['item_fn'])
+        if settings.VOTE_BUFFER_ENABLED:
+            cast = partial(buffer_vote, vote_model)
+        else:
+            cast = vote_model.objects.cast
         try:
-            defaults = {'vote_type': validated_data.pop('vote_type')}
-        except KeyError:
-            raise exceptions.ValidationError("vote_type is a required field")
+            vote_type = cast(
+                validated_data['user'],
+                pk,
+                validated_data['vote_type']
+            )
+        except ObjectDoesNotExist:
+            message = _("The {} '{}' does not exist.".format(
+                vote_model.item_field,
+                validated_data['item_fn']
+            ))
+            raise serializers.ValidationError(message)
+        return {'vote_type': vote_type, vote_model.item_field: pk}
+    
+    def to_representation(self, instance):
+        return instance
+
+class BulkVoteSerializer(serializers.Serializer):
+    """
+    Many votes at once, e.g. replayed offline votes, as a list of
+    {item_fn, vote_type} under 'votes'. The entries are validated together,
+    then applied in order with one VoteManager.cast_many per item type, so
+    voting twice on the same item toggles as usual.
+    
+    The response lists the result of every entry in order, the vote_type
+    that entry resulted in or an error if the item doesn't exist.
+    """
+    max_votes = 500
+    
+    votes = VoteCastSerializer(many=True)
+    
+    def validate_votes(self, value):
+        if not value:
+            raise serializers.ValidationError(_("No votes were given."))
+        if len(value) > self.max_votes:
+            message = _("At most {} votes can be made at once.".format(
+                self.max_votes
+            ))
+            raise serializers.ValidationError(message)
+        return value
+    
+    def create(self, validated_data):
+        user = validated_data['user']
+        entries = [
+            VoteCastSerializer.parse_item_fn(entry['item_fn'])
+            + (entry['vote_type'],)
+            for entry in validated_data['votes']
+        ]
+        # The resulting vote_type of every entry, None if the item
+        # doesn't exist
+        vote_types = [None] * len(entries)
+        if settings.VOTE_BUFFER_ENABLED:
+            for index, (vote_model, pk, vote_type) in enumerate(entries):
+                try:
+                    vote_types[index] = buffer_vote(
+                        vote_model, user, pk, vote_type
+                    )
+                except ObjectDoesNotExist:
+                    pass
+        else:
+            by_model = {}
+            for index, (vote_model, pk, vote_type) in enumerate(entries):
+                by_model.setdefault(vote_model, []).append(
+                    (index, (user.pk, pk, vote_type))
+                )
+            with transaction.atomic():
+                for vote_model, indexed_votes in by_model.items():
+                    indexes, votes = zip(*indexed_votes)
+                    model_vote_types = vote_model.objects.cast_many(
+                        votes,
+                        per_vote=True
+                    )
+                    for index, vote_type in zip(indexes, model_vote_types):
+                        vote_types[index] = vote_type
         
-        vote, created = self.Meta.model.objects.get_or_create(
-            **validated_data,
-            defaults=defaults
-        )
-        # need to unvote if duplicating a previous vote
-        if not created:
-            if vote.vote_type == defaults['vote_type']:
-                vote.vote_type = 0
+        results = []
+        for entry, (vote_model, _pk, _vote_type), vote_type in zip(
+            validated_data['votes'],
+            entries,
+            vote_types
+        ):
+            result = {'item_fn': entry['item_fn']}
+            if vote_type is not None:
+                result['vote_type'] = vote_type
             else:
-                vote.vote_type = defaults['vote_type']
-            vote.save()
-        return vote
-
-class CommentVoteSerializer(VoteSerializer):
-    comment = serializers.PrimaryKeyRelatedField(
-        queryset=Comment.objects.all()
-    )
+                result['error'] = _("The {} '{}' does not exist.".format(
+                    vote_model.item_field,
+                    entry['item_fn']
+                ))
+            results.append(result)
+        return {'votes': results}
     
-    class Meta:
-        model = CommentVote
-        fields = (
-            'vote_type', 'comment',
-        )
-
-class PostVoteSerializer(VoteSerializer):
-    post = serializers.PrimaryKeyRelatedField(
-        queryset=Post.objects.all()
-    )
-
-    class Meta:
-        model = PostVote
-        fields = (
-            'vote_type', 'post',
-        )
+    def to_representation(self, instance):
+        return instance
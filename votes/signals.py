@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent by the vote model and VoteManager whenever votes change the counters
+# of the items voted on, with the item model as the sender and the items,
+# loaded with at least their item_parent_field (see VoteAbstractBase).
+# Their UPDATEs bypass the items' own post_save, so caches that hold scores
+# listen to this instead.
+item_votes_changed = Signal(providing_args=['items'])
@@ -2,12 +2,23 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework.test import APIClient
+from django.core.management import call_command
+from io import StringIO
+import threading
+from unittest import mock
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 
 from redditors.models import User, UserSubMembership
 from subs.models import Sub
 from posts.models import Post
 from comments.models import Comment
-from votes.models import CommentVote, PostVote
+from votes.models import CommentVote, PostVote, VoteManager
+from votes.buffer import (
+    LocalVoteBuffer, get_vote_buffer, flush_vote_buffer
+)
+from votes.views import VoteStateView
 
 class VoteTestBase(APITestCase):
     """
@@ -133,6 +144,579 @@ class VoteViewTests(VoteTestBase):
             self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
             self.assertEqual(class_name.objects.count(), 0)
 
+class VoteCastTests(VoteTestBase):
+    """
+    The write path of the vote endpoint, VoteManager.cast
+    """
+    def test_response(self):
+        response = self.client.post(self.vote_url, self.post_vote_data(-1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data,
+            {"vote_type": -1, "post": self.post.pk}
+        )
+        response = self.client.post(self.vote_url, self.comment_vote_data(1))
+        response = self.client.post(self.vote_url, self.comment_vote_data(1))
+        self.assertEqual(
+            response.data,
+            {"vote_type": 0, "comment": self.comment.pk}
+        )
+        
+    def test_invalid_votes(self):
+        for data in (
+            {"item_fn": "t3_{}".format(self.post.pk), "vote_type": 1},
+            {"item_fn": "t2_", "vote_type": 1},
+            {"vote_type": 1},
+            {"item_fn": "t2_{}".format(self.post.pk), "vote_type": 2},
+            {"item_fn": "t2_{}".format(self.post.pk + 1), "vote_type": 1},
+            {"item_fn": "t1_{}".format(self.comment.pk + 1), "vote_type": 1},
+        ):
+            response = self.client.post(self.vote_url, data)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
+        self.assertEqual(PostVote.objects.count(), 0)
+        self.assertEqual(CommentVote.objects.count(), 0)
+        
+    def test_fixed_statements(self):
+        """
+        Lock and read, upsert, counters and karma, inside a savepoint
+        """
+        for vote_type in (1, 1, -1, 1, 0):
+            with self.assertNumQueries(6):
+                PostVote.objects.cast(self.voter, self.post.pk, vote_type)
+        # nothing changes, so nothing to update
+        with self.assertNumQueries(4):
+            PostVote.objects.cast(self.voter, self.post.pk, 0)
+            
+    def test_without_upsert(self):
+        """
+        On databases without an upsert the vote is inserted or updated
+        """
+        with mock.patch.object(
+            VoteManager,
+            'supports_upsert',
+            return_value=False
+        ):
+            for vote_type, stored in ((1, 1), (1, 0), (-1, -1)):
+                self.assertEqual(
+                    CommentVote.objects.cast(
+                        self.voter,
+                        self.comment.pk,
+                        vote_type
+                    ),
+                    stored
+                )
+                self.assertEqual(
+                    CommentVote.objects.get().vote_type,
+                    stored
+                )
+        self.comment.refresh_from_db()
+        self.poster.refresh_from_db()
+        self.assertEqual(self.comment.score, -1)
+        self.assertEqual(self.poster.comment_karma, -1)
+        
+    def test_rankings_follow_votes(self):
+        PostVote.objects.cast(self.voter, self.post.pk, -1)
+        PostVote.objects.cast(self.poster, self.post.pk, 1)
+        self.post.refresh_from_db()
+        hot, controversy = self.post.hot, self.post.controversy
+        self.post.set_rankings()
+        self.assertEqual(
+            (hot, controversy),
+            (self.post.hot, self.post.controversy)
+        )
+        self.assertEqual(self.post.controversy, 2)
+        
+    def test_benchmark_votes_command(self):
+        out = StringIO()
+        call_command('benchmark_votes', votes=3, repeat=1, stdout=out)
+        self.assertIn("votes/s", out.getvalue())
+        self.assertFalse(Sub.objects.filter(title='benchmark_votes'))
+        
+class CastManyTests(VoteTestBase):
+    """
+    Writing a batch of votes at once with VoteManager.cast_many
+    """
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.post] + [
+            Post.objects.create(
+                title="test_post_title_{}".format(i),
+                subreddit=self.subreddit,
+                poster=self.voter
+            )
+            for i in range(3)
+        ]
+        
+    def stored_counters(self):
+        return (
+            list(Post.objects.order_by('pk').values_list(
+                'score', 'upvote_count', 'downvote_count', 'hot', 'controversy'
+            )),
+            list(User.objects.order_by('pk').values_list(
+                'karma', 'post_karma', 'comment_karma'
+            )),
+        )
+        
+    def assertConsistent(self):
+        """
+        The counters, rankings and karma match a rebuild from the votes
+        """
+        stored = self.stored_counters()
+        call_command('rebuild_post_scores', stdout=StringIO())
+        call_command('recompute_post_rankings', stdout=StringIO())
+        call_command('rebuild_karma', stdout=StringIO())
+        self.assertEqual(stored, self.stored_counters())
+        
+    def test_toggles_in_order(self):
+        post_pk = self.posts[1].pk
+        stored = PostVote.objects.cast_many([
+            (self.voter.pk, post_pk, 1),
+            (self.voter.pk, post_pk, 1),
+            (self.voter.pk, post_pk, -1),
+            (self.poster.pk, post_pk, -1),
+            (self.poster.pk, self.post.pk, 1),
+        ])
+        self.assertEqual(stored, {
+            (self.voter.pk, post_pk): -1,
+            (self.poster.pk, post_pk): -1,
+            (self.poster.pk, self.post.pk): 1,
+        })
+        stored = PostVote.objects.cast_many([
+            (self.voter.pk, post_pk, -1),
+            (self.voter.pk, self.post.pk, 1),
+        ])
+        self.assertEqual(stored, {
+            (self.voter.pk, post_pk): 0,
+            (self.voter.pk, self.post.pk): 1,
+        })
+        self.assertEqual(PostVote.objects.count(), 4)
+        self.assertConsistent()
+        
+    def test_without_toggle(self):
+        PostVote.objects.cast_many([(self.voter.pk, self.post.pk, 1)])
+        stored = PostVote.objects.cast_many(
+            [(self.voter.pk, self.post.pk, 1)],
+            toggle=False
+        )
+        self.assertEqual(stored, {(self.voter.pk, self.post.pk): 1})
+        self.assertConsistent()
+        
+    def test_missing_items_skipped(self):
+        stored = PostVote.objects.cast_many([
+            (self.voter.pk, self.post.pk, 1),
+            (self.voter.pk, 1000, 1),
+        ])
+        self.assertEqual(stored, {(self.voter.pk, self.post.pk): 1})
+        
+    def test_fixed_statements(self):
+        """
+        Savepoint, lock, old votes, upsert, counters, karma and release,
+        however many votes
+        """
+        for n_posts in (1, 4):
+            votes = [
+                (user.pk, post.pk, 1)
+                for user in (self.voter, self.poster)
+                for post in self.posts[:n_posts]
+            ]
+            with self.assertNumQueries(7):
+                PostVote.objects.cast_many(votes, toggle=False)
+            PostVote.objects.all().delete()
+            
+    def test_case_chunks_and_no_upsert(self):
+        with mock.patch.object(
+            VoteManager,
+            'supports_upsert',
+            return_value=False
+        ), mock.patch.object(VoteManager, 'case_chunk_size', 2):
+            PostVote.objects.cast_many([
+                (self.voter.pk, post.pk, -1) for post in self.posts
+            ])
+            PostVote.objects.cast_many([
+                (user.pk, post.pk, 1)
+                for user in (self.voter, self.poster)
+                for post in self.posts
+            ])
+        self.assertEqual(
+            sorted(PostVote.objects.values_list('vote_type', flat=True)),
+            [1] * 8
+        )
+        self.assertConsistent()
+        
+    def test_comment_votes(self):
+        CommentVote.objects.cast_many([
+            (self.voter.pk, self.comment.pk, -1),
+            (self.poster.pk, self.comment.pk, -1),
+        ])
+        self.comment.refresh_from_db()
+        self.poster.refresh_from_db()
+        self.assertEqual(self.comment.score, -2)
+        self.assertEqual(self.comment.downvote_count, 2)
+        self.assertEqual(self.poster.comment_karma, -2)
+        
+class BulkVoteTests(VoteTestBase):
+    """
+    Many votes with one request to /vote/bulk/
+    """
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse('vote-bulk')
+        self.post_fn = "t2_{}".format(self.post.pk)
+        self.comment_fn = "t1_{}".format(self.comment.pk)
+        
+    def test_bulk_votes(self):
+        missing_fn = "t2_{}".format(self.post.pk + 1)
+        response = self.client.post(self.bulk_url, {"votes": [
+            {"item_fn": self.post_fn, "vote_type": 1},
+            {"item_fn": self.comment_fn, "vote_type": -1},
+            {"item_fn": missing_fn, "vote_type": 1},
+            {"item_fn": self.post_fn, "vote_type": -1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["votes"][:2], [
+            {"item_fn": self.post_fn, "vote_type": 1},
+            {"item_fn": self.comment_fn, "vote_type": -1},
+        ])
+        self.assertEqual(
+            response.data["votes"][3],
+            {"item_fn": self.post_fn, "vote_type": -1}
+        )
+        self.assertEqual(response.data["votes"][2]["item_fn"], missing_fn)
+        self.assertIn("does not exist", response.data["votes"][2]["error"])
+        self.assertEqual(PostVote.objects.get().vote_type, -1)
+        self.assertEqual(CommentVote.objects.get().vote_type, -1)
+        self.post.refresh_from_db()
+        self.poster.refresh_from_db()
+        self.assertEqual(self.post.score, -1)
+        self.assertEqual(self.poster.karma, -2)
+        
+        # the same votes again toggle them off, a bare list works too
+        response = self.client.post(self.bulk_url, [
+            {"item_fn": self.post_fn, "vote_type": -1},
+            {"item_fn": self.comment_fn, "vote_type": -1},
+        ], format='json')
+        self.assertEqual(
+            [vote["vote_type"] for vote in response.data["votes"]],
+            [0, 0]
+        )
+        self.poster.refresh_from_db()
+        self.assertEqual(self.poster.karma, 0)
+        
+    def test_repeated_item(self):
+        """
+        Every entry reports its own result, not the final vote on the item
+        """
+        votes = [
+            {"item_fn": self.post_fn, "vote_type": 1},
+            {"item_fn": self.post_fn, "vote_type": 1},
+            {"item_fn": self.comment_fn, "vote_type": 1},
+            {"item_fn": self.post_fn, "vote_type": 1},
+        ]
+        for buffered in (False, True):
+            PostVote.objects.all().delete()
+            CommentVote.objects.all().delete()
+            with override_settings(
+                VOTE_BUFFER_ENABLED=buffered,
+                VOTE_BUFFER_FLUSH_MS=None
+            ), mock.patch('votes.buffer._buffer', LocalVoteBuffer()):
+                response = self.client.post(
+                    self.bulk_url,
+                    {"votes": votes},
+                    format='json'
+                )
+                self.assertEqual(
+                    [vote["vote_type"] for vote in response.data["votes"]],
+                    [1, 0, 1, 1]
+                )
+                flush_vote_buffer()
+            self.assertEqual(PostVote.objects.get().vote_type, 1)
+        
+    def test_validated_together(self):
+        response = self.client.post(self.bulk_url, {"votes": [
+            {"item_fn": self.post_fn, "vote_type": 1},
+            {"item_fn": "t5_1", "vote_type": 1},
+            {"item_fn": self.comment_fn, "vote_type": 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["votes"][0], {})
+        self.assertIn("item_fn", response.data["votes"][1])
+        self.assertIn("vote_type", response.data["votes"][2])
+        self.assertEqual(PostVote.objects.count(), 0)
+        
+        for votes in ([], [{"item_fn": self.post_fn, "vote_type": 1}] * 501):
+            response = self.client.post(
+                self.bulk_url,
+                {"votes": votes},
+                format='json'
+            )
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
+            
+    def test_fixed_statements(self):
+        """
+        The statements don't depend on the number of votes
+        """
+        posts = [
+            Post.objects.create(
+                title="test_post_title_{}".format(i),
+                subreddit=self.subreddit,
+                poster=self.poster
+            )
+            for i in range(20)
+        ]
+        for n_posts in (2, 20):
+            votes = [
+                {"item_fn": "t2_{}".format(post.pk), "vote_type": 1}
+                for post in posts[:n_posts]
+            ] + [{"item_fn": self.comment_fn, "vote_type": 1}]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.bulk_url,
+                    {"votes": votes},
+                    format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            if n_posts == 2:
+                n_queries = len(queries)
+            else:
+                self.assertEqual(len(queries), n_queries)
+            PostVote.objects.all().delete()
+            CommentVote.objects.all().delete()
+            
+    def test_unauthed(self):
+        self.client.logout()
+        response = self.client.post(self.bulk_url, {"votes": [
+            {"item_fn": self.post_fn, "vote_type": 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+class VoteStateTests(VoteTestBase):
+    """
+    Looking up the user's votes by full names at /vote/state/
+    """
+    def setUp(self):
+        super().setUp()
+        self.state_url = reverse('vote-state')
+        self.other_post = Post.objects.create(
+            title="other_post_title",
+            subreddit=self.subreddit,
+            poster=self.poster
+        )
+        self.fullnames = [
+            "t2_{}".format(self.post.pk),
+            "t1_{}".format(self.comment.pk),
+            "t2_{}".format(self.other_post.pk),
+            "t2_{}".format(self.other_post.pk + 1),
+        ]
+        PostVote.objects.cast(self.voter, self.post.pk, 1)
+        CommentVote.objects.cast(self.voter, self.comment.pk, -1)
+        PostVote.objects.cast(self.poster, self.other_post.pk, 1)
+        
+    def test_vote_states(self):
+        with self.assertNumQueries(4):
+            # session, user and one per item type
+            response = self.client.get(
+                self.state_url,
+                {"fn": ",".join(self.fullnames)}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            dict(zip(self.fullnames, [1, -1, 0, 0]))
+        )
+        
+    def test_unauthed(self):
+        self.client.logout()
+        response = self.client.get(
+            self.state_url,
+            {"fn": ",".join(self.fullnames)}
+        )
+        self.assertEqual(response.data, dict.fromkeys(self.fullnames, 0))
+        
+    def test_invalid_fullnames(self):
+        for fn in ("t3_1", "t2_", "t2_1_2", "t1_a", ",".join(
+            ["t2_1"] * (1 + VoteStateView.max_fullnames)
+        )):
+            response = self.client.get(self.state_url, {"fn": fn})
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn("fn", response.data)
+        response = self.client.get(self.state_url)
+        self.assertEqual(response.data, {})
+        
+@override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_FLUSH_MS=None)
+class VoteBufferTests(VoteTestBase):
+    """
+    Votes collected in the write-behind buffer and flushed in batches
+    """
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('votes.buffer._buffer', LocalVoteBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.post_detail_url = reverse(
+            'post-detail',
+            kwargs={"pk": self.post.pk}
+        )
+        
+    def test_buffered_until_flushed(self):
+        for vote_type in (1, 1, -1, 1):
+            response = self.client.post(
+                self.vote_url,
+                self.post_vote_data(vote_type)
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"vote_type": 1, "post": self.post.pk})
+        self.client.post(self.vote_url, self.comment_vote_data(-1))
+        self.assertEqual(PostVote.objects.count(), 0)
+        self.assertEqual(CommentVote.objects.count(), 0)
+        
+        self.assertEqual(flush_vote_buffer(), 2)
+        self.assertEqual(PostVote.objects.get().vote_type, 1)
+        self.assertEqual(CommentVote.objects.get().vote_type, -1)
+        self.post.refresh_from_db()
+        self.poster.refresh_from_db()
+        self.assertEqual(self.post.score, 1)
+        self.assertEqual(self.poster.karma, 0)
+        self.assertEqual(flush_vote_buffer(), 0)
+        
+    def test_toggle_against_stored_vote(self):
+        PostVote.objects.cast(self.voter, self.post.pk, 1)
+        response = self.client.post(self.vote_url, self.post_vote_data(1))
+        self.assertEqual(response.data["vote_type"], 0)
+        flush_vote_buffer()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.score, 0)
+        
+    def test_concurrent_toggles(self):
+        """
+        Every toggle sees the result of the previous one, none is lost
+        """
+        buffer = LocalVoteBuffer()
+        results = []
+        
+        def toggle_votes():
+            for _ in range(500):
+                results.append(buffer.toggle(
+                    PostVote,
+                    self.voter.pk,
+                    self.post.pk,
+                    PostVote.UPVOTE,
+                    PostVote.NO_VOTE
+                ))
+        
+        threads = [threading.Thread(target=toggle_votes) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(PostVote.UPVOTE), 1000)
+        self.assertEqual(results.count(PostVote.NO_VOTE), 1000)
+        self.assertEqual(
+            buffer.get(PostVote, self.voter.pk)[self.post.pk],
+            PostVote.NO_VOTE
+        )
+        # Without a buffered or stored vote nothing is buffered
+        self.assertIsNone(
+            buffer.toggle(PostVote, self.voter.pk, 0, PostVote.UPVOTE)
+        )
+        self.assertEqual(buffer.get(PostVote, self.voter.pk), {
+            self.post.pk: PostVote.NO_VOTE
+        })
+        
+    def test_read_your_writes(self):
+        self.client.post(self.vote_url, self.post_vote_data(-1))
+        response = self.client.get(self.post_detail_url)
+        self.assertEqual(response.data["vote_state"], -1)
+        response = self.client.get(reverse(
+            'sub-post-list',
+            kwargs={"sub_title": self.subreddit.title}
+        ))
+        self.assertEqual(response.data["results"][0]["vote_state"], -1)
+        response = self.client.get(
+            reverse('vote-state'),
+            {"fn": "t2_{}".format(self.post.pk)}
+        )
+        self.assertEqual(response.data, {"t2_{}".format(self.post.pk): -1})
+        
+    def test_read_your_writes_while_flushing(self):
+        """
+        Votes being flushed are still read and toggled against until the
+        flush commits
+        """
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        cast_many = VoteManager.cast_many
+        responses = []
+        
+        def vote_while_flushing(manager, votes, toggle=True):
+            response = self.client.get(self.post_detail_url)
+            self.assertEqual(response.data["vote_state"], 1)
+            responses.append(
+                self.client.post(self.vote_url, self.post_vote_data(1))
+            )
+            return cast_many(manager, votes, toggle=toggle)
+        
+        with mock.patch.object(
+            VoteManager,
+            'cast_many',
+            autospec=True,
+            side_effect=vote_while_flushing
+        ):
+            self.assertEqual(flush_vote_buffer(), 1)
+        self.assertEqual(responses[0].data["vote_type"], 0)
+        self.assertEqual(PostVote.objects.get().vote_type, 1)
+        self.assertEqual(flush_vote_buffer(), 1)
+        self.assertEqual(PostVote.objects.get().vote_type, 0)
+        
+    def test_in_flight_votes(self):
+        buffer = LocalVoteBuffer()
+        buffer.toggle(PostVote, self.voter.pk, self.post.pk, 1, 0)
+        buffer.toggle(CommentVote, self.voter.pk, self.comment.pk, 1, 0)
+        drained = buffer.drain()
+        self.assertEqual(buffer.drain(), {})
+        self.assertEqual(buffer.get(PostVote, self.voter.pk), {
+            self.post.pk: 1
+        })
+        # A vote made during the flush stays when the flush is done
+        buffer.toggle(PostVote, self.voter.pk, self.post.pk, -1)
+        buffer.done('votes.PostVote', drained['votes.PostVote'])
+        self.assertEqual(buffer.get(PostVote, self.voter.pk), {
+            self.post.pk: -1
+        })
+        buffer.restore('votes.CommentVote', drained['votes.CommentVote'])
+        self.assertEqual(buffer.in_flight, {})
+        self.assertEqual(buffer.drain(), {
+            'votes.PostVote': {(self.voter.pk, self.post.pk): -1},
+            'votes.CommentVote': {(self.voter.pk, self.comment.pk): 1},
+        })
+        
+    def test_missing_item(self):
+        response = self.client.post(self.vote_url, {
+            "item_fn": "t2_{}".format(self.post.pk + 1),
+            "vote_type": 1
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_vote_buffer().drain(), {})
+        
+    def test_failed_flush_keeps_votes(self):
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        with mock.patch.object(
+            VoteManager,
+            'cast_many',
+            side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                flush_vote_buffer()
+        self.assertEqual(flush_vote_buffer(), 1)
+        self.assertEqual(PostVote.objects.get().vote_type, 1)
+        
 class VoteKarmaAddition(VoteTestBase):
     """
     Post and comment Vote requests and their effect on the posters's
@@ -237,5 +821,211 @@ class VoteKarmaAddition(VoteTestBase):
         self.assertEqual(PostVote.objects.first().vote_type, 0)
         self.assertEqual(self.poster.karma, original_karma)
         
+    def assertKarma(self, karma, post_karma, comment_karma):
+        self.poster.refresh_from_db()
+        self.assertEqual(self.poster.karma, karma)
+        self.assertEqual(self.poster.post_karma, post_karma)
+        self.assertEqual(self.poster.comment_karma, comment_karma)
+        
+    def test_post_and_comment_karma(self):
+        """
+        Post and comment votes are counted separately, karma is the total
+        """
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        self.client.post(self.vote_url, self.comment_vote_data(-1))
+        self.assertKarma(0, 1, -1)
+        PostVote.objects.create(post=self.post, user=self.poster, vote_type=1)
+        self.assertKarma(1, 2, -1)
+        self.client.post(self.vote_url, self.comment_vote_data(1))
+        self.assertKarma(3, 2, 1)
+        
+    def test_karma_update_is_incremental(self):
+        """
+        A vote doesn't aggregate the other votes on the poster's content
+        """
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        vote = PostVote.objects.get()
+        vote.vote_type = -1
+        with self.assertNumQueries(7):
+            # savepoint, vote update, counters, rankings select and
+            # update, karma, release
+            vote.save()
+        self.assertKarma(-1, -1, 0)
+        
+    def test_deleted_votes(self):
+        """
+        Deleting votes, directly or along with their user or item, takes
+        them back out of the counters and the karma
+        """
+        other_voter = User.objects.create(
+            username="other_voter",
+            email="other_voter@gmail.com",
+            password="test_password"
+        )
+        PostVote.objects.create(post=self.post, user=self.voter, vote_type=1)
+        PostVote.objects.create(post=self.post, user=other_voter, vote_type=1)
+        CommentVote.objects.create(
+            comment=self.comment,
+            user=self.voter,
+            vote_type=-1
+        )
+        CommentVote.objects.create(
+            comment=self.comment,
+            user=other_voter,
+            vote_type=-1
+        )
+        self.assertKarma(0, 2, -2)
+        
+        other_voter.delete()
+        self.assertKarma(0, 1, -1)
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual(
+            (self.post.score, self.post.upvote_count),
+            (1, 1)
+        )
+        self.assertEqual(
+            (self.comment.score, self.comment.downvote_count),
+            (-1, 1)
+        )
+        
+        CommentVote.objects.get().delete()
+        self.assertKarma(1, 1, 0)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.score, 0)
+        
+        self.post.delete()
+        self.assertKarma(0, 0, 0)
+        
+    def test_rebuild_karma(self):
+        PostVote.objects.create(post=self.post, user=self.voter, vote_type=1)
+        CommentVote.objects.create(
+            comment=self.comment,
+            user=self.voter,
+            vote_type=-1
+        )
+        User.objects.filter(pk=self.poster.pk).update(karma=10, post_karma=10)
+        out = StringIO()
+        call_command('rebuild_karma', verify=True, stdout=out)
+        self.assertIn("1 users with karma that", out.getvalue())
+        self.assertKarma(10, 10, -1)
+        
+        out = StringIO()
+        call_command('rebuild_karma', stdout=out)
+        self.assertIn("Rebuilt the karma of 2 users", out.getvalue())
+        self.assertKarma(0, 1, -1)
+        
+        
+class PostScoreCounterTests(VoteTestBase):
+    """
+    The denormalized score counters on Post follow the votes made on it
+    """
+    def assertCounters(self, score, upvote_count, downvote_count):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.score, score)
+        self.assertEqual(self.post.upvotes, score)
+        self.assertEqual(self.post.upvote_count, upvote_count)
+        self.assertEqual(self.post.downvote_count, downvote_count)
+        
+    def test_vote_toggles(self):
+        """
+        Upvotes, downvotes and toggles back to no vote through requests
+        all keep the counters in sync
+        """
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        self.assertCounters(1, 1, 0)
+        # upvote again cancels the vote
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        self.assertCounters(0, 0, 0)
+        self.client.post(self.vote_url, self.post_vote_data(-1))
+        self.assertCounters(-1, 0, 1)
+        # straight from a downvote to an upvote
+        self.client.post(self.vote_url, self.post_vote_data(1))
+        self.assertCounters(1, 1, 0)
+        self.client.post(self.vote_url, self.post_vote_data(0))
+        self.assertCounters(0, 0, 0)
+        
+    def test_orm_votes(self):
+        """
+        Votes created and updated without a request, e.g. by the seed
+        commands, also update the counters
+        """
+        vote = PostVote.objects.create(
+            post=self.post,
+            user=self.voter,
+            vote_type=-1
+        )
+        PostVote.objects.create(post=self.post, user=self.poster, vote_type=-1)
+        self.assertCounters(-2, 0, 2)
+        vote.vote_type = 1
+        vote.save()
+        self.assertCounters(0, 1, 1)
+        
+    def test_rebuild_post_scores(self):
+        """
+        The management command recomputes the counters from the votes
+        """
+        PostVote.objects.create(post=self.post, user=self.voter, vote_type=1)
+        PostVote.objects.create(post=self.post, user=self.poster, vote_type=1)
+        Post.objects.filter(pk=self.post.pk).update(
+            score=10,
+            upvote_count=0,
+            downvote_count=10
+        )
+        out = StringIO()
+        call_command('rebuild_post_scores', stdout=out)
+        self.assertIn("Rebuilt the vote counters of 1 posts", out.getvalue())
+        self.assertCounters(2, 2, 0)
+        
+class CommentScoreCounterTests(VoteTestBase):
+    """
+    The denormalized score counters on Comment follow the votes made on it
+    """
+    def assertCounters(self, score, upvote_count, downvote_count):
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.score, score)
+        self.assertEqual(self.comment.upvotes, score)
+        self.assertEqual(self.comment.upvote_count, upvote_count)
+        self.assertEqual(self.comment.downvote_count, downvote_count)
+        
+    def test_vote_toggles(self):
+        """
+        Upvotes, downvotes and toggles back to no vote through requests
+        all keep the counters in sync
+        """
+        self.client.post(self.vote_url, self.comment_vote_data(1))
+        self.assertCounters(1, 1, 0)
+        self.client.post(self.vote_url, self.comment_vote_data(1))
+        self.assertCounters(0, 0, 0)
+        self.client.post(self.vote_url, self.comment_vote_data(-1))
+        self.assertCounters(-1, 0, 1)
+        self.client.post(self.vote_url, self.comment_vote_data(1))
+        self.assertCounters(1, 1, 0)
+        self.client.post(self.vote_url, self.comment_vote_data(0))
+        self.assertCounters(0, 0, 0)
+        
+    def test_verify_and_rebuild_comment_scores(self):
+        """
+        --verify reports comments whose counters don't match the votes
+        without changing them, a rebuild then fixes them
+        """
+        CommentVote.objects.create(
+            comment=self.comment,
+            user=self.voter,
+            vote_type=-1
+        )
+        out = StringIO()
+        call_command('rebuild_comment_scores', verify=True, stdout=out)
+        self.assertIn("0 comments with counters", out.getvalue())
         
+        Comment.objects.filter(pk=self.comment.pk).update(score=5)
+        out = StringIO()
+        call_command('rebuild_comment_scores', verify=True, stdout=out)
+        self.assertIn("1 comments with counters", out.getvalue())
+        self.assertIn("pk: {}".format(self.comment.pk), out.getvalue())
+        self.assertCounters(5, 0, 1)
         
+        out = StringIO()
+        call_command('rebuild_comment_scores', stdout=out)
+        self.assertIn("Rebuilt the vote counters of 1 comments", out.getvalue())
+        self.assertCounters(-1, 0, 1)
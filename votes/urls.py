@@ -5,6 +5,8 @@ from . import views
 
 urlpatterns = [
     path('', views.CreateVoteView.as_view(), name='vote'),
+    path('bulk/', views.BulkVoteView.as_view(), name='vote-bulk'),
+    path('state/', views.VoteStateView.as_view(), name='vote-state'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,44 +1,83 @@
-from rest_framework import exceptions, status
+from collections import defaultdict
+
+from django.utils.translation import gettext as _
+from rest_framework import exceptions
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-
-from comments.models import Comment
-from .serializers import CommentVoteSerializer, PostVoteSerializer
+from .serializers import BulkVoteSerializer, VoteCastSerializer
 
 class CreateVoteView(CreateAPIView):
-    comment_serializer_class = CommentVoteSerializer
-    post_serializer_class = PostVoteSerializer
+    """
+    Vote on a comment or a post.
+    
+    data: item_fn, vote_type
+    """
+    serializer_class = VoteCastSerializer
     permission_classes = (IsAuthenticated,)
-            
-    def get_serializer(self, *args, **kwargs):
-        """
-        Depending on the full_name of the voted upon item
-        (i.e. whether it's a comment or a post), use the right
-        serializer
-        
-        Also update the request data
-        """
-        data = kwargs["data"].copy()
-        fn = data["item_fn"]
-        assert (fn and (fn[0:3] == "t1_" or fn[0:3] =='t2_')), (
-            "item_fn is required and must be a 'full name', "
-            "i.e. it must begin with either 't1_' or 't2_'"
-        )
-        if fn[0:3] == "t1_":
-            data["comment"] = fn[3:]
-            return self.comment_serializer_class(data=data)
-        elif fn[0:3] == "t2_":
-            data["post"] = fn[3:]
-            return self.post_serializer_class(data=data)
-
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+class BulkVoteView(CreateVoteView):
+    """
+    Vote on many comments and posts with one request.
+    
+    data: votes, a list of {item_fn, vote_type}, or just the list
+    """
+    serializer_class = BulkVoteSerializer
+    
+    def get_serializer(self, *args, **kwargs):
+        if isinstance(kwargs.get('data'), list):
+            kwargs['data'] = {'votes': kwargs['data']}
+        return super().get_serializer(*args, **kwargs)
+
+class VoteStateView(APIView):
+    """
+    The authenticated user's votes on a list of comments and posts given
+    by their full names, e.g. ?fn=t2_1,t1_5, as {full name: vote_type}.
+    Lets consumers overlay the user's votes on cached listings. Takes one
+    query per item type, unauthenticated requests get all zeros.
+    
+    query parameter: fn
+    """
+    max_fullnames = 500
+    
+    def get_fullnames(self):
+        fullnames = [
+            fn
+            for param in self.request.query_params.getlist('fn')
+            for fn in param.split(',') if fn
+        ]
+        if len(fullnames) > self.max_fullnames:
+            message = _("At most {} full names can be looked up.".format(
+                self.max_fullnames
+            ))
+            raise exceptions.ValidationError({'fn': [message]})
+        return fullnames
+    
+    def get(self, request, *args, **kwargs):
+        items = {}
+        for fn in self.get_fullnames():
+            try:
+                items[fn] = VoteCastSerializer.parse_item_fn(fn)
+            except (KeyError, ValueError):
+                message = _(
+                    "'{}' is not a full name, it must begin with either "
+                    "'t1_' or 't2_' followed by a pk".format(fn)
+                )
+                raise exceptions.ValidationError({'fn': [message]})
         
-    def post(self, request, *args, **kwargs):
-        try:
-            return super().post(request, *args, **kwargs)
-        except AssertionError as e:
-            return Response(e.args[0], status=status.HTTP_400_BAD_REQUEST)
+        item_pks = defaultdict(set)
+        for vote_model, pk in items.values():
+            item_pks[vote_model].add(pk)
+        vote_states = {
+            vote_model: vote_model.objects.vote_states(request.user, pks)
+            for vote_model, pks in item_pks.items()
+        }
+        return Response({
+            fn: vote_states[vote_model].get(pk, vote_model.NO_VOTE)
+            for fn, (vote_model, pk) in items.items()
+        })